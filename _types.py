@@ -1,5 +1,7 @@
 import re
-from dataclasses import asdict, dataclass, field
+import typing as t
+import unicodedata
+from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
 
@@ -20,7 +22,13 @@ class AttackType(str, Enum):
     Other = "Other"
 
 
-@dataclass
+# Fields that map onto Notion properties and are worth tracking
+TRACKED_FIELDS = frozenset(
+    ["title", "url", "focus", "attack_type", "summary", "authors", "published", "explored"]
+)
+
+
+@dataclass(slots=True)
 class Paper:
     # Note: These need to reflect in the Notion DB and
     # notion_utils functions.
@@ -41,15 +49,45 @@ class Paper:
 
     track_changes: bool = False
 
-    def __post_init__(self):
-        self._original_state = asdict(self)
+    # Original values of tracked fields that currently differ, filled in
+    # by __setattr__. Assign fields rather than mutating them in place
+    # (e.g. `authors`) or the change won't be seen.
+
+    _original: dict[str, t.Any] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def __setattr__(self, name: str, value: t.Any) -> None:
+        # track_changes is assigned after the tracked fields in __init__,
+        # so construction itself is never recorded.
+        if name in TRACKED_FIELDS and getattr(self, "track_changes", False):
+            if name in self._original:
+                if self._original[name] == value:
+                    del self._original[name]
+            else:
+                current = getattr(self, name)
+                if current != value:
+                    self._original[name] = current
+        object.__setattr__(self, name, value)
 
-    def has_changed(self):
+    def has_changed(self) -> bool:
         if self.track_changes:
-            return self._original_state != asdict(self)
+            return bool(self._original)
         else:
             return True
 
+    def changed_fields(self) -> set[str]:
+        if self.track_changes:
+            return set(self._original)
+        else:
+            return set(TRACKED_FIELDS)
+
+    def original_value(self, name: str) -> t.Any:
+        return self._original.get(name, getattr(self, name))
+
+    def mark_saved(self) -> None:
+        # Whatever we hold now is what Notion holds, so track from here
+        self._original.clear()
+        self.track_changes = True
+
     def has_arxiv_props(self) -> bool:
         return all(
             [
@@ -66,3 +104,59 @@ class Paper:
             return None
         match = re.search(r"\d{4}\.\d{5}", self.url)
         return match.group(0) if match else None
+
+
+def normalize_arxiv_id(arxiv_id: str) -> str:
+    arxiv_id = arxiv_id.strip().lower().removeprefix("arxiv:")
+    return re.sub(r"v\d+$", "", arxiv_id)
+
+
+def normalize_doi(doi: str) -> str:
+    return re.sub(r"^(https?://(dx\.)?doi\.org/|doi:)", "", doi.strip().lower())
+
+
+def title_fingerprint(title: str) -> str:
+    # Case, accents, whitespace and punctuation all vary between sources
+    title = unicodedata.normalize("NFKD", title).casefold()
+    return "".join(c for c in title if c.isalnum())
+
+
+class PaperIndex:
+    """
+    Constant-time membership over every identifier we know a paper by.
+
+    Sources disagree on which identifiers they carry (Notion rows may only
+    have a title, Semantic Scholar gives DOIs, arXiv gives versioned ids),
+    so a paper is considered known if any one of them matches.
+    """
+
+    def __init__(self, papers: list[Paper] | None = None) -> None:
+        self._arxiv_ids: set[str] = set()
+        self._dois: set[str] = set()
+        self._titles: set[str] = set()
+        for paper in papers or []:
+            self.add(paper)
+
+    def add(self, paper: Paper | None = None, *, arxiv_id: str | None = None, doi: str | None = None, title: str | None = None) -> None:
+        if paper:
+            arxiv_id = arxiv_id or paper.arxiv_id
+            title = title or paper.title
+
+        if arxiv_id:
+            self._arxiv_ids.add(normalize_arxiv_id(arxiv_id))
+        if doi:
+            self._dois.add(normalize_doi(doi))
+        if title and (fingerprint := title_fingerprint(title)):
+            self._titles.add(fingerprint)
+
+    def match(self, *, arxiv_id: str | None = None, doi: str | None = None, title: str | None = None) -> bool:
+        if arxiv_id and normalize_arxiv_id(arxiv_id) in self._arxiv_ids:
+            return True
+        if doi and normalize_doi(doi) in self._dois:
+            return True
+        if title and title_fingerprint(title) in self._titles:
+            return True
+        return False
+
+    def __contains__(self, paper: Paper) -> bool:
+        return self.match(arxiv_id=paper.arxiv_id, title=paper.title)
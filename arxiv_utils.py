@@ -1,8 +1,66 @@
-import arxiv  # type: ignore
+from __future__ import annotations
 
-from _types import Paper
+import json
+import os
+import threading
+import typing as t
+from datetime import datetime, timedelta
 
-client = arxiv.Client()
+from _types import Paper, normalize_arxiv_id, title_fingerprint
+from cache_utils import MISS, ResponseCache
+from http_utils import get_http_session
+from lazy_utils import lazy_import
+from metrics_utils import METRICS
+
+if t.TYPE_CHECKING:
+    import arxiv  # type: ignore
+
+    from mirror_utils import ArxivMirror
+else:
+    arxiv = lazy_import("arxiv")
+
+ARXIV_API_URL = os.environ.get("ARXIV_API_URL", "https://export.arxiv.org/api/query")
+
+# arXiv accepts a few hundred ids per id_list query, so bulk lookups
+# get their own client with a matching page size.
+ARXIV_ID_LIST_CHUNK = 200
+
+# Streaming searches page in small chunks so they can stop early
+ARXIV_SEARCH_PAGE_SIZE = 50
+ARXIV_WATERMARK_PATH = ".paperstack/arxiv_watermark.json"
+
+# Papers from other sources can be newer than anything the search has
+# returned, so the published-date watermark gets some slack.
+ARXIV_WATERMARK_LOOKBACK = timedelta(days=3)
+
+# Clients are built on first use, so runs that never reach arXiv don't
+# import it. Searches page from worker threads, hence the lock.
+_clients: tuple[arxiv.Client, arxiv.Client] | None = None
+_clients_lock = threading.Lock()
+
+
+def _record_response(response, *args, **kwargs) -> None:
+    METRICS.record("arxiv", calls=1, bytes=len(response.content), errors=int(not response.ok))
+
+
+def get_arxiv_clients() -> tuple[arxiv.Client, arxiv.Client]:
+    # (search client, id_list client)
+    global _clients
+    with _clients_lock:
+        if _clients is None:
+            client = arxiv.Client(page_size=ARXIV_SEARCH_PAGE_SIZE)
+            id_list_client = arxiv.Client(page_size=ARXIV_ID_LIST_CHUNK)
+
+            # Both clients share one session, on the shared connection pool
+            session = get_http_session("arxiv", ARXIV_API_URL)
+            session.hooks["response"].append(_record_response)
+            client._session = id_list_client._session = session
+
+            # Point both clients somewhere else (a mirror or local stub)
+            if "ARXIV_API_URL" in os.environ:
+                client.query_url_format = id_list_client.query_url_format = f"{ARXIV_API_URL}?{{}}"
+            _clients = (client, id_list_client)
+    return _clients
 
 
 def arxiv_result_to_paper(result: arxiv.Result) -> Paper:
@@ -15,17 +73,28 @@ def arxiv_result_to_paper(result: arxiv.Result) -> Paper:
     )
 
 
+def _result_dict_to_paper(result: dict) -> Paper:
+    return Paper(
+        title=result["title"],
+        url=result["entry_id"],
+        abstract=result["summary"],
+        authors=result["authors"],
+        published=datetime.fromisoformat(result["published"]) if result["published"] else None,
+    )
+
+
 def search_arxiv(
     query: str,
     max_results=10,
-    sort_by: arxiv.SortCriterion = arxiv.SortCriterion.SubmittedDate,
+    sort_by: arxiv.SortCriterion | None = None,
 ) -> list[arxiv.Result]:
+    client, _ = get_arxiv_clients()
     return list(
         client.results(
             arxiv.Search(
                 query,
                 max_results=max_results,
-                sort_by=sort_by,
+                sort_by=sort_by or arxiv.SortCriterion.SubmittedDate,
             )
         )
     )
@@ -34,47 +103,190 @@ def search_arxiv(
 def search_arxiv_as_paper(
     query: str,
     max_results=10,
-    sort_by: arxiv.SortCriterion = arxiv.SortCriterion.SubmittedDate,
+    sort_by: arxiv.SortCriterion | None = None,
 ) -> list[Paper]:
-    return [
-        arxiv_result_to_paper(result)
-        for result in search_arxiv(query, max_results, sort_by)
-    ]
+    return list(iter_arxiv_as_paper(query, max_results, sort_by))
+
+
+def iter_arxiv_as_paper(
+    query: str,
+    max_results=10,
+    sort_by: arxiv.SortCriterion | None = None,
+    *,
+    since: datetime | None = None,
+    last_seen_id: str | None = None,
+    mirror: ArxivMirror | None = None,
+) -> t.Iterator[Paper]:
+    """
+    Yield papers as result pages arrive. When sorted by submission date,
+    stop paging once we're past `since` (less the lookback) or reach
+    `last_seen_id` - everything after that is already known.
+
+    With a `mirror`, the search runs against it instead of the API.
+    """
+
+    sort_by = sort_by or arxiv.SortCriterion.SubmittedDate
+    by_date = sort_by == arxiv.SortCriterion.SubmittedDate
+    cutoff = since - ARXIV_WATERMARK_LOOKBACK if since and by_date else None
+    last_seen_id = normalize_arxiv_id(last_seen_id) if last_seen_id and by_date else None
+
+    results: t.Iterable[tuple[str, Paper]]
+    if mirror:
+        results = (
+            (arxiv_id, _result_dict_to_paper(result))
+            for arxiv_id, result in mirror.search(query, max_results, by_date=by_date)
+        )
+    else:
+        client, _ = get_arxiv_clients()
+        results = (
+            (result.get_short_id(), arxiv_result_to_paper(result))
+            for result in client.results(arxiv.Search(query, max_results=max_results, sort_by=sort_by))
+        )
+
+    for arxiv_id, paper in results:
+        if last_seen_id and normalize_arxiv_id(arxiv_id) == last_seen_id:
+            return
+        if cutoff and paper.published and paper.published < cutoff:
+            return
+        yield paper
+
+
+def load_arxiv_watermark(query: str, path: str = ARXIV_WATERMARK_PATH) -> str | None:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f).get(query)
+
+
+def save_arxiv_watermark(query: str, arxiv_id: str, path: str = ARXIV_WATERMARK_PATH) -> None:
+    watermarks: dict[str, str] = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            watermarks = json.load(f)
+
+    watermarks[query] = arxiv_id
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(watermarks, f, indent=2)
 
 
 def search_arxiv_by_id(id: str) -> arxiv.Result | None:
+    client, _ = get_arxiv_clients()
     for result in client.results(arxiv.Search(id_list=[id])):
         return result
     return None
 
 
-def fill_papers_with_arxiv(papers: list[Paper]) -> list[Paper]:
-    for paper in papers:
-        if paper.has_arxiv_props():
+def search_arxiv_by_ids(ids: list[str]) -> tuple[dict[str, arxiv.Result], int, set[str]]:
+    # Returns results by normalized id, the number of requests made and
+    # the ids whose lookup failed (as opposed to not existing)
+    results: dict[str, arxiv.Result] = {}
+    failed: set[str] = set()
+    requests = 0
+    _, id_list_client = get_arxiv_clients()
+    for i in range(0, len(ids), ARXIV_ID_LIST_CHUNK):
+        chunk = ids[i : i + ARXIV_ID_LIST_CHUNK]
+        requests += 1
+        try:
+            for result in id_list_client.results(arxiv.Search(id_list=chunk, max_results=len(chunk))):
+                results[normalize_arxiv_id(result.get_short_id())] = result
+        except arxiv.ArxivError as e:
+            # Leave the chunk to the per-title fallback
+            print(f"[!] arXiv id_list lookup failed for {len(chunk)} ids: {e}")
+            failed.update(chunk)
+
+    return results, requests, failed
+
+
+def _result_to_dict(result: arxiv.Result) -> dict:
+    # Just what _fill_paper needs, in a form the response cache can hold
+    return {
+        "title": result.title,
+        "entry_id": result.entry_id,
+        "summary": result.summary,
+        "authors": [a.name for a in result.authors],
+        "published": result.published.isoformat(),
+    }
+
+
+def _fill_paper(paper: Paper, result: dict) -> None:
+    if paper.title and paper.title != result["title"]:
+        print(f'[!] Title mismatch: "{paper.title}" vs "{result["title"]}"')
+
+    paper.title = result["title"]
+    paper.url = result["entry_id"]
+    paper.abstract = result["summary"]
+    paper.authors = result["authors"]
+    paper.published = datetime.fromisoformat(result["published"])
+
+
+def _lookup_ids(
+    ids: list[str], cache: ResponseCache | None, mirror: ArxivMirror | None
+) -> tuple[dict[str, dict | None], int]:
+    found: dict[str, dict | None] = {}
+    for id in ids:
+        # The mirror only covers its categories, so a miss there isn't final
+        if mirror and (mirrored := mirror.get(id)):
+            found[id] = mirrored
+        elif cache and (cached := cache.get("arxiv_id", id)) is not MISS:
+            found[id] = cached
+
+    by_id, requests, failed = search_arxiv_by_ids([id for id in ids if id not in found])
+    for id in ids:
+        if id in found or id in failed:
             continue
+        result = by_id.get(normalize_arxiv_id(id))
+        found[id] = _result_to_dict(result) if result else None
+        if cache:
+            cache.set("arxiv_id", id, found[id])
+
+    return found, requests
+
+
+def _lookup_title(title: str, cache: ResponseCache | None, mirror: ArxivMirror | None) -> dict | None:
+    if mirror and (mirrored := mirror.get_by_title(title)):
+        return mirrored
+
+    key = title_fingerprint(title)
+    if cache and (cached := cache.get("arxiv_title", key)) is not MISS:
+        return cached
 
-        result: arxiv.Result | None = None
+    # Dashes seem to fuck up the API calls - Finicky in general, links work much better
+    query = f"ti:{title.replace('-', ' ')}"
+    searched = search_arxiv(query, max_results=1, sort_by=arxiv.SortCriterion.Relevance)
+    result = _result_to_dict(searched[0]) if searched else None
 
-        if paper.arxiv_id:
-            result = search_arxiv_by_id(paper.arxiv_id)
+    if cache:
+        cache.set("arxiv_title", key, result)
+    return result
 
-        if not result and paper.title:
-            # Dashes seem to fuck up the API calls - Finicky in general, links work much better
-            query = f"ti:{paper.title.replace('-', ' ')}"
-            searched = search_arxiv(query, max_results=1, sort_by=arxiv.SortCriterion.Relevance)
-            result = searched[0] if searched else None
 
+def fill_papers_with_arxiv(
+    papers: list[Paper], *, cache: ResponseCache | None = None, mirror: ArxivMirror | None = None
+) -> list[Paper]:
+    incomplete = [p for p in papers if not p.has_arxiv_props()]
+
+    ids = list(dict.fromkeys(p.arxiv_id for p in incomplete if p.arxiv_id))
+    by_id, requests = _lookup_ids(ids, cache, mirror)
+
+    leftovers: list[Paper] = []
+    for paper in incomplete:
+        result = by_id.get(paper.arxiv_id) if paper.arxiv_id else None
+        if result:
+            _fill_paper(paper, result)
+        else:
+            leftovers.append(paper)
+
+    if ids:
+        resolved = sum(1 for result in by_id.values() if result)
+        print(f"    |- Resolved {resolved}/{len(ids)} ids in {requests} requests ({len(ids) - requests} saved)")
+
+    for paper in leftovers:
+        result = _lookup_title(paper.title, cache, mirror) if paper.title else None
         if not result:
             print(f'[!] Could not find arxiv result for "{paper.title}" [{paper.url}]')
             continue
 
-        if paper.title and paper.title != result.title:
-            print(f'[!] Title mismatch: "{paper.title}" vs "{result.title}"')
-
-        paper.title = result.title
-        paper.url = result.entry_id
-        paper.abstract = result.summary
-        paper.authors = [a.name for a in result.authors]
-        paper.published = result.published
+        _fill_paper(paper, result)
 
     return papers
@@ -0,0 +1,681 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import typing as t
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+from _types import AttackType, Focus
+
+PAPERSTACK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "paperstack.py")
+
+# Startup check: `import paperstack` should stay cheap, so heavy
+# dependencies only load once a run actually needs them
+IMPORT_TIME_MODULE = "paperstack"
+IMPORT_TIME_RUNS = 5
+IMPORT_TIME_BUDGET_MS = 250
+
+NOTION_PAGE_SIZE = 100
+ARXIV_SEARCH_TOTAL = 500
+OAI_PAGE_SIZE = 1000
+S2_RECOMMENDATIONS = 20
+S2_NEIGHBOURS = 10
+
+# Synthetic rows are complete unless they land in one of these buckets
+INCOMPLETE_RATE = 0.02  # missing summary/labels - needs enrichment
+PARTIAL_RATE = 0.01  # only a URL - needs an arXiv fill
+UNEXPLORED_RATE = 0.02  # needs Semantic Scholar recommendations
+
+# Columns a team adds by hand, which paperstack never reads
+NOTION_CUSTOM_COLUMNS = ("Notes", "Reviewers", "Related", "Reading Group")
+
+# Notion filters properties by id; the title column's id is always "title"
+NOTION_PROPERTY_IDS = {
+    name: "title" if name == "Title" else f"p{i:02d}"
+    for i, name in enumerate(
+        ["Title", "URL", "Summary", "Authors", "Published", "Focus", "Attack Type", "Explored", *NOTION_CUSTOM_COLUMNS]
+    )
+}
+
+
+@dataclass
+class StubConfig:
+    latency: float = 0.05
+    throttle_rate: float = 0.0
+    timeout_rate: float = 0.0
+    timeout: float = 2.5
+    seed: int = 0
+
+
+@dataclass
+class StubStats:
+    requests: dict[str, int] = field(default_factory=dict)
+    throttled: dict[str, int] = field(default_factory=dict)
+    timeouts: dict[str, int] = field(default_factory=dict)
+
+
+def _arxiv_id(i: int, month: str = "2401") -> str:
+    return f"{month}.{i:05d}"
+
+
+def _notion_page(i: int, rng: random.Random) -> dict:
+    published = datetime(2023, 1, 1, tzinfo=timezone.utc) + timedelta(days=rng.randint(0, 700))
+    url = f"https://arxiv.org/abs/{_arxiv_id(i)}"
+    bucket = rng.random()
+
+    properties: dict[str, t.Any] = {
+        "Title": {"title": [{"text": {"content": f"Synthetic paper {i}"}}]},
+        "URL": {"url": url},
+        "Summary": {"rich_text": [{"text": {"content": f"Summary of synthetic paper {i}."}}]},
+        "Authors": {"multi_select": [{"name": f"Author {i % 97}"}, {"name": f"Author {i % 89}"}]},
+        "Published": {"date": {"start": published.isoformat()}},
+        "Focus": {"select": {"name": rng.choice(list(Focus)).value}},
+        "Attack Type": {"select": {"name": rng.choice(list(AttackType)).value}},
+        "Explored": {"checkbox": True},
+        "Notes": {"rich_text": [{"text": {"content": f"Discussion notes for paper {i}. " * 20}}]},
+        "Reviewers": {"people": [{"object": "user", "id": f"{j:08x}-0000-4000-8000-000000000000"} for j in range(3)]},
+        "Related": {"relation": [{"id": f"{(i + j) % 997:08x}-0000-4000-8000-000000000000"} for j in range(5)]},
+        "Reading Group": {"select": {"name": f"Week {i % 52}"}},
+    }
+
+    if bucket < PARTIAL_RATE:
+        properties["Title"]["title"] = []
+        properties["Authors"]["multi_select"] = []
+        properties["Published"]["date"] = None
+    elif bucket < PARTIAL_RATE + INCOMPLETE_RATE:
+        properties["Summary"]["rich_text"] = []
+        properties["Focus"]["select"] = None
+        properties["Attack Type"]["select"] = None
+    elif bucket < PARTIAL_RATE + INCOMPLETE_RATE + UNEXPLORED_RATE:
+        properties["Published"]["date"] = {"start": "2025-01-15T00:00:00+00:00"}
+        properties["Explored"]["checkbox"] = False
+
+    return {
+        "object": "page",
+        "id": f"{i:08x}-0000-4000-8000-000000000000",
+        "last_edited_time": "2025-01-01T00:00:00.000Z",
+        "archived": False,
+        "properties": properties,
+    }
+
+
+def _arxiv_entry(arxiv_id: str, published: datetime) -> str:
+    return f"""\
+<entry>
+  <id>http://arxiv.org/abs/{arxiv_id}v1</id>
+  <updated>{published.strftime("%Y-%m-%dT%H:%M:%SZ")}</updated>
+  <published>{published.strftime("%Y-%m-%dT%H:%M:%SZ")}</published>
+  <title>{escape(f"Synthetic paper {arxiv_id}")}</title>
+  <summary>{escape(f"We study attacks on language models in synthetic paper {arxiv_id}.")}</summary>
+  <author><name>Author A</name></author>
+  <author><name>Author B</name></author>
+  <link href="http://arxiv.org/abs/{arxiv_id}v1" rel="alternate" type="text/html"/>
+  <arxiv:primary_category term="cs.CR" scheme="http://arxiv.org/schemas/atom"/>
+  <category term="cs.CR" scheme="http://arxiv.org/schemas/atom"/>
+</entry>"""
+
+
+def _arxiv_feed(entries: list[str], total: int, start: int) -> bytes:
+    return f"""\
+<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/" xmlns:arxiv="http://arxiv.org/schemas/atom">
+  <title>arXiv Query</title>
+  <id>http://arxiv.org/api/stub</id>
+  <updated>{datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")}</updated>
+  <opensearch:totalResults>{total}</opensearch:totalResults>
+  <opensearch:startIndex>{start}</opensearch:startIndex>
+  <opensearch:itemsPerPage>{len(entries)}</opensearch:itemsPerPage>
+{"".join(entries)}
+</feed>""".encode()
+
+
+def _oai_record(arxiv_id: str, published: datetime) -> str:
+    return f"""\
+<record>
+  <header>
+    <identifier>oai:arXiv.org:{arxiv_id}</identifier>
+    <datestamp>{published.strftime("%Y-%m-%d")}</datestamp>
+    <setSpec>cs:cs:CR</setSpec>
+  </header>
+  <metadata>
+    <arXiv xmlns="http://arxiv.org/OAI/arXiv/">
+      <id>{arxiv_id}</id>
+      <created>{published.strftime("%Y-%m-%d")}</created>
+      <authors><author><keyname>A</keyname><forenames>Author</forenames></author><author><keyname>B</keyname><forenames>Author</forenames></author></authors>
+      <title>{escape(f"Synthetic paper {arxiv_id}")}</title>
+      <categories>cs.CR cs.LG</categories>
+      <abstract>{escape(f"We study adversarial attacks on language models in synthetic paper {arxiv_id}.")}</abstract>
+    </arXiv>
+  </metadata>
+</record>"""
+
+
+def _oai_response(body: str) -> bytes:
+    return f"""\
+<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+  <responseDate>{datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")}</responseDate>
+  {body}
+</OAI-PMH>""".encode()
+
+
+def _s2_paper(arxiv_id: str) -> dict:
+    return {
+        "paperId": f"s2-{arxiv_id}",
+        "externalIds": {"ArXiv": arxiv_id},
+        "title": f"Synthetic paper {arxiv_id}",
+        "abstract": "We study attacks on language models.",
+        "year": 2025,
+        "citationCount": len(arxiv_id) % 50,
+    }
+
+
+def _chat_completion(model: str) -> dict:
+    content = json.dumps(
+        {
+            "summary": "A synthetic summary produced by the benchmark stub.",
+            "focus": Focus.Offensive.value,
+            "attack_type": AttackType.PromptInjection.value,
+        }
+    )
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 800, "completion_tokens": 60, "total_tokens": 860},
+    }
+
+
+def _openai_file(file_id: str, purpose: str, size: int) -> dict:
+    return {
+        "id": file_id,
+        "object": "file",
+        "bytes": size,
+        "created_at": int(time.time()),
+        "filename": "input.jsonl",
+        "purpose": purpose,
+        "status": "processed",
+    }
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    One local server standing in for every external service, routed by
+    path prefix: /notion, /openai, /arxiv, /oai and /s2. OpenAI batches
+    complete as soon as they're created.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, size: int, config: StubConfig) -> None:
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.config = config
+        self.stats = StubStats()
+        self.rng = random.Random(config.seed)
+        self.pages = [_notion_page(i, random.Random(config.seed + i)) for i in range(size)]
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self.files: dict[str, bytes] = {}
+        self.batches: dict[str, dict] = {}
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, kind: str, service: str) -> None:
+        with self.lock:
+            counts = getattr(self.stats, kind)
+            counts[service] = counts.get(service, 0) + 1
+
+    def handle_error(self, request: t.Any, client_address: t.Any) -> None:
+        # Clients hang up on injected timeouts - that's expected
+        pass
+
+    def fault(self) -> str | None:
+        with self.lock:
+            roll = self.rng.random()
+        if roll < self.config.throttle_rate:
+            return "throttle"
+        if roll < self.config.throttle_rate + self.config.timeout_rate:
+            return "timeout"
+        return None
+
+    def new_arxiv_ids(self, count: int, month: str) -> list[str]:
+        with self.lock:
+            start, self.next_id = self.next_id, self.next_id + count
+        return [_arxiv_id(i, month) for i in range(start, start + count)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server: StubServer
+
+    # Keep-alive, like the real APIs, so connection reuse shows up
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: t.Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        self._handle()
+
+    def do_POST(self) -> None:
+        self._handle()
+
+    def do_PATCH(self) -> None:
+        self._handle()
+
+    def _send(self, status: int, body: bytes | dict | list, content_type: str = "application/json", headers: dict | None = None) -> None:
+        payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self) -> None:
+        url = urlparse(self.path)
+        service = url.path.strip("/").split("/")[0]
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        # File uploads are multipart, everything else is JSON
+        body = json.loads(raw) if raw and "json" in (self.headers.get("Content-Type") or "") else raw or None
+
+        self.server.count("requests", service)
+        time.sleep(self.server.config.latency)
+
+        fault = self.server.fault()
+        if fault == "timeout" and service == "notion":
+            # Outlive the client timeout so it raises RequestTimeoutError
+            self.server.count("timeouts", service)
+            time.sleep(self.server.config.timeout)
+            return self._send(504, {"object": "error", "status": 504, "code": "service_unavailable", "message": "stub"})
+        if fault == "throttle":
+            self.server.count("throttled", service)
+            error = {"object": "error", "status": 429, "code": "rate_limited", "message": "stub"}
+            return self._send(429, error if service == "notion" else {"error": error}, headers={"Retry-After": "1"})
+
+        handler = getattr(self, f"_{service}", None)
+        if handler is None:
+            return self._send(404, {"error": f"unknown service {service}"})
+        handler(url, body)
+
+    def _notion(self, url, body) -> None:
+        if self.command == "GET" and "/databases/" in url.path:
+            properties = {name: {"id": property_id} for name, property_id in NOTION_PROPERTY_IDS.items()}
+            return self._send(200, {"object": "database", "id": url.path.split("/")[-1], "properties": properties})
+
+        if url.path.endswith("/query"):
+            start = int((body or {}).get("start_cursor") or 0)
+            size = (body or {}).get("page_size") or NOTION_PAGE_SIZE
+            end = start + size
+            results = self.server.pages[start:end]
+            if wanted := parse_qs(url.query).get("filter_properties"):
+                results = [
+                    {
+                        **page,
+                        "properties": {
+                            name: value
+                            for name, value in page["properties"].items()
+                            if NOTION_PROPERTY_IDS[name] in wanted
+                        },
+                    }
+                    for page in results
+                ]
+            return self._send(
+                200,
+                {
+                    "object": "list",
+                    "results": results,
+                    "has_more": end < len(self.server.pages),
+                    "next_cursor": str(end) if end < len(self.server.pages) else None,
+                },
+            )
+
+        page_id = url.path.rstrip("/").split("/")[-1]
+        page = {
+            "object": "page",
+            "id": page_id,
+            "last_edited_time": datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+            "archived": False,
+            "properties": (body or {}).get("properties", {}),
+        }
+        if page_id == "pages":
+            # Kept, so a later run against the same server reads it back
+            with self.server.lock:
+                page["id"] = f"{len(self.server.pages) + self.server.next_id:08x}-new"
+                self.server.pages.append(page)
+        return self._send(200, page)
+
+    def _openai(self, url, body) -> None:
+        if url.path.endswith("/embeddings"):
+            return self._embeddings(body or {})
+        if "/files" in url.path:
+            return self._files(url, body)
+        if "/batches" in url.path:
+            return self._batches(url, body)
+        self._send(200, _chat_completion((body or {}).get("model", "stub")))
+
+    def _files(self, url, body) -> None:
+        file_id = url.path.rstrip("/").split("/")[-1]
+        if url.path.endswith("/content"):
+            file_id = url.path.split("/")[-2]
+            return self._send(200, self.server.files[file_id], "application/jsonl")
+
+        # Only the JSONL lines matter, not the rest of the multipart body
+        lines = [line for line in (body or b"").split(b"\r\n") if line.startswith(b"{")]
+        with self.server.lock:
+            file_id = f"file-{len(self.server.files)}"
+            self.server.files[file_id] = b"\n".join(lines) + b"\n"
+        self._send(200, _openai_file(file_id, "batch", len(self.server.files[file_id])))
+
+    def _batches(self, url, body) -> None:
+        if self.command == "GET":
+            return self._send(200, self.server.batches[url.path.rstrip("/").split("/")[-1]])
+
+        requests = [json.loads(line) for line in self.server.files[body["input_file_id"]].splitlines() if line]
+        output = b"\n".join(
+            json.dumps(
+                {
+                    "id": f"batch_req_{i}",
+                    "custom_id": request["custom_id"],
+                    "response": {"status_code": 200, "body": _chat_completion(request["body"].get("model", "stub"))},
+                    "error": None,
+                }
+            ).encode()
+            for i, request in enumerate(requests)
+        )
+        with self.server.lock:
+            batch_id = f"batch_{len(self.server.batches)}"
+            output_file_id = f"file-{len(self.server.files)}"
+            self.server.files[output_file_id] = output + b"\n"
+            self.server.batches[batch_id] = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": body["endpoint"],
+                "input_file_id": body["input_file_id"],
+                "completion_window": body["completion_window"],
+                "status": "completed",
+                "output_file_id": output_file_id,
+                "created_at": int(time.time()),
+                "request_counts": {"total": len(requests), "completed": len(requests), "failed": 0},
+            }
+        self._send(200, self.server.batches[batch_id])
+
+    def _embeddings(self, body: dict) -> None:
+        # Deterministic per text, with a shared component so neighbours exist
+        data = []
+        for i, text in enumerate(body.get("input") or []):
+            rng = random.Random(text)
+            data.append({"object": "embedding", "index": i, "embedding": [1.0] + [rng.random() for _ in range(63)]})
+        self._send(
+            200,
+            {
+                "object": "list",
+                "data": data,
+                "model": body.get("model", "stub"),
+                "usage": {"prompt_tokens": 200 * len(data), "total_tokens": 200 * len(data)},
+            },
+        )
+
+    def _arxiv(self, url, body) -> None:
+        query = parse_qs(url.query)
+        start = int(query.get("start", ["0"])[0])
+        max_results = int(query.get("max_results", ["10"])[0])
+        id_list = [i for i in query.get("id_list", [""])[0].split(",") if i]
+        now = datetime.now(timezone.utc)
+
+        if id_list:
+            entries = [_arxiv_entry(arxiv_id, now - timedelta(days=30)) for arxiv_id in id_list[start : start + max_results]]
+            return self._send(200, _arxiv_feed(entries, len(id_list), start), "application/atom+xml")
+
+        count = max(0, min(max_results, ARXIV_SEARCH_TOTAL - start))
+        entries = [
+            _arxiv_entry(arxiv_id, now - timedelta(hours=start + n))
+            for n, arxiv_id in enumerate(self.server.new_arxiv_ids(count, "2502"))
+        ]
+        self._send(200, _arxiv_feed(entries, ARXIV_SEARCH_TOTAL, start), "application/atom+xml")
+
+    def _oai(self, url, body) -> None:
+        # Every Notion paper plus a batch of recent ones, all in one set
+        # (the others are empty) - a delta harvest only sees the recent ones
+        query = parse_qs(url.query)
+        if token := query.get("resumptionToken", [""])[0]:
+            since, start = token.split(":")
+            start_index = int(start)
+        else:
+            since, start_index = query.get("from", [""])[0], 0
+
+        now = datetime.now(timezone.utc)
+        records = [(_arxiv_id(i), now - timedelta(days=400)) for i in range(len(self.server.pages))]
+        records += [(_arxiv_id(i, "2503"), now - timedelta(hours=i)) for i in range(ARXIV_SEARCH_TOTAL)]
+        if since:
+            records = [(arxiv_id, published) for arxiv_id, published in records if published.strftime("%Y-%m-%d") >= since]
+        if query.get("set", ["cs:cs:CR"])[0] != "cs:cs:CR" or not records:
+            return self._send(200, _oai_response('<error code="noRecordsMatch">stub</error>'), "text/xml")
+
+        end = start_index + OAI_PAGE_SIZE
+        page = "".join(_oai_record(arxiv_id, published) for arxiv_id, published in records[start_index:end])
+        resumption = (
+            f'<resumptionToken completeListSize="{len(records)}">{since}:{end}</resumptionToken>'
+            if end < len(records)
+            else f'<resumptionToken completeListSize="{len(records)}"/>'
+        )
+        self._send(200, _oai_response(f"<ListRecords>{page}{resumption}</ListRecords>"), "text/xml")
+
+    def _s2(self, url, body) -> None:
+        if "/recommendations/" in url.path:
+            ids = self.server.new_arxiv_ids(S2_RECOMMENDATIONS, "2503")
+            return self._send(200, {"recommendedPapers": [_s2_paper(arxiv_id) for arxiv_id in ids]})
+
+        if url.path.endswith(("/citations", "/references")):
+            edge = "citingPaper" if url.path.endswith("/citations") else "citedPaper"
+            ids = self.server.new_arxiv_ids(S2_NEIGHBOURS, "2503")
+            return self._send(200, {"offset": 0, "data": [{edge: _s2_paper(arxiv_id)} for arxiv_id in ids]})
+
+        self._send(
+            200,
+            [
+                _s2_paper(paper_id.removeprefix("s2-").removeprefix("arXiv:"))
+                for paper_id in (body or {}).get("ids", [])
+            ],
+        )
+
+
+@dataclass
+class BenchmarkResult:
+    size: int
+    exit_code: int
+    wall_s: float
+    peak_rss_mb: float
+    requests: dict[str, int]
+    throttled: dict[str, int]
+    timeouts: dict[str, int]
+
+
+def run_benchmark(size: int, config: StubConfig, extra_args: list[str]) -> BenchmarkResult:
+    server = StubServer(size, config)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    env = {
+        **os.environ,
+        "NOTION_TOKEN": "stub",
+        "NOTION_DATABASE_ID": "benchmark",
+        "OPENAI_API_TOKEN": "stub",
+        "NOTION_BASE_URL": f"{server.url}/notion",
+        "OPENAI_BASE_URL": f"{server.url}/openai/v1",
+        "ARXIV_API_URL": f"{server.url}/arxiv/api/query",
+        "ARXIV_OAI_URL": f"{server.url}/oai",
+        "S2_API_URL": f"{server.url}/s2",
+    }
+    args = [
+        sys.executable,
+        PAPERSTACK,
+        "--search-arxiv",
+        "--search-semantic-scholar",
+        "--no-llm-cache",
+        "--no-arxiv-watermark",
+        "--notion-timeout-ms",
+        str(int(config.timeout * 1000) - 500),
+        *extra_args,
+    ]
+
+    # The Batch API takes two runs: one submits, the next polls and applies
+    passes = 2 if "--openai-batch" in extra_args else 1
+
+    # Each run gets a scratch directory so no state carries over
+    wall, peak_rss, returncode = 0.0, 0, 0
+    with tempfile.TemporaryDirectory() as cwd:
+        with open(os.path.join(cwd, "stderr.log"), "w+") as stderr:
+            for _ in range(passes):
+                start = time.monotonic()
+                process = subprocess.Popen(args, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=stderr)
+                _, status, usage = os.wait4(process.pid, 0)
+                wall += time.monotonic() - start
+                peak_rss = max(peak_rss, usage.ru_maxrss)
+                returncode = os.waitstatus_to_exitcode(status)
+
+                if returncode != 0:
+                    stderr.seek(0)
+                    print(stderr.read()[-2000:])
+                    break
+
+    server.shutdown()
+    server.server_close()
+
+    return BenchmarkResult(
+        size=size,
+        exit_code=returncode,
+        wall_s=round(wall, 2),
+        # ru_maxrss is kilobytes on Linux
+        peak_rss_mb=round(peak_rss / 1024, 1),
+        requests=server.stats.requests,
+        throttled=server.stats.throttled,
+        timeouts=server.stats.timeouts,
+    )
+
+
+def measure_import_time(module: str = IMPORT_TIME_MODULE, runs: int = IMPORT_TIME_RUNS) -> tuple[float, list[tuple[float, str]]]:
+    """
+    Best of `runs` cold imports under -X importtime, as the module's
+    cumulative milliseconds and its direct imports, slowest first.
+    """
+
+    best: tuple[float, list[tuple[float, str]]] | None = None
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=os.path.dirname(PAPERSTACK),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        # Lines are "<self us> | <cumulative us> | <name>", indented two
+        # spaces per level and printed after their own imports
+        total, children, pending = 0.0, [], []
+        for line in result.stderr.splitlines():
+            fields = line.removeprefix("import time:").split("|")
+            if len(fields) != 3 or not fields[1].strip().isdigit():
+                continue
+            name = fields[2].rstrip()
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            cumulative = int(fields[1]) / 1000
+            if depth == 1:
+                pending.append((cumulative, name.strip()))
+            elif depth == 0:
+                if name.strip() == module:
+                    total, children = cumulative, pending
+                pending = []
+
+        if best is None or total < best[0]:
+            best = (total, sorted(children, reverse=True))
+
+    assert best is not None
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Run paperstack end to end against local service stubs and report throughput."
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--latency-ms", type=float, default=50, help="Added latency per stub response")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction of Notion requests that time out")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, help="Write results as JSON")
+    parser.add_argument("--baseline", type=str, help="Fail if wall time regresses against these results")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed wall time regression (fraction)")
+    parser.add_argument(
+        "--import-time",
+        action="store_true",
+        default=False,
+        help="Only measure `import paperstack` (-X importtime) and fail if it's over budget",
+    )
+    parser.add_argument("--import-budget-ms", type=float, default=IMPORT_TIME_BUDGET_MS)
+    parser.add_argument("extra", nargs=argparse.REMAINDER, help="Arguments passed through to paperstack.py after --")
+
+    args = parser.parse_args()
+    extra = [a for a in args.extra if a != "--"]
+    config = StubConfig(
+        latency=args.latency_ms / 1000,
+        throttle_rate=args.throttle_rate,
+        timeout_rate=args.timeout_rate,
+        seed=args.seed,
+    )
+
+    if args.import_time:
+        print(f"[+] Import time for {IMPORT_TIME_MODULE} (best of {IMPORT_TIME_RUNS})")
+        total, children = measure_import_time()
+        print(f" |- {total:.1f} ms (budget {args.import_budget_ms:.0f} ms)")
+        for cumulative, name in children[:5]:
+            print(f"    |- {name}: {cumulative:.1f} ms")
+        if total > args.import_budget_ms:
+            print(f"[!] Startup regressed: {total:.1f} ms is over the {args.import_budget_ms:.0f} ms budget")
+            return 1
+        return 0
+
+    print("[+] Paperstack benchmark")
+    results: list[BenchmarkResult] = []
+    for size in args.sizes:
+        print(f" |- {size} papers")
+        result = run_benchmark(size, config, extra)
+        results.append(result)
+        print(f"    |- exit {result.exit_code} in {result.wall_s:.1f}s, peak {result.peak_rss_mb:.0f} MB")
+        for service, count in sorted(result.requests.items()):
+            faults = result.throttled.get(service, 0) + result.timeouts.get(service, 0)
+            print(f"    |- {service}: {count} requests ({faults} faults injected)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump([asdict(r) for r in results], f, indent=2)
+
+    failed = any(r.exit_code != 0 for r in results)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {r["size"]: r for r in json.load(f)}
+        for result in results:
+            previous = baseline.get(result.size)
+            if previous and result.wall_s > previous["wall_s"] * (1 + args.tolerance):
+                print(f"[!] {result.size} papers regressed: {result.wall_s:.1f}s vs {previous['wall_s']:.1f}s")
+                failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+import typing as t
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class ModelPrice:
+    # USD per million tokens
+    input: float
+    cached_input: float
+    output: float
+
+
+OPENAI_PRICES: dict[str, ModelPrice] = {
+    "gpt-4o-mini": ModelPrice(0.15, 0.075, 0.60),
+    "gpt-4o": ModelPrice(2.50, 1.25, 10.00),
+    "gpt-4.1": ModelPrice(2.00, 0.50, 8.00),
+    "gpt-4.1-mini": ModelPrice(0.40, 0.10, 1.60),
+    "gpt-4.1-nano": ModelPrice(0.10, 0.025, 0.40),
+    "gpt-3.5-turbo": ModelPrice(0.50, 0.50, 1.50),
+    "text-embedding-3-small": ModelPrice(0.02, 0.02, 0.0),
+    "text-embedding-3-large": ModelPrice(0.13, 0.13, 0.0),
+}
+
+# Models we don't know the price of are charged as the priciest one we do,
+# so a ceiling in dollars errs on the side of stopping early
+FALLBACK_PRICE = max(OPENAI_PRICES.values(), key=lambda price: price.output)
+
+# The Batch API bills at half price
+BATCH_DISCOUNT = 0.5
+
+
+def model_price(model: str) -> ModelPrice:
+    # Dated snapshots (gpt-4o-mini-2024-07-18) cost the same as their alias
+    for name in sorted(OPENAI_PRICES, key=len, reverse=True):
+        if model == name or model.startswith(f"{name}-"):
+            return OPENAI_PRICES[name]
+    return FALLBACK_PRICE
+
+
+def usage_cost(
+    model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0, *, batch: bool = False
+) -> float:
+    price = model_price(model)
+    cost = (
+        (prompt_tokens - cached_tokens) * price.input
+        + cached_tokens * price.cached_input
+        + completion_tokens * price.output
+    ) / 1_000_000
+    return cost * BATCH_DISCOUNT if batch else cost
+
+
+def usage_tokens(usage: t.Any) -> tuple[int, int, int]:
+    # (prompt, completion, cached prompt) from `usage` as the SDK returns
+    # it, or as the dict in a Batch API output line
+    if usage is None:
+        return 0, 0, 0
+    if isinstance(usage, dict):
+        details = usage.get("prompt_tokens_details") or {}
+        return usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0, details.get("cached_tokens") or 0
+
+    details = getattr(usage, "prompt_tokens_details", None)
+    return (
+        getattr(usage, "prompt_tokens", 0) or 0,
+        getattr(usage, "completion_tokens", 0) or 0,
+        getattr(details, "cached_tokens", 0) or 0,
+    )
+
+
+@dataclass
+class Reservation:
+    tokens: int
+    dollars: float
+
+
+class SpendGovernor:
+    """
+    Per-run ceiling on OpenAI tokens and/or dollars.
+
+    Callers `reserve` a worst-case estimate before each request, so many
+    requests in flight can't overshoot the ceiling together, then `settle`
+    it against the `usage` the response reports. Once a reservation
+    doesn't fit, callers skip the work instead of failing - the paper is
+    written without it and picked up again next run.
+    """
+
+    def __init__(self, max_tokens: int | None = None, max_dollars: float | None = None) -> None:
+        self.max_tokens = max_tokens
+        self.max_dollars = max_dollars
+        self.tokens = 0
+        self.dollars = 0.0
+        self.skipped = 0
+        self.exhausted = False
+        self._reserved = Reservation(0, 0.0)
+
+    def reserve(
+        self, model: str, prompt_tokens: int, completion_tokens: int, *, batch: bool = False
+    ) -> Reservation | None:
+        reservation = Reservation(
+            prompt_tokens + completion_tokens, usage_cost(model, prompt_tokens, completion_tokens, batch=batch)
+        )
+        over_tokens = (
+            self.max_tokens is not None
+            and self.tokens + self._reserved.tokens + reservation.tokens > self.max_tokens
+        )
+        over_dollars = (
+            self.max_dollars is not None
+            and self.dollars + self._reserved.dollars + reservation.dollars > self.max_dollars
+        )
+        if over_tokens or over_dollars:
+            self.skipped += 1
+            if not self.exhausted:
+                self.exhausted = True
+                print(f"[!] OpenAI spend ceiling reached ({self}), skipping further LLM work this run")
+            return None
+
+        self._reserved.tokens += reservation.tokens
+        self._reserved.dollars += reservation.dollars
+        return reservation
+
+    def release(self, reservation: Reservation) -> None:
+        self._reserved.tokens -= reservation.tokens
+        self._reserved.dollars -= reservation.dollars
+
+    def record(self, model: str, usage: t.Any, *, batch: bool = False) -> None:
+        prompt_tokens, completion_tokens, cached_tokens = usage_tokens(usage)
+        self.tokens += prompt_tokens + completion_tokens
+        self.dollars += usage_cost(model, prompt_tokens, completion_tokens, cached_tokens, batch=batch)
+
+    def settle(self, reservation: Reservation, model: str, usage: t.Any, *, batch: bool = False) -> None:
+        self.release(reservation)
+        self.record(model, usage, batch=batch)
+
+    def __str__(self) -> str:
+        limits = [
+            f"{self.max_tokens} tokens" if self.max_tokens is not None else None,
+            f"${self.max_dollars:g}" if self.max_dollars is not None else None,
+        ]
+        limit = " / ".join(limit for limit in limits if limit) or "no ceiling"
+        skipped = f", {self.skipped} requests skipped" if self.skipped else ""
+        return f"{self.tokens} tokens, ${self.dollars:.4f} of {limit}{skipped}"
@@ -0,0 +1,249 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import typing as t
+from datetime import datetime
+
+LLM_CACHE_PATH = ".paperstack/llm_cache.sqlite"
+LLM_CACHE_MAX_ENTRIES = 100_000
+LLM_CACHE_MAX_AGE_DAYS = 180
+
+RESPONSE_CACHE_PATH = ".paperstack/response_cache.sqlite"
+
+# How long a successful response stays fresh, per source (days). arXiv
+# metadata barely changes; recommendations drift as new papers appear.
+RESPONSE_CACHE_TTLS = {
+    "arxiv_id": 30,
+    "arxiv_title": 30,
+    "s2_recommend": 7,
+    "s2_related": 7,
+    "s2_citations": 7,
+    "s2_references": 30,
+    "s2_paper": 30,
+}
+
+# "Not found" is re-checked after 1 day, then 2, 4, ... up to 60
+NEGATIVE_CACHE_BASE_DAYS = 1
+NEGATIVE_CACHE_MAX_DAYS = 60
+
+# Returned by ResponseCache.get when there's nothing fresh - None is a
+# legitimate cached "not found"
+MISS = object()
+
+
+class LLMCache:
+    """
+    On-disk cache of LLM completions keyed by a hash of the full request.
+
+    The request includes the model, the rendered system prompt, sampling
+    parameters and the abstract, so editing one task's prompt only misses
+    for that task's calls. Enrichments are stored per field, keyed on that
+    field's instructions, so editing the attack type descriptions only
+    misses for attack types.
+    """
+
+    def __init__(
+        self,
+        path: str = LLM_CACHE_PATH,
+        *,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        max_age_days: float = LLM_CACHE_MAX_AGE_DAYS,
+    ) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS completions_accessed ON completions (accessed)")
+        self.evict()
+
+    @staticmethod
+    def key(request: dict) -> str:
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        row = self._db.execute("SELECT value FROM completions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._db.execute("UPDATE completions SET accessed = ? WHERE key = ?", (time.time(), key))
+        self._db.commit()
+        return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        self._db.execute(
+            "INSERT OR REPLACE INTO completions (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+            (key, value, now, now),
+        )
+        self._db.commit()
+
+    def evict(self) -> int:
+        before = self._db.total_changes
+        self._db.execute("DELETE FROM completions WHERE created < ?", (time.time() - self.max_age,))
+        self._db.execute(
+            "DELETE FROM completions WHERE key NOT IN "
+            "(SELECT key FROM completions ORDER BY accessed DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+        self._db.commit()
+        return self._db.total_changes - before
+
+    def close(self) -> None:
+        self._db.close()
+
+    @property
+    def size(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+    def __str__(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses, {self.size} entries"
+
+
+class ResponseCache:
+    """
+    On-disk cache of external API responses, keyed by source and a
+    normalised query (an arXiv id, a title fingerprint, ...).
+
+    Successful responses expire after the source's TTL. Lookups that found
+    nothing are cached too, with the re-check interval doubling each time
+    they come back empty, so papers that never match stop costing a
+    request every run.
+    """
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+        # arXiv fills run in worker threads, S2 lookups on the loop
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "source TEXT NOT NULL, key TEXT NOT NULL, value TEXT, fetched REAL NOT NULL, "
+            "expires REAL NOT NULL, empty_count INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (source, key))"
+        )
+
+    def get(self, source: str, key: str) -> t.Any:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM responses WHERE source = ? AND key = ? AND expires > ?", (source, key, time.time())
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return MISS
+
+        self.hits += 1
+        return None if row[0] is None else json.loads(row[0])
+
+    def set(self, source: str, key: str, value: t.Any) -> None:
+        now = time.time()
+        with self._lock:
+            if value is None:
+                row = self._db.execute(
+                    "SELECT empty_count FROM responses WHERE source = ? AND key = ? AND value IS NULL", (source, key)
+                ).fetchone()
+                empty_count = (row[0] if row else 0) + 1
+                ttl = min(NEGATIVE_CACHE_BASE_DAYS * 2 ** (empty_count - 1), NEGATIVE_CACHE_MAX_DAYS)
+                encoded = None
+            else:
+                empty_count = 0
+                ttl = RESPONSE_CACHE_TTLS[source]
+                encoded = json.dumps(value)
+
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (source, key, value, fetched, expires, empty_count) VALUES (?, ?, ?, ?, ?, ?)",
+                (source, key, encoded, now, now + ttl * 86400, empty_count),
+            )
+            self._db.commit()
+
+    def purge(self, source: str | None = None, *, expired: bool = False, empty: bool = False) -> int:
+        clauses, params = [], []
+        if source:
+            clauses.append("source = ?")
+            params.append(source)
+        if expired:
+            clauses.append("expires <= ?")
+            params.append(time.time())
+        if empty:
+            clauses.append("value IS NULL")
+
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            deleted = self._db.execute(f"DELETE FROM responses{where}", params).rowcount
+            self._db.commit()
+        return deleted
+
+    def stats(self) -> list[tuple[str, int, int, int]]:
+        # (source, entries, cached "not found", expired)
+        return self._db.execute(
+            "SELECT source, COUNT(*), SUM(value IS NULL), SUM(expires <= ?) FROM responses GROUP BY source ORDER BY source",
+            (time.time(),),
+        ).fetchall()
+
+    def entries(self, source: str | None = None, *, limit: int = 20) -> list[tuple]:
+        return self._db.execute(
+            "SELECT source, key, value IS NULL, fetched, expires, empty_count FROM responses "
+            "WHERE ? IS NULL OR source = ? ORDER BY fetched DESC LIMIT ?",
+            (source, source, limit),
+        ).fetchall()
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __str__(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect or purge the paperstack response cache.")
+    parser.add_argument("--path", type=str, default=RESPONSE_CACHE_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    inspect = subparsers.add_parser("inspect", help="Show entry counts per source and the latest entries")
+    inspect.add_argument("--source", type=str, choices=sorted(RESPONSE_CACHE_TTLS))
+    inspect.add_argument("--limit", type=int, default=20)
+
+    purge = subparsers.add_parser("purge", help="Delete entries (everything unless filtered)")
+    purge.add_argument("--source", type=str, choices=sorted(RESPONSE_CACHE_TTLS))
+    purge.add_argument("--expired", action="store_true", default=False, help="Only expired entries")
+    purge.add_argument("--not-found", action="store_true", default=False, help="Only cached \"not found\" results")
+
+    args = parser.parse_args()
+    cache = ResponseCache(args.path)
+
+    if args.command == "inspect":
+        print(f"[+] {args.path}")
+        for source, entries, empty, expired in cache.stats():
+            print(f" |- {source}: {entries} entries ({empty} not found, {expired} expired)")
+
+        print(" |- Latest entries")
+        for source, key, empty, fetched, expires, empty_count in cache.entries(args.source, limit=args.limit):
+            status = f"not found x{empty_count}" if empty else "ok"
+            fetched_at = datetime.fromtimestamp(fetched).strftime("%Y-%m-%d %H:%M")
+            expires_at = datetime.fromtimestamp(expires).strftime("%Y-%m-%d %H:%M")
+            print(f"    |- [{source}] {key[:60]} - {status}, fetched {fetched_at}, expires {expires_at}")
+    else:
+        deleted = cache.purge(args.source, expired=args.expired, empty=args.not_found)
+        print(f"[+] Purged {deleted} entries from {args.path}")
+
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
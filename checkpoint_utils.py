@@ -0,0 +1,131 @@
+import json
+import os
+import typing as t
+from datetime import datetime
+
+from _types import TRACKED_FIELDS, AttackType, Focus, Paper, title_fingerprint
+
+CHECKPOINT_PATH = ".paperstack/checkpoint.json"
+
+# Stages whose results live entirely in the papers we checkpoint
+RESUMABLE_STAGES = ("arxiv_fill", "arxiv_search", "s2_recommend")
+
+
+def checkpoint_key(paper: Paper) -> str | None:
+    # arXiv ids survive a paper being written (and gaining a page_id),
+    # so prefer them over the page id.
+    if paper.arxiv_id:
+        return f"arxiv:{paper.arxiv_id}"
+    if paper.page_id:
+        return paper.page_id
+    if paper.title:
+        return f"title:{title_fingerprint(paper.title)}"
+    return None
+
+
+def _serialize(value: t.Any) -> t.Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (Focus, AttackType)):
+        return value.value
+    return value
+
+
+def _deserialize(name: str, value: t.Any) -> t.Any:
+    if value is None:
+        return None
+    if name == "published":
+        return datetime.fromisoformat(value)
+    if name == "focus":
+        return Focus(value)
+    if name == "attack_type":
+        return AttackType(value)
+    return value
+
+
+class Checkpoint:
+    """
+    Unsaved work from a run, keyed by paper, so a killed run can pick up
+    where it left off with --resume.
+
+    Only papers that still differ from Notion are kept - once a paper is
+    written it drops out - along with the discovery stages the run has
+    finished. Those stages belong to the run that wrote them: they're
+    dropped once it (or the run resuming it) gets to the end, so only a
+    killed run skips discovery on --resume.
+    """
+
+    def __init__(self, path: str = CHECKPOINT_PATH, *, resume: bool = False) -> None:
+        self.path = path
+        self.run = datetime.now().isoformat(timespec="seconds")
+        self.stages: set[str] = set()
+        self.entries: dict[str, dict] = {}
+
+        if resume and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            # Picking up a killed run - carry on as that run
+            if state.get("run") and state["stages"]:
+                self.run = state["run"]
+                self.stages = set(state["stages"]) & set(RESUMABLE_STAGES)
+            self.entries = state["papers"]
+
+    def done(self, stage: str) -> bool:
+        return stage in self.stages
+
+    def save(self, papers: list[Paper], *, stage: str | None = None) -> None:
+        if stage:
+            assert stage in RESUMABLE_STAGES, f"{stage} can't be resumed"
+            self.stages.add(stage)
+
+        self.entries = {}
+        for paper in papers:
+            key = checkpoint_key(paper)
+            if not key or not paper.has_changed():
+                continue
+
+            fields = {"abstract", *paper.changed_fields()}
+            self.entries[key] = {
+                "new": paper.page_id is None,
+                "fields": {name: _serialize(getattr(paper, name)) for name in fields},
+            }
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump({"run": self.run, "stages": sorted(self.stages), "papers": self.entries}, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def restore(self, papers: list[Paper]) -> list[Paper]:
+        """
+        Re-apply checkpointed changes onto papers read from Notion and
+        return the papers discovered last time that never made it there.
+        """
+
+        by_key = {checkpoint_key(p): p for p in papers}
+        new_papers: list[Paper] = []
+        for key, entry in self.entries.items():
+            fields = {name: _deserialize(name, value) for name, value in entry["fields"].items()}
+
+            paper = by_key.get(key)
+            if paper:
+                for name, value in fields.items():
+                    if name in TRACKED_FIELDS or name == "abstract":
+                        setattr(paper, name, value)
+            elif entry["new"]:
+                new_papers.append(Paper(**fields))
+
+        return new_papers
+
+    def finish(self, papers: list[Paper]) -> None:
+        # The run got to the end, so only papers that failed to write are
+        # worth resuming - a later --resume runs discovery again
+        self.stages.clear()
+        self.save(papers)
+        if not self.entries:
+            self.clear()
+
+    def clear(self) -> None:
+        self.stages.clear()
+        self.entries.clear()
+        if os.path.exists(self.path):
+            os.remove(self.path)
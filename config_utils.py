@@ -0,0 +1,91 @@
+import os
+import re
+import tomllib
+from dataclasses import dataclass
+
+
+@dataclass
+class Target:
+    name: str
+    database_id: str
+    arxiv_search_query: str
+
+    # Per-target state files, so targets never share a checkpoint,
+    # rejection list, pending OpenAI batch or citation frontier
+    checkpoint: str
+    rejected: str
+    openai_batch_state: str
+    frontier: str
+
+
+def _target_path(path: str, name: str | None) -> str:
+    if not name:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}-{re.sub(r'[^a-zA-Z0-9_-]+', '-', name)}{ext}"
+
+
+def make_target(
+    database_id: str,
+    arxiv_search_query: str,
+    *,
+    checkpoint: str,
+    rejected: str,
+    openai_batch_state: str,
+    frontier: str,
+    name: str | None = None,
+) -> Target:
+    return Target(
+        name=name or database_id,
+        database_id=database_id,
+        arxiv_search_query=arxiv_search_query,
+        checkpoint=_target_path(checkpoint, name),
+        rejected=_target_path(rejected, name),
+        openai_batch_state=_target_path(openai_batch_state, name),
+        frontier=_target_path(frontier, name),
+    )
+
+
+def load_targets(
+    path: str,
+    *,
+    arxiv_search_query: str,
+    checkpoint: str,
+    rejected: str,
+    openai_batch_state: str,
+    frontier: str,
+) -> list[Target]:
+    """
+    Read targets from a TOML file:
+
+        [[targets]]
+        name = "llm-security"
+        database_id = "..."
+        arxiv_search_query = "..."   # optional, defaults to --arxiv-search-query
+    """
+
+    with open(path, "rb") as f:
+        config = tomllib.load(f)
+
+    targets: list[Target] = []
+    for i, entry in enumerate(config.get("targets", [])):
+        if "database_id" not in entry:
+            raise ValueError(f"Target {i} in {path} has no database_id")
+
+        targets.append(
+            make_target(
+                entry["database_id"],
+                entry.get("arxiv_search_query", arxiv_search_query),
+                checkpoint=checkpoint,
+                rejected=rejected,
+                openai_batch_state=openai_batch_state,
+                frontier=frontier,
+                name=entry.get("name", entry["database_id"]),
+            )
+        )
+
+    names = [target.name for target in targets]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Target names in {path} must be unique")
+
+    return targets
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import typing as t
+from collections import defaultdict
+
+from _types import Paper
+from budget_utils import Reservation, SpendGovernor
+from lazy_utils import lazy_import
+from metrics_utils import METRICS
+from openai_utils import count_tokens
+
+if t.TYPE_CHECKING:
+    import numpy as np
+    import openai
+else:
+    np = lazy_import("numpy")
+    openai = lazy_import("openai")
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_CACHE_PATH = ".paperstack/embeddings.npz"
+EMBEDDING_BATCH_SIZE = 256
+MAX_RETRIES = 5
+
+# Label propagation: how many neighbours vote, how close they have to be
+# to count, and what share of the (similarity weighted) vote a label needs
+KNN_NEIGHBORS = 10
+KNN_MIN_SIMILARITY = 0.5
+KNN_MIN_VOTES = 3
+KNN_MIN_AGREEMENT = 0.8
+
+# Streamed papers are embedded in small batches so labelling doesn't stall them
+KNN_BATCH_SIZE = 32
+
+# Similarity searches are done in blocks of queries to bound memory
+SEARCH_BLOCK_SIZE = 1024
+
+
+def paper_text(paper: Paper) -> str | None:
+    reference = paper.abstract or paper.summary
+    if not reference:
+        return None
+    return f"{paper.title or ''}\n\n{reference}"
+
+
+class EmbeddingCache:
+    """
+    Embeddings on disk, keyed by a hash of the model and text so an edited
+    abstract (or a model change) is simply a miss.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, model: str = EMBEDDING_MODEL) -> None:
+        self.path = path
+        self.model = model
+        self.hits = 0
+        self.misses = 0
+        self._vectors: dict[str, np.ndarray] = {}
+        self._dirty = False
+
+        if os.path.exists(path):
+            with np.load(path) as data:
+                self._vectors = dict(zip(data["keys"].tolist(), data["vectors"]))
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\n{text}".encode()).hexdigest()
+
+    def get(self, key: str) -> np.ndarray | None:
+        vector = self._vectors.get(key)
+        if vector is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return vector
+
+    def set(self, key: str, vector: np.ndarray) -> None:
+        self._vectors[key] = vector
+        self._dirty = True
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        keys = np.array(list(self._vectors), dtype=str)
+        vectors = np.stack(list(self._vectors.values())).astype(np.float32)
+        # np.savez appends .npz to names without it, so write through a handle
+        with open(f"{self.path}.tmp", "wb") as f:
+            np.savez(f, keys=keys, vectors=vectors)
+        os.replace(f"{self.path}.tmp", self.path)
+        self._dirty = False
+
+    def __str__(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses, {len(self._vectors)} entries"
+
+
+async def _embed_batch(
+    client: openai.AsyncOpenAI, texts: list[str], model: str, *, governor: SpendGovernor | None = None
+) -> list[list[float]] | None:
+    # None means the spend ceiling left no room for this batch
+    reservation: Reservation | None = None
+    if governor:
+        reservation = governor.reserve(model, sum(count_tokens(text, model) for text in texts), 0)
+        if reservation is None:
+            return None
+
+    try:
+        for attempt in range(1, MAX_RETRIES + 1):
+            try:
+                response = await client.embeddings.create(model=model, input=texts)
+                break
+            except openai.RateLimitError:
+                METRICS.record("openai", retries=1)
+                await asyncio.sleep(2**attempt)
+        else:
+            METRICS.record("openai", errors=1)
+            raise RuntimeError(f"Still rate limited after {MAX_RETRIES} attempts")
+    except BaseException:
+        if governor and reservation:
+            governor.release(reservation)
+        raise
+
+    METRICS.record("openai", calls=1, prompt_tokens=response.usage.prompt_tokens)
+    if governor and reservation:
+        governor.settle(reservation, model, response.usage)
+    return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+
+async def embed_papers(
+    client: openai.AsyncOpenAI,
+    papers: list[Paper],
+    cache: EmbeddingCache,
+    *,
+    governor: SpendGovernor | None = None,
+) -> np.ndarray:
+    """
+    Unit-length embeddings for each paper's title and abstract (rows line
+    up with `papers`; papers without text get a zero row). Only texts
+    missing from the cache are sent, in batches. Past the spend ceiling
+    the rest get zero rows too, which rank last and vote for nothing.
+    """
+
+    texts = [paper_text(p) for p in papers]
+    keys = [cache.key(text) if text else None for text in texts]
+
+    found: dict[str, np.ndarray] = {}
+    missing: dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if not key or not text or key in found or key in missing:
+            continue
+        if (vector := cache.get(key)) is not None:
+            found[key] = vector
+        else:
+            missing[key] = text
+
+    pending = list(missing.items())
+    for i in range(0, len(pending), EMBEDDING_BATCH_SIZE):
+        batch = pending[i : i + EMBEDDING_BATCH_SIZE]
+        embeddings = await _embed_batch(client, [text for _, text in batch], cache.model, governor=governor)
+        if embeddings is None:
+            break
+        for (key, _), embedding in zip(batch, embeddings):
+            vector = np.asarray(embedding, dtype=np.float32)
+            found[key] = vector / (np.linalg.norm(vector) or 1.0)
+            cache.set(key, found[key])
+
+    dim = next(iter(found.values())).shape[0] if found else 0
+    vectors = np.zeros((len(papers), dim), dtype=np.float32)
+    for row, key in enumerate(keys):
+        if key in found:
+            vectors[row] = found[key]
+    return vectors
+
+
+class EmbeddingIndex:
+    """
+    Papers and their unit-length embeddings in one array, so cosine
+    similarity against the whole corpus is a single matrix product.
+    """
+
+    def __init__(self, papers: list[Paper], vectors: np.ndarray) -> None:
+        # Rows without text are all zeros and would only add noise
+        keep = np.flatnonzero(vectors.any(axis=1))
+        self.papers = [papers[i] for i in keep]
+        self.vectors = vectors[keep]
+
+    def search(self, queries: np.ndarray, k: int = KNN_NEIGHBORS) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Top `k` neighbours for each query row, most similar first, as
+        (similarities, indices into `self.papers`).
+        """
+
+        k = min(k, len(self.papers))
+        scores = np.zeros((len(queries), k), dtype=np.float32)
+        indices = np.zeros((len(queries), k), dtype=np.int64)
+        if not k or not queries.size:
+            return scores, indices
+
+        for start in range(0, len(queries), SEARCH_BLOCK_SIZE):
+            block = queries[start : start + SEARCH_BLOCK_SIZE] @ self.vectors.T
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            scores[start : start + len(block)] = np.take_along_axis(top_scores, order, axis=1)
+            indices[start : start + len(block)] = np.take_along_axis(top, order, axis=1)
+
+        return scores, indices
+
+    def __len__(self) -> int:
+        return len(self.papers)
+
+
+def rank_by_similarity(
+    index: EmbeddingIndex, papers: list[Paper], vectors: np.ndarray, k: int = KNN_NEIGHBORS
+) -> list[tuple[float, Paper]]:
+    # Mean similarity to the closest papers we already track
+    scores, _ = index.search(vectors, k)
+    mean = scores.mean(axis=1) if scores.size else np.zeros(len(papers))
+    return sorted(zip(mean.tolist(), papers), key=lambda pair: pair[0], reverse=True)
+
+
+def _vote(neighbours: list[tuple[float, object]]) -> object | None:
+    weights: dict[object, float] = defaultdict(float)
+    for similarity, label in neighbours:
+        if label is not None:
+            weights[label] += similarity
+
+    votes = sum(1 for _, label in neighbours if label is not None)
+    total = sum(weights.values())
+    if votes < KNN_MIN_VOTES or not total:
+        return None
+
+    label, weight = max(weights.items(), key=lambda item: item[1])
+    return label if weight / total >= KNN_MIN_AGREEMENT else None
+
+
+def propagate_labels(
+    index: EmbeddingIndex, papers: list[Paper], vectors: np.ndarray, k: int = KNN_NEIGHBORS
+) -> int:
+    """
+    Give papers the focus and attack type their nearest labelled
+    neighbours agree on. Ambiguous papers are left alone for the LLM.
+    Returns how many papers gained a label.
+    """
+
+    # One extra neighbour in case a paper finds itself in the index
+    scores, indices = index.search(vectors, k + 1)
+    labelled = 0
+    for paper, row_scores, row_indices in zip(papers, scores, indices):
+        neighbours = [
+            (float(score), index.papers[i])
+            for score, i in zip(row_scores, row_indices)
+            if score >= KNN_MIN_SIMILARITY and index.papers[i] is not paper
+        ][:k]
+
+        changed = False
+        if not paper.focus and (focus := _vote([(s, n.focus) for s, n in neighbours])):
+            paper.focus = focus
+            changed = True
+        if not paper.attack_type and (attack_type := _vote([(s, n.attack_type) for s, n in neighbours])):
+            paper.attack_type = attack_type
+            changed = True
+        labelled += changed
+
+    return labelled
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import importlib.util
+import threading
+import typing as t
+from urllib.parse import urlsplit
+
+from lazy_utils import lazy_import
+from metrics_utils import METRICS
+
+if t.TYPE_CHECKING:
+    import httpx
+    import requests
+else:
+    httpx = lazy_import("httpx")
+    requests = lazy_import("requests")
+
+# Every client draws on one keep-alive pool per HTTP stack (async httpx,
+# sync httpx, requests), so concurrent stages reuse warm connections
+# instead of each opening - and TLS handshaking - their own.
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 40
+HTTP_KEEPALIVE_EXPIRY = 60
+
+# requests pools connections per host, up to this many per pool
+HTTP_POOL_HOSTS = 10
+
+# (connect, read) seconds. Connecting should be quick everywhere; reads
+# allow for each API's slow calls (completions, full OAI-PMH pages).
+HTTP_TIMEOUTS: dict[str, tuple[float, float]] = {
+    "api.notion.com": (5, 30),
+    "api.openai.com": (5, 120),
+    "api.semanticscholar.org": (5, 30),
+    "export.arxiv.org": (10, 60),
+    "oaipmh.arxiv.org": (10, 120),
+}
+HTTP_DEFAULT_TIMEOUT = (10, 60)
+
+_http2 = False
+_lock = threading.Lock()
+_pools: dict[str, t.Any] = {}
+
+
+def configure_http(*, http2: bool = False) -> None:
+    # Pools are built on first use, so this has to come before any client
+    global _http2
+    if http2 and importlib.util.find_spec("h2") is None:
+        print("[!] HTTP/2 needs the h2 package (pip install 'httpx[http2]'), using HTTP/1.1")
+        http2 = False
+    _http2 = http2
+
+
+def http_timeout(url: str | None) -> tuple[float, float]:
+    host = urlsplit(url).hostname if url else None
+    return HTTP_TIMEOUTS.get(host or "", HTTP_DEFAULT_TIMEOUT)
+
+
+def _httpx_timeout(url: str | None) -> httpx.Timeout:
+    connect, read = http_timeout(url)
+    return httpx.Timeout(read, connect=connect)
+
+
+def _pool(kind: str) -> t.Any:
+    with _lock:
+        if kind not in _pools:
+            if kind == "requests":
+                _pools[kind] = requests.adapters.HTTPAdapter(
+                    pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_MAX_KEEPALIVE_CONNECTIONS
+                )
+            else:
+                limits = httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                )
+                transport = httpx.AsyncHTTPTransport if kind == "async" else httpx.HTTPTransport
+                _pools[kind] = transport(limits=limits, http2=_http2)
+        return _pools[kind]
+
+
+def _record_connection(service: str, opened: int) -> None:
+    METRICS.record(service, connections=opened, reused=int(not opened))
+
+
+def _cap_connect(request: httpx.Request, connect: float) -> None:
+    # Clients that only take one flat timeout (notion_client) still
+    # connect within the host's connect timeout
+    if timeout := request.extensions.get("timeout"):
+        request.extensions["timeout"] = {**timeout, "connect": min(timeout.get("connect") or connect, connect)}
+
+
+# The transports below are a per-service view of a shared pool: they
+# count new and reused connections under the service's metrics, cap the
+# connect timeout for the service's host and leave the pool open when a
+# client using them is closed. They're duck-typed rather than
+# subclassing httpx/requests so importing this module doesn't import
+# either.
+
+
+class _AsyncTransport:
+    def __init__(self, service: str, url: str | None = None) -> None:
+        self.service = service
+        self.connect = http_timeout(url)[0]
+        self.pool = _pool("async")
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        opened = 0
+        previous = request.extensions.get("trace")
+
+        async def trace(event: str, info: dict) -> None:
+            nonlocal opened
+            if event == "connection.connect_tcp.complete":
+                opened += 1
+            if previous:
+                await previous(event, info)
+
+        request.extensions["trace"] = trace
+        _cap_connect(request, self.connect)
+        response = await self.pool.handle_async_request(request)
+        _record_connection(self.service, opened)
+        return response
+
+    async def __aenter__(self) -> _AsyncTransport:
+        return self
+
+    async def __aexit__(self, *args: t.Any) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        pass
+
+
+class _SyncTransport:
+    def __init__(self, service: str, url: str | None = None) -> None:
+        self.service = service
+        self.connect = http_timeout(url)[0]
+        self.pool = _pool("sync")
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        opened = 0
+        previous = request.extensions.get("trace")
+
+        def trace(event: str, info: dict) -> None:
+            nonlocal opened
+            if event == "connection.connect_tcp.complete":
+                opened += 1
+            if previous:
+                previous(event, info)
+
+        request.extensions["trace"] = trace
+        _cap_connect(request, self.connect)
+        response = self.pool.handle_request(request)
+        _record_connection(self.service, opened)
+        return response
+
+    def __enter__(self) -> _SyncTransport:
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class _Adapter:
+    def __init__(self, service: str, timeout: tuple[float, float]) -> None:
+        self.service = service
+        self.timeout = timeout
+        self.pool = _pool("requests")
+
+    def send(self, request: requests.PreparedRequest, **kwargs: t.Any) -> requests.Response:
+        # Libraries that never pass a timeout (arxiv) get the host's
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+
+        # The pool send() itself will use - the TLS settings are part of its key
+        connections = self.pool.get_connection_with_tls_context(
+            request, kwargs.get("verify", True), proxies=kwargs.get("proxies"), cert=kwargs.get("cert")
+        )
+        before = connections.num_connections
+        response = self.pool.send(request, **kwargs)
+        _record_connection(self.service, connections.num_connections - before)
+        return response
+
+    def close(self) -> None:
+        pass
+
+
+def get_async_http_client(service: str, url: str | None = None, **kwargs: t.Any) -> httpx.AsyncClient:
+    # `url` is only used to pick the host's timeouts
+    return httpx.AsyncClient(transport=_AsyncTransport(service, url), timeout=_httpx_timeout(url), **kwargs)
+
+
+def get_http_client(service: str, url: str | None = None, **kwargs: t.Any) -> httpx.Client:
+    return httpx.Client(transport=_SyncTransport(service, url), timeout=_httpx_timeout(url), **kwargs)
+
+
+def get_http_session(service: str, url: str | None = None) -> requests.Session:
+    session = requests.Session()
+    adapter = _Adapter(service, http_timeout(url))
+    session.mount("https://", adapter)  # type: ignore[arg-type]
+    session.mount("http://", adapter)  # type: ignore[arg-type]
+    return session
+
+
+def connection_summary() -> str:
+    totals = METRICS.report()["totals"]
+    return ", ".join(
+        f"{service} {metrics['connections']} opened/{metrics['reused']} reused"
+        for service, metrics in totals.items()
+        if metrics["connections"] or metrics["reused"]
+    )
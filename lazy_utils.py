@@ -0,0 +1,28 @@
+import importlib.util
+import sys
+import types
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """
+    Register a module that only executes on first attribute access, so
+    heavy dependencies (openai, numpy, ...) cost nothing for runs - and
+    imports - that never touch them.
+
+    Module attributes must be looked up at use (`openai.AsyncOpenAI`),
+    not bound with `from ... import`, or the module loads right away.
+    """
+
+    if module := sys.modules.get(name):
+        return module
+
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,131 @@
+import contextlib
+import contextvars
+import json
+import os
+import time
+import typing as t
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+
+COUNTERS = (
+    "calls",
+    "retries",
+    "errors",
+    "bytes",
+    "connections",
+    "reused",
+    "prompt_tokens",
+    "cached_tokens",
+    "completion_tokens",
+)
+
+
+@dataclass
+class ServiceMetrics:
+    calls: int = 0
+    retries: int = 0
+    errors: int = 0
+    bytes: int = 0
+    # HTTP requests that opened a new connection vs. reused a pooled one
+    connections: int = 0
+    reused: int = 0
+    prompt_tokens: int = 0
+    # Prompt tokens served from OpenAI's prompt cache (billed at a discount)
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+
+
+@dataclass
+class StageMetrics:
+    wall_s: float = 0.0
+    services: dict[str, ServiceMetrics] = field(default_factory=dict)
+
+
+class RunMetrics:
+    """
+    Time per pipeline stage plus per-service call counters, attributed to
+    whichever stage is active when they're recorded. The active stage is
+    a context variable, so work fanned out with asyncio.gather still lands
+    in the stage that started it.
+
+    Streaming stages are timed per call rather than for as long as they
+    stay open, so their time is work done, not time spent waiting on
+    other stages - and with several workers it can add up to more than
+    the run's wall time.
+    """
+
+    def __init__(self) -> None:
+        self.started = datetime.now(timezone.utc)
+        self.stages: dict[str, StageMetrics] = {}
+        self.report_path: str | None = None
+        self.prometheus_path: str | None = None
+        self._start = time.monotonic()
+        self._current: contextvars.ContextVar[str] = contextvars.ContextVar("stage", default="other")
+
+    @contextlib.contextmanager
+    def stage(self, name: str, *, flush: bool = True) -> t.Iterator[None]:
+        # Never hold this open across a yield - the time would include
+        # whatever the consumer does, and it has to be reset where it was set
+        token = self._current.set(name)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stages.setdefault(name, StageMetrics()).wall_s += time.monotonic() - start
+            self._current.reset(token)
+            # Flush after every stage so a killed run still leaves a report
+            if flush:
+                self.flush()
+
+    def record(self, service: str, **counters: int) -> None:
+        stage = self.stages.setdefault(self._current.get(), StageMetrics())
+        metrics = stage.services.setdefault(service, ServiceMetrics())
+        for name, value in counters.items():
+            setattr(metrics, name, getattr(metrics, name) + value)
+
+    def report(self) -> dict:
+        totals: dict[str, ServiceMetrics] = {}
+        for stage in self.stages.values():
+            for service, metrics in stage.services.items():
+                total = totals.setdefault(service, ServiceMetrics())
+                for name in COUNTERS:
+                    setattr(total, name, getattr(total, name) + getattr(metrics, name))
+
+        return {
+            "started": self.started.isoformat(),
+            "wall_s": round(time.monotonic() - self._start, 3),
+            "stages": {name: asdict(stage) for name, stage in self.stages.items()},
+            "totals": {service: asdict(metrics) for service, metrics in totals.items()},
+        }
+
+    def prometheus(self) -> str:
+        lines = [
+            "# HELP paperstack_stage_seconds Time spent working in each pipeline stage.",
+            "# TYPE paperstack_stage_seconds gauge",
+        ]
+        for name, stage in self.stages.items():
+            lines.append(f'paperstack_stage_seconds{{stage="{name}"}} {stage.wall_s:.3f}')
+
+        for counter in COUNTERS:
+            lines.append(f"# TYPE paperstack_{counter}_total counter")
+            for name, stage in self.stages.items():
+                for service, metrics in stage.services.items():
+                    lines.append(
+                        f'paperstack_{counter}_total{{stage="{name}",service="{service}"}} {getattr(metrics, counter)}'
+                    )
+
+        return "\n".join(lines) + "\n"
+
+    def flush(self) -> None:
+        for path, content in (
+            (self.report_path, lambda: json.dumps(self.report(), indent=2)),
+            (self.prometheus_path, self.prometheus),
+        ):
+            if not path:
+                continue
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w") as f:
+                f.write(content())
+
+
+METRICS = RunMetrics()
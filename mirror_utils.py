@@ -0,0 +1,358 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import typing as t
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta, timezone
+
+from _types import normalize_arxiv_id, title_fingerprint
+from http_utils import get_http_client
+from lazy_utils import lazy_import
+from metrics_utils import METRICS
+
+httpx = lazy_import("httpx")
+
+ARXIV_MIRROR_PATH = ".paperstack/arxiv_mirror.sqlite"
+ARXIV_OAI_URL = os.environ.get("ARXIV_OAI_URL", "https://oaipmh.arxiv.org/oai")
+
+# OAI-PMH sets to mirror - the categories our searches and fills care about
+ARXIV_MIRROR_SETS = ("cs:cs:CR", "cs:cs:LG", "cs:cs:CL")
+
+# A mirror older than this gets a delta harvest before it's used
+ARXIV_MIRROR_MAX_AGE = timedelta(days=1)
+
+# arXiv answers busy harvesters with 503 and a Retry-After
+OAI_MAX_RETRIES = 5
+OAI_RETRY_DELAY = 10
+
+OAI_NS = "{http://www.openarchives.org/OAI/2.0/}"
+ARXIV_NS = "{http://arxiv.org/OAI/arXiv/}"
+
+# arXiv query fields and the mirror columns they search
+QUERY_FIELDS = {"ti": "title", "abs": "abstract", "au": "authors", "cat": "categories", "all": None}
+QUERY_TOKEN = re.compile(r'\(|\)|(?:(\w+):)?("[^"]*"|[^\s()"]+)')
+
+
+def _clean(text: str | None) -> str:
+    # OAI metadata keeps the submission's line wrapping
+    return " ".join((text or "").split())
+
+
+def _parse_record(record: ET.Element) -> tuple[str, dict | None] | None:
+    header = record.find(f"{OAI_NS}header")
+    if header is None:
+        return None
+
+    identifier = header.findtext(f"{OAI_NS}identifier") or ""
+    arxiv_id = normalize_arxiv_id(identifier.removeprefix("oai:arXiv.org:"))
+    if header.get("status") == "deleted":
+        return arxiv_id, None
+
+    metadata = record.find(f"{OAI_NS}metadata/{ARXIV_NS}arXiv")
+    if metadata is None:
+        return None
+
+    authors = []
+    for author in metadata.iterfind(f"{ARXIV_NS}authors/{ARXIV_NS}author"):
+        name = " ".join(
+            part for tag in ("forenames", "keyname", "suffix") if (part := _clean(author.findtext(f"{ARXIV_NS}{tag}")))
+        )
+        if name:
+            authors.append(name)
+
+    created = metadata.findtext(f"{ARXIV_NS}created") or header.findtext(f"{OAI_NS}datestamp") or ""
+    return arxiv_id, {
+        "title": _clean(metadata.findtext(f"{ARXIV_NS}title")),
+        "abstract": _clean(metadata.findtext(f"{ARXIV_NS}abstract")),
+        "authors": authors,
+        "published": datetime.fromisoformat(created).replace(tzinfo=timezone.utc).isoformat() if created else None,
+        "categories": metadata.findtext(f"{ARXIV_NS}categories") or "",
+    }
+
+
+def to_fts_query(query: str) -> str:
+    """
+    Translate an arXiv API query (ti:, abs:, au:, cat:, all:, quoted
+    phrases, AND/OR/ANDNOT, parentheses) into an FTS5 match expression.
+    """
+
+    parts: list[str] = []
+    for match in QUERY_TOKEN.finditer(query):
+        token, field, term = match.group(0), match.group(1), match.group(2)
+        if token in ("(", ")"):
+            parts.append(token)
+        elif not field and term in ("AND", "OR"):
+            parts.append(term)
+        elif not field and term == "ANDNOT":
+            parts.append("NOT")
+        else:
+            # Quote everything so punctuation (cs.CR, GPT-4) stays a phrase
+            phrase = '"' + term.strip('"').replace('"', '""') + '"'
+            column = QUERY_FIELDS.get((field or "all").lower())
+            parts.append(f"{column}:{phrase}" if column else phrase)
+    return " ".join(parts)
+
+
+class ArxivMirror:
+    """
+    Local copy of arXiv metadata for a few categories, harvested over
+    OAI-PMH into SQLite with an FTS5 index over titles and abstracts.
+
+    Harvests are incremental: each set remembers the day it was last
+    harvested (and its resumption token mid-harvest), so a daily run only
+    pulls what changed and a killed initial harvest picks up where it was.
+    """
+
+    def __init__(self, path: str = ARXIV_MIRROR_PATH, sets: t.Sequence[str] = ARXIV_MIRROR_SETS) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.sets = tuple(sets)
+        self.hits = 0
+        self.misses = 0
+
+        # Searches and fills both run in worker threads
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS papers (
+                id TEXT PRIMARY KEY, title TEXT NOT NULL, abstract TEXT NOT NULL, authors TEXT NOT NULL,
+                published TEXT, categories TEXT NOT NULL, fingerprint TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS papers_fingerprint ON papers (fingerprint);
+            CREATE INDEX IF NOT EXISTS papers_published ON papers (published);
+            CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5 (
+                title, abstract, authors, categories, content='papers'
+            );
+            CREATE TRIGGER IF NOT EXISTS papers_insert AFTER INSERT ON papers BEGIN
+                INSERT INTO papers_fts (rowid, title, abstract, authors, categories)
+                VALUES (new.rowid, new.title, new.abstract, new.authors, new.categories);
+            END;
+            CREATE TRIGGER IF NOT EXISTS papers_delete AFTER DELETE ON papers BEGIN
+                INSERT INTO papers_fts (papers_fts, rowid, title, abstract, authors, categories)
+                VALUES ('delete', old.rowid, old.title, old.abstract, old.authors, old.categories);
+            END;
+            CREATE TRIGGER IF NOT EXISTS papers_update AFTER UPDATE ON papers BEGIN
+                INSERT INTO papers_fts (papers_fts, rowid, title, abstract, authors, categories)
+                VALUES ('delete', old.rowid, old.title, old.abstract, old.authors, old.categories);
+                INSERT INTO papers_fts (rowid, title, abstract, authors, categories)
+                VALUES (new.rowid, new.title, new.abstract, new.authors, new.categories);
+            END;
+            CREATE TABLE IF NOT EXISTS harvests (
+                set_spec TEXT PRIMARY KEY, harvested TEXT, resumption_token TEXT
+            );
+            """
+        )
+
+    # Harvesting
+
+    def last_harvest(self) -> datetime | None:
+        # The stalest set decides whether the mirror needs a refresh
+        rows = dict(self._db.execute("SELECT set_spec, harvested FROM harvests").fetchall())
+        dates = [rows.get(set_spec) for set_spec in self.sets]
+        if not all(dates):
+            return None
+        return min(datetime.fromisoformat(d) for d in t.cast(list[str], dates))
+
+    def is_stale(self, max_age: timedelta = ARXIV_MIRROR_MAX_AGE) -> bool:
+        harvested = self.last_harvest()
+        return harvested is None or datetime.now(timezone.utc) - harvested > max_age
+
+    def _request(self, client: httpx.Client, params: dict[str, str]) -> ET.Element:
+        for attempt in range(1, OAI_MAX_RETRIES + 1):
+            response = client.get(ARXIV_OAI_URL, params=params)
+            METRICS.record("arxiv_oai", calls=1, bytes=len(response.content), errors=int(response.is_error))
+            if response.status_code != 503:
+                response.raise_for_status()
+                return ET.fromstring(response.content)
+
+            METRICS.record("arxiv_oai", retries=1)
+            delay = response.headers.get("retry-after")
+            time.sleep(float(delay) if delay and delay.isdigit() else OAI_RETRY_DELAY * attempt)
+
+        raise RuntimeError(f"arXiv OAI-PMH still busy after {OAI_MAX_RETRIES} attempts")
+
+    def _store(self, records: list[tuple[str, dict | None]]) -> None:
+        with self._lock:
+            for arxiv_id, record in records:
+                if record is None:
+                    self._db.execute("DELETE FROM papers WHERE id = ?", (arxiv_id,))
+                    continue
+                self._db.execute(
+                    "INSERT INTO papers (id, title, abstract, authors, published, categories, fingerprint) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET "
+                    "title = excluded.title, abstract = excluded.abstract, authors = excluded.authors, "
+                    "published = excluded.published, categories = excluded.categories, fingerprint = excluded.fingerprint",
+                    (
+                        arxiv_id,
+                        record["title"],
+                        record["abstract"],
+                        json.dumps(record["authors"]),
+                        record["published"],
+                        record["categories"],
+                        title_fingerprint(record["title"]),
+                    ),
+                )
+
+    def _harvest_set(self, client: httpx.Client, set_spec: str) -> int:
+        row = self._db.execute(
+            "SELECT harvested, resumption_token FROM harvests WHERE set_spec = ?", (set_spec,)
+        ).fetchone()
+        harvested, token = row if row else (None, None)
+
+        # Datestamps are days; overlapping a day is harmless, upserts are idempotent
+        params = {"verb": "ListRecords", "metadataPrefix": "arXiv", "set": set_spec}
+        if harvested:
+            params["from"] = datetime.fromisoformat(harvested).strftime("%Y-%m-%d")
+        started = datetime.now(timezone.utc).isoformat()
+
+        count = 0
+        while True:
+            root = self._request(client, {"verb": "ListRecords", "resumptionToken": token} if token else params)
+
+            error = root.find(f"{OAI_NS}error")
+            if error is not None and error.get("code") == "badResumptionToken" and token:
+                # Tokens expire - start the set over from its last harvest
+                print(f"    |- [{set_spec}] Resumption token expired, restarting")
+                token = None
+                continue
+            if error is not None and error.get("code") != "noRecordsMatch":
+                raise RuntimeError(f"arXiv OAI-PMH error for {set_spec}: {error.get('code')} {error.text}")
+
+            list_records = root.find(f"{OAI_NS}ListRecords")
+            records = [] if list_records is None else list_records.findall(f"{OAI_NS}record")
+            self._store([parsed for record in records if (parsed := _parse_record(record))])
+            count += len(records)
+
+            resumption = list_records.find(f"{OAI_NS}resumptionToken") if list_records is not None else None
+            token = (resumption.text or "").strip() if resumption is not None else None
+
+            # Commit with the token, so an interrupted harvest resumes from this page
+            with self._lock:
+                self._db.execute(
+                    "INSERT INTO harvests (set_spec, harvested, resumption_token) VALUES (?, ?, ?) "
+                    "ON CONFLICT (set_spec) DO UPDATE SET resumption_token = excluded.resumption_token",
+                    (set_spec, harvested, token or None),
+                )
+                self._db.commit()
+
+            if not token:
+                break
+
+            total = resumption.get("completeListSize") if resumption is not None else None
+            print(f"    |- [{set_spec}] {count}/{total or '?'} records")
+
+        with self._lock:
+            self._db.execute("UPDATE harvests SET harvested = ? WHERE set_spec = ?", (started, set_spec))
+            self._db.commit()
+        return count
+
+    def harvest(self) -> int:
+        """
+        Pull everything added, changed or withdrawn in each set since its
+        last harvest (everything, the first time). Returns records seen.
+        """
+
+        total = 0
+        with get_http_client("arxiv_oai", ARXIV_OAI_URL) as client:
+            for set_spec in self.sets:
+                count = self._harvest_set(client, set_spec)
+                print(f"    |- [{set_spec}] {count} records harvested")
+                total += count
+        return total
+
+    # Lookups - results have the shape arxiv_utils fills papers from
+
+    @staticmethod
+    def _row_to_dict(row: tuple) -> dict:
+        arxiv_id, title, abstract, authors, published = row
+        return {
+            "title": title,
+            "entry_id": f"http://arxiv.org/abs/{arxiv_id}",
+            "summary": abstract,
+            "authors": json.loads(authors),
+            "published": published,
+        }
+
+    def _fetch(self, sql: str, params: t.Sequence[t.Any]) -> list[tuple]:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def get(self, arxiv_id: str) -> dict | None:
+        rows = self._fetch(
+            "SELECT id, title, abstract, authors, published FROM papers WHERE id = ?", (normalize_arxiv_id(arxiv_id),)
+        )
+        self.hits += bool(rows)
+        self.misses += not rows
+        return self._row_to_dict(rows[0]) if rows else None
+
+    def get_by_title(self, title: str) -> dict | None:
+        rows = self._fetch(
+            "SELECT id, title, abstract, authors, published FROM papers WHERE fingerprint = ? "
+            "ORDER BY published DESC LIMIT 1",
+            (title_fingerprint(title),),
+        )
+        self.hits += bool(rows)
+        self.misses += not rows
+        return self._row_to_dict(rows[0]) if rows else None
+
+    def search(self, query: str, max_results: int = 10, *, by_date: bool = True) -> list[tuple[str, dict]]:
+        """
+        Full-text search with an arXiv API query, newest first (or best
+        match first), as (arxiv id, result) pairs.
+        """
+
+        order = "papers.published DESC, papers.id DESC" if by_date else "bm25(papers_fts)"
+        rows = self._fetch(
+            "SELECT papers.id, papers.title, papers.abstract, papers.authors, papers.published "
+            f"FROM papers_fts JOIN papers ON papers.rowid = papers_fts.rowid "
+            f"WHERE papers_fts MATCH ? ORDER BY {order} LIMIT ?",
+            (to_fts_query(query), max_results),
+        )
+        return [(row[0], self._row_to_dict(row)) for row in rows]
+
+    @property
+    def size(self) -> int:
+        return self._fetch("SELECT COUNT(*) FROM papers", ())[0][0]
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __str__(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses, {self.size} papers"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Harvest or query the local arXiv metadata mirror.")
+    parser.add_argument("--path", type=str, default=ARXIV_MIRROR_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("harvest", help="Pull new and changed records over OAI-PMH")
+
+    search = subparsers.add_parser("search", help="Search the mirror with an arXiv query")
+    search.add_argument("query", type=str)
+    search.add_argument("--max-results", type=int, default=10)
+
+    args = parser.parse_args()
+    mirror = ArxivMirror(args.path)
+
+    if args.command == "harvest":
+        print(f"[+] Harvesting {', '.join(mirror.sets)} into {args.path}")
+        start = time.monotonic()
+        mirror.harvest()
+        print(f"[+] {mirror.size} papers mirrored ({time.monotonic() - start:.1f}s)")
+    else:
+        for arxiv_id, result in mirror.search(args.query, args.max_results):
+            print(f" |- [{arxiv_id}] {result['title'][:80]} ({(result['published'] or '')[:10]})")
+
+    mirror.close()
+
+
+if __name__ == "__main__":
+    main()
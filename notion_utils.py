@@ -1,154 +1,475 @@
+from __future__ import annotations
+
 import asyncio
+import json
+import os
 import typing as t
-from datetime import datetime
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
 import time
 
-from notion_client import AsyncClient
-from notion_client.errors import RequestTimeoutError, APIResponseError
-from notion_client.helpers import async_collect_paginated_api
-from tqdm import tqdm  # type: ignore
+from _types import TRACKED_FIELDS, AttackType, Paper, Focus
+from http_utils import get_async_http_client, http_timeout
+from lazy_utils import lazy_import
+from metrics_utils import METRICS
+from rate_utils import TokenBucket
+
+if t.TYPE_CHECKING:
+    from notion_client import AsyncClient as NotionClient
+
+httpx = lazy_import("httpx")
+notion_client = lazy_import("notion_client")
+tqdm = lazy_import("tqdm")
 
-from _types import AttackType, Paper, Focus
+NOTION_API_URL = "https://api.notion.com"
 
 # Retry constants
 MAX_RETRIES = 5
 RETRY_DELAY = 5
-MAX_BATCH_SIZE = 5
 
-NotionClient = AsyncClient
+# Notion documents an average of 3 requests per second per integration
+NOTION_REQUESTS_PER_SECOND = 3
+NOTION_CONCURRENCY = 5
 
+# Incremental sync keeps a local copy of the database between runs
+NOTION_SNAPSHOT_DIR = ".paperstack"
+NOTION_FULL_SYNC_DAYS = 7
 
-def get_notion_client(token: str) -> NotionClient:
-    return NotionClient(auth=token, timeout_ms=60000)  # 60-second timeout
+# Property value limits enforced by the Notion API
+NOTION_TEXT_LIMIT = 2000
+NOTION_OPTION_LIMIT = 100
 
+# The columns paperstack syncs. Reads ask Notion for only these, so any
+# columns the team adds by hand never cross the wire.
+NOTION_PROPERTIES = ("Title", "URL", "Summary", "Authors", "Published", "Focus", "Attack Type", "Explored")
 
-async def get_papers_from_notion(client: NotionClient, database_id: str, *, max: int | None = None) -> list[Paper]:
-    retries = 0
-    results = []
 
+def _api_errors() -> tuple[type[Exception], ...]:
+    # Looked up when needed, so notion_client loads on first use
+    return (notion_client.errors.RequestTimeoutError, notion_client.errors.APIResponseError)
+
+
+async def _record_response(response: httpx.Response) -> None:
+    await response.aread()
+    METRICS.record("notion", calls=1, bytes=len(response.content))
+
+
+def get_notion_client(token: str, base_url: str | None = None, timeout_ms: int | None = None) -> NotionClient:
+    # notion_client takes one flat timeout, which becomes the read timeout
+    # - the pooled transport keeps connecting to the host's own
+    base_url = base_url or NOTION_API_URL
+    options = notion_client.client.ClientOptions(
+        auth=token,
+        base_url=base_url,
+        timeout_ms=timeout_ms or int(http_timeout(base_url)[1] * 1000),
+    )
+    return notion_client.AsyncClient(
+        options, client=get_async_http_client("notion", base_url, event_hooks={"response": [_record_response]})
+    )
+
+
+async def _query_pages(
+    client: NotionClient,
+    database_id: str,
+    *,
+    limiter: TokenBucket | None = None,
+    **kwargs: t.Any,
+) -> t.AsyncIterator[list[dict]]:
+    # One chunk of results per request, so callers never hold the whole
+    # database as raw JSON. A failed request is retried from its own cursor
+    # rather than starting the listing over.
+    cursor: str | None = None
+    while True:
+        retries = 0
+        while True:
+            # Every page of results counts against the shared request budget
+            if limiter:
+                await limiter.acquire()
+            try:
+                if cursor:
+                    kwargs["start_cursor"] = cursor
+                response = await client.databases.query(database_id=database_id, **kwargs)
+                break
+            except _api_errors() as e:
+                retries += 1
+                if retries >= MAX_RETRIES:
+                    METRICS.record("notion", errors=1)
+                    raise
+                METRICS.record("notion", retries=1)
+                wait_time = _retry_delay(e, retries)
+                errors = notion_client.errors
+                if limiter and isinstance(e, errors.APIResponseError) and e.code == errors.APIErrorCode.RateLimited:
+                    # Slow every caller down, as a throttled write does
+                    limiter.throttle(wait_time)
+                else:
+                    print(f"Notion API error when fetching papers, retrying ({retries}/{MAX_RETRIES}): {str(e)}")
+                    print(f"Waiting {wait_time:.1f} seconds before retry...")
+                    await asyncio.sleep(wait_time)
+
+        yield response["results"]
+
+        cursor = response.get("next_cursor")
+        if not response.get("has_more") or not cursor:
+            return
+
+
+async def _property_ids(client: NotionClient, database_id: str, limiter: TokenBucket | None = None) -> list[str] | None:
+    # filter_properties takes property ids, and only the schema maps names to them
+    if limiter:
+        await limiter.acquire()
+    try:
+        database = await client.databases.retrieve(database_id)
+    except _api_errors() as e:
+        print(f"[!] Could not read the Notion schema, fetching every property: {str(e)}")
+        return None
+
+    schema = database.get("properties") or {}
+    missing = [name for name in NOTION_PROPERTIES if name not in schema]
+    if missing:
+        print(f"[!] Notion database has no {', '.join(missing)} properties")
+    return [schema[name]["id"] for name in NOTION_PROPERTIES if name in schema]
+
+
+def _plain_text(value: dict | None, kind: str) -> str | None:
+    runs = (value or {}).get(kind) or []
+    text = "".join(run.get("plain_text") or (run.get("text") or {}).get("content") or "" for run in runs)
+    return text or None
+
+
+def _option(value: dict | None, enum: type[Focus] | type[AttackType]) -> t.Any:
+    option = (value or {}).get("select") or {}
+    try:
+        return enum(option["name"]) if option.get("name") else None
+    except ValueError:
+        # An option someone added by hand - treat it as unlabelled
+        return None
+
+
+def _page_to_paper(result: dict) -> Paper | None:
+    # Rows edited by hand can be missing properties, have empty or
+    # multi-part text, or options we don't know - none of that should stop a sync
+    properties = result.get("properties") or {}
+
+    title = _plain_text(properties.get("Title"), "title")
+    url = (properties.get("URL") or {}).get("url")
+    if not any([url, title]):
+        return None
+
+    # None when the column is missing or unreadable, rather than "not explored"
+    explored = (properties.get("Explored") or {}).get("checkbox")
+    if not isinstance(explored, bool):
+        explored = None
+
+    published = (properties.get("Published") or {}).get("date") or {}
+    try:
+        published = datetime.fromisoformat(published["start"]) if published.get("start") else None
+    except ValueError:
+        published = None
+
+    return Paper(
+        page_id=result["id"],
+        title=title,
+        url=url,
+        focus=_option(properties.get("Focus"), Focus),
+        attack_type=_option(properties.get("Attack Type"), AttackType),
+        summary=_plain_text(properties.get("Summary"), "rich_text"),
+        authors=[a["name"] for a in (properties.get("Authors") or {}).get("multi_select") or [] if a.get("name")],
+        published=published,
+        explored=explored,
+        track_changes=True,
+    )
+
+
+def _project(properties: dict) -> dict:
+    # Older snapshots (or a schema lookup that failed) carry every column
+    return {name: properties[name] for name in NOTION_PROPERTIES if name in properties}
+
+
+def get_snapshot_path(database_id: str, directory: str = NOTION_SNAPSHOT_DIR) -> str:
+    return os.path.join(directory, f"notion_{database_id.replace('-', '')}.json")
+
+
+def _load_snapshot(path: str) -> dict | None:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_snapshot(path: str, snapshot: dict) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Write then rename so a killed run can't leave a truncated snapshot
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(snapshot, f)
+    os.replace(f"{path}.tmp", path)
+
+
+async def _sync_snapshot(
+    client: NotionClient,
+    database_id: str,
+    path: str,
+    full_sync_days: float,
+    limiter: TokenBucket | None = None,
+    filter_properties: list[str] | None = None,
+) -> list[dict] | None:
+    snapshot = _load_snapshot(path)
+    now = datetime.now(timezone.utc)
+
+    query: dict[str, t.Any] = {"filter_properties": filter_properties} if filter_properties else {}
+    full_sync = snapshot is None or now - datetime.fromisoformat(snapshot["full_sync"]) > timedelta(days=full_sync_days)
+    if full_sync:
+        # Periodic full reconciliation is the only way we notice deleted pages
+        print("    |- Full sync with Notion")
+        pages: dict[str, dict] = {}
+    else:
+        assert snapshot is not None
+        pages = snapshot["pages"]
+        query["filter"] = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": snapshot["cursor"]}}
+
+    # Chunks are applied as they arrive; a failure part way returns before
+    # saving, so the snapshot on disk stays as it was
+    changed = 0
+    try:
+        async for results in _query_pages(client, database_id, limiter=limiter, **query):
+            for result in results:
+                changed += 1
+                if result.get("archived") or result.get("in_trash"):
+                    pages.pop(result["id"], None)
+                    continue
+                pages[result["id"]] = {
+                    "id": result["id"],
+                    "properties": _project(result["properties"]),
+                    "last_edited_time": result["last_edited_time"],
+                }
+    except _api_errors() as e:
+        print(f"Failed to get papers from Notion after {MAX_RETRIES} attempts: {str(e)}")
+        return None
+
+    if full_sync:
+        snapshot = {"full_sync": now.isoformat(), "pages": pages}
+    else:
+        assert snapshot is not None
+        print(f"    |- {changed} pages changed since {snapshot['cursor']}")
+        for page in pages.values():
+            page["properties"] = _project(page["properties"])
+
+    # Notion only tracks edit times to the minute, so an inclusive filter on
+    # the newest time we've seen re-fetches a handful of pages but never misses one.
+    snapshot["cursor"] = max(
+        [p["last_edited_time"] for p in pages.values()],
+        default=snapshot.get("cursor") or now.isoformat(),
+    )
+    _save_snapshot(path, snapshot)
+
+    return list(pages.values())
+
+
+async def iter_papers_from_notion(
+    client: NotionClient,
+    database_id: str,
+    *,
+    max: int | None = None,
+    limiter: TokenBucket | None = None,
+) -> t.AsyncIterator[Paper]:
+    """
+    Papers from the database as each chunk of results arrives, with only
+    the properties paperstack syncs requested.
+    """
+
+    query: dict[str, t.Any] = {"page_size": max} if max else {}
+    if filter_properties := await _property_ids(client, database_id, limiter):
+        query["filter_properties"] = filter_properties
+
+    async for results in _query_pages(client, database_id, limiter=limiter, **query):
+        for result in results:
+            if paper := _page_to_paper(result):
+                yield paper
+        if max:
+            break
+
+
+async def get_papers_from_notion(
+    client: NotionClient,
+    database_id: str,
+    *,
+    max: int | None = None,
+    snapshot_path: str | None = None,
+    full_sync_days: float = NOTION_FULL_SYNC_DAYS,
+    limiter: TokenBucket | None = None,
+) -> list[Paper]:
+    if not snapshot_path or max:
+        try:
+            return [paper async for paper in iter_papers_from_notion(client, database_id, max=max, limiter=limiter)]
+        except _api_errors() as e:
+            print(f"Failed to get papers from Notion after {MAX_RETRIES} attempts: {str(e)}")
+            return []
+
+    filter_properties = await _property_ids(client, database_id, limiter)
+    pages = await _sync_snapshot(client, database_id, snapshot_path, full_sync_days, limiter, filter_properties)
+    return [paper for page in pages or [] if (paper := _page_to_paper(page))]
+
+
+def _retry_delay(error: Exception, retries: int) -> float:
+    # Notion tells us exactly how long to wait when it rate limits us
+    errors = notion_client.errors
+    if isinstance(error, errors.APIResponseError) and error.code == errors.APIErrorCode.RateLimited:
+        retry_after = error.headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+
+    # Exponential backoff with jitter
+    return RETRY_DELAY * (2 ** (retries - 1)) + (RETRY_DELAY * 0.1 * retries)
+
+
+def _normalize(name: str, value: t.Any) -> t.Any:
+    # Shape a field the way Notion stores it, so the values we send are
+    # accepted and re-sending what we read back compares equal.
+    if value is None:
+        return None
+    if name in ("title", "summary", "url"):
+        return value.strip()[:NOTION_TEXT_LIMIT] or None
+    if name == "authors":
+        # Multi-select options can't contain commas
+        authors = [" ".join(a.replace(",", " ").split())[:NOTION_OPTION_LIMIT] for a in value]
+        return [a for a in authors if a] or None
+    if name == "published":
+        return value.astimezone(timezone.utc) if value.tzinfo else value
+    return value
+
+
+def _dirty_fields(paper: Paper) -> set[str]:
+    if not paper.page_id or not paper.track_changes:
+        return set(TRACKED_FIELDS)
+
+    return {
+        name
+        for name in paper.changed_fields()
+        if _normalize(name, getattr(paper, name)) != _normalize(name, paper.original_value(name))
+    }
+
+
+def _paper_to_properties(paper: Paper, fields: t.Collection[str] = TRACKED_FIELDS) -> dict[str, t.Any]:
+    values = {name: _normalize(name, getattr(paper, name)) for name in fields}
+
+    properties: dict[str, t.Any] = {}
+    if values.get("title"):
+        properties["Title"] = {"title": [{"text": {"content": values["title"]}}]}
+    if values.get("url"):
+        properties["URL"] = {"url": values["url"]}
+    if values.get("summary"):
+        properties["Summary"] = {
+            "rich_text": [{"text": {"content": values["summary"]}}]
+        }
+    if values.get("authors"):
+        properties["Authors"] = {
+            "multi_select": [{"name": author} for author in values["authors"]]
+        }
+    if values.get("published"):
+        properties["Published"] = {"date": {"start": values["published"].isoformat()}}
+    if values.get("focus"):
+        properties["Focus"] = {"select": {"name": values["focus"].value}}
+    if values.get("attack_type"):
+        properties["Attack Type"] = {"select": {"name": values["attack_type"].value}}
+    if values.get("explored") is not None:
+        properties["Explored"] = {"checkbox": values["explored"]}
+    return properties
+
+
+@dataclass
+class WriteSummary:
+    written: int = 0
+    skipped: int = 0
+    failed: int = 0
+    retries: int = 0
+    throttled: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.written / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.written} written, {self.skipped} unchanged, {self.failed} failed in {self.elapsed:.1f}s "
+            f"({self.throughput:.2f} pages/s, {self.retries} retries, {self.throttled} throttled)"
+        )
+
+
+async def write_paper_to_notion(
+    client: NotionClient,
+    database_id: str,
+    paper: Paper,
+    limiter: TokenBucket,
+    summary: WriteSummary,
+) -> None:
+    # Existing pages only need the properties that actually changed
+    properties = _paper_to_properties(paper, _dirty_fields(paper))
+    if not properties:
+        paper.mark_saved()
+        summary.skipped += 1
+        return
+
+    retries = 0
     while retries < MAX_RETRIES:
+        await limiter.acquire()
         try:
-            if max:
-                response = await client.databases.query(database_id=database_id, page_size=max)
-                results = response['results']
+            if paper.page_id:
+                await client.pages.update(paper.page_id, properties=properties)
             else:
-                results = await async_collect_paginated_api(
-                    client.databases.query, database_id=database_id
+                response = await client.pages.create(
+                    parent={"database_id": database_id}, properties=properties
                 )
-            break
-        except (RequestTimeoutError, APIResponseError) as e:
+                paper.page_id = response["id"]
+            paper.mark_saved()
+            limiter.recover()
+            summary.written += 1
+            return
+        except _api_errors() as e:
             retries += 1
             if retries >= MAX_RETRIES:
-                print(f"Failed to get papers from Notion after {MAX_RETRIES} attempts: {str(e)}")
-                return []
+                print(f"Failed to update/create paper after {MAX_RETRIES} attempts: {(paper.title or paper.url or '')[:50]}...")
+                # Don't raise - continue with other papers
+                summary.failed += 1
+                METRICS.record("notion", errors=1)
+                return
+
+            summary.retries += 1
+            METRICS.record("notion", retries=1)
+            wait_time = _retry_delay(e, retries)
+            errors = notion_client.errors
+            if isinstance(e, errors.APIResponseError) and e.code == errors.APIErrorCode.RateLimited:
+                # Only slow everyone down when Notion actually throttles us
+                summary.throttled += 1
+                limiter.throttle(wait_time)
             else:
-                print(f"Notion API error when fetching papers, retrying ({retries}/{MAX_RETRIES}): {str(e)}")
-                # Exponential backoff with jitter
-                wait_time = RETRY_DELAY * (2 ** (retries - 1)) + (RETRY_DELAY * 0.1 * retries)
-                print(f"Waiting {wait_time:.1f} seconds before retry...")
+                print(f"Notion API error, retrying ({retries}/{MAX_RETRIES}): {str(e)}")
                 await asyncio.sleep(wait_time)
 
-    papers: list[Paper] = []
-    for result in results:
-        page_id = result["id"]
-        properties = result["properties"]
-
-        title = properties["Title"]["title"]
-        title = title[0]["text"]["content"] if title else None
-        url = properties["URL"]["url"]
-        summary = properties["Summary"]["rich_text"]
-        summary = summary[0]["text"]["content"] if summary else None
-        authors = [author["name"] for author in properties["Authors"]["multi_select"]]
-        published = properties["Published"]["date"]
-        published = datetime.fromisoformat(published["start"]) if published else None
-        focus = properties["Focus"]["select"]
-        focus = Focus(focus["name"]) if focus else None
-        attack_type = properties["Attack Type"]["select"]
-        attack_type = AttackType(attack_type["name"]) if attack_type else None
-        explored = properties["Explored"]["checkbox"]
-
-        if not any([url, title]):
-            continue
-
-        papers.append(
-            Paper(
-                page_id=page_id,
-                title=title,
-                url=url,
-                focus=focus,
-                attack_type=attack_type,
-                summary=summary,
-                authors=authors,
-                published=published,
-                explored=explored,
-                track_changes=True,
-            )
-        )
 
-    return papers
+async def write_papers_to_notion(
+    client: NotionClient,
+    database_id: str,
+    papers: list[Paper],
+    *,
+    concurrency: int = NOTION_CONCURRENCY,
+    limiter: TokenBucket | None = None,
+) -> WriteSummary:
+    limiter = limiter or TokenBucket(NOTION_REQUESTS_PER_SECOND)
+    semaphore = asyncio.Semaphore(concurrency)
+    summary = WriteSummary()
+    progress = tqdm.tqdm(total=len(papers))
+
+    async def _bounded(paper: Paper) -> None:
+        async with semaphore:
+            await write_paper_to_notion(client, database_id, paper, limiter, summary)
+            progress.update(1)
 
+    start = time.monotonic()
+    await asyncio.gather(*[_bounded(paper) for paper in papers])
+    summary.elapsed = time.monotonic() - start
+    progress.close()
 
-async def write_papers_to_notion(
-    client: NotionClient, database_id: str, papers: list[Paper]
-) -> None:
-    # Process papers in smaller batches with pauses between
-    for i in range(0, len(papers), MAX_BATCH_SIZE):
-        batch = papers[i:i+MAX_BATCH_SIZE]
-        print(f"Processing batch {i//MAX_BATCH_SIZE + 1}/{(len(papers) + MAX_BATCH_SIZE - 1)//MAX_BATCH_SIZE}")
-
-        for paper in tqdm(batch):
-            properties: dict[str, t.Any] = {}
-            if paper.title:
-                properties["Title"] = {"title": [{"text": {"content": paper.title}}]}
-            if paper.url:
-                properties["URL"] = {"url": paper.url}
-            if paper.summary:
-                properties["Summary"] = {
-                    "rich_text": [{"text": {"content": paper.summary}}]
-                }
-            if paper.authors:
-                properties["Authors"] = {
-                    "multi_select": [{"name": author} for author in paper.authors]
-                }
-            if paper.published:
-                properties["Published"] = {"date": {"start": paper.published.isoformat()}}
-            if paper.focus:
-                properties["Focus"] = {"select": {"name": paper.focus.value}}
-            if paper.attack_type:
-                properties["Attack Type"] = {"select": {"name": paper.attack_type.value}}
-            if paper.explored is not None:
-                properties["Explored"] = {"checkbox": paper.explored}
-
-            # Retry logic with progressive backoff
-            retries = 0
-            while retries < MAX_RETRIES:
-                try:
-                    if paper.page_id:
-                        await client.pages.update(paper.page_id, properties=properties)
-                    else:
-                        await client.pages.create(
-                            parent={"database_id": database_id}, properties=properties
-                        )
-                    # Success, break out of retry loop
-                    break
-                except (RequestTimeoutError, APIResponseError) as e:
-                    retries += 1
-                    if retries >= MAX_RETRIES:
-                        print(f"Failed to update/create paper after {MAX_RETRIES} attempts: {paper.title[:50]}...")
-                        # Don't raise - continue with other papers
-                        break
-                    else:
-                        print(f"Notion API error, retrying ({retries}/{MAX_RETRIES}): {str(e)}")
-                        # Exponential backoff with longer delays
-                        wait_time = RETRY_DELAY * (2 ** (retries - 1)) + (RETRY_DELAY * 0.1 * retries)
-                        print(f"Waiting {wait_time:.1f} seconds before retry...")
-                        await asyncio.sleep(wait_time)
-
-            # Add a small delay between papers regardless of success/failure
-            await asyncio.sleep(1)
-
-        if i + MAX_BATCH_SIZE < len(papers):
-            print(f"Pausing for 10 seconds between batches...")
-            await asyncio.sleep(10)
-
-    return None
+    return summary
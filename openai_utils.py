@@ -1,7 +1,74 @@
-from _types import AttackType, Focus
-from openai import OpenAI
-
-OpenAIClient = OpenAI
+from __future__ import annotations
+
+import asyncio
+import copy
+import functools
+import json
+import os
+import typing as t
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from _types import AttackType, Focus, Paper
+from budget_utils import Reservation, SpendGovernor, usage_tokens
+from cache_utils import LLMCache
+from http_utils import get_async_http_client, get_http_client
+from lazy_utils import lazy_import
+from metrics_utils import METRICS
+from rate_utils import TokenBucket
+
+if t.TYPE_CHECKING:
+    from openai import AsyncOpenAI as AsyncOpenAIClient
+    from openai import OpenAI as OpenAIClient
+
+# openai alone takes most of a second to import
+openai = lazy_import("openai")
+tqdm = lazy_import("tqdm")
+
+# Optional - without it token counts are estimated from characters
+try:
+    tiktoken = lazy_import("tiktoken")
+except ModuleNotFoundError:
+    tiktoken = None
+
+OPENAI_API_URL = "https://api.openai.com/v1"
+
+# Rate limiting constants (tier 1 defaults for gpt-4o-mini)
+OPENAI_CONCURRENCY = 16
+OPENAI_REQUESTS_PER_MINUTE = 500
+OPENAI_TOKENS_PER_MINUTE = 200_000
+MAX_RETRIES = 5
+
+# Batch API state lives next to the run so a later invocation can resume it
+OPENAI_BATCH_STATE = ".paperstack/openai_batch.json"
+
+# Abstracts are trimmed to this many tokens before they're sent. Real ones
+# are 150-350 tokens; this only bites on pasted full text and the like.
+OPENAI_INPUT_TOKENS = 512
+
+# Fallback when tiktoken isn't available (or can't load its encoding)
+CHARS_PER_TOKEN = 4
+
+# Per-message framing the API adds on top of the content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@dataclass
+class TaskConfig:
+    model: str
+    max_tokens: int
+    temperature: float = 0.5
+    input_tokens: int = OPENAI_INPUT_TOKENS
+
+
+# Each kind of request can use its own model (--openai-model task=model)
+OPENAI_TASKS: dict[str, TaskConfig] = {
+    "enrich": TaskConfig("gpt-4o-mini", max_tokens=200),
+    "relevance": TaskConfig("gpt-4o-mini", max_tokens=1, temperature=0),
+    "summarize": TaskConfig("gpt-4o-mini", max_tokens=100),
+    "focus": TaskConfig("gpt-3.5-turbo", max_tokens=10),
+    "attack_type": TaskConfig("gpt-3.5-turbo", max_tokens=10),
+}
 
 SUMMARIZE_ABSTRACT_PROMPT = """\
 You will be provided with an abstract of a scientific paper. \
@@ -87,71 +154,713 @@ If you feel like none of the types apply, you can respond with "Other".
 Respond with ONLY ONE of the labels above. Do not include anything else in your response.
 """
 
-# Model Evasion
-# Model Extraction
-# Model Inversion
-# Model Poisoning
-# Prompt Injection
+RELEVANCE_PROMPT = """\
+You will be provided with the title and abstract of a scientific paper. \
+Answer "yes" if it belongs in a reading list on the topic below, otherwise "no". \
+Answer with a single word.
 
-def get_openai_client(token: str) -> OpenAIClient:
-    return OpenAI(api_key=token)
+Topic: {topic}
+"""
 
+ENRICH_PAPER_PROMPT = """\
+You will be provided with an abstract of a scientific paper. Respond with \
+a JSON object containing the fields below.
+"""
 
-def summarize_abstract_with_openai(client: OpenAIClient, abstract: str) -> str:
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": SUMMARIZE_ABSTRACT_PROMPT},
-            {"role": "user", "content": f"{abstract}"},
-        ],
-        temperature=0.5,
-        max_tokens=100,
-    )
+# Only the fields a paper is missing are asked for, so each has its own
+# instructions and schema
+ENRICH_FIELD_PROMPTS = {
+    "summary": """\
+`summary`: Compress the abstract in 1-2 sentences. Use very concise language \
+usable as bullet points on a slide deck.
+""",
+    "focus": """\
+`focus`: The most applicable focus label based on the target audience, \
+research focus, produced materials, and key outcomes. One of:
 
-    return response.choices[0].message.content.strip()  # type: ignore
+{labels}
+""",
+    "attack_type": """\
+`attack_type`: The most applicable attack type label based on the research \
+focus, produced materials, and key outcomes. If none of the types apply, use "Other". One of:
 
+{types}
+""",
+}
 
-def get_focus_label_from_abstract(client: OpenAIClient, abstract: str) -> Focus | None:
-    system_prompt = ASSIGN_LABEL_PROMPT.format(
-        labels="\n".join([f"- {f.value}" for f in Focus])
-    )
+ENRICH_FIELD_SCHEMAS = {
+    "summary": {"type": "string"},
+    "focus": {"type": "string", "enum": [f.value for f in Focus]},
+    "attack_type": {"type": "string", "enum": [t.value for t in AttackType]},
+}
+
+ENRICH_FIELDS = tuple(ENRICH_FIELD_SCHEMAS)
+
+# System prompts are built once, so every request for a task starts with
+# byte-identical text (and schema) and only the abstract at the end varies -
+# that's the shape OpenAI's prefix-based prompt caching can reuse.
+
+FOCUS_LABELS = "\n".join([f"- {f.value}" for f in Focus])
+ATTACK_TYPE_LABELS = "\n".join([f"- `{t.value}`: {ATTACK_TYPE_DESCRIPTIONS[t]}" for t in AttackType])
+
+ASSIGN_LABEL_SYSTEM_PROMPT = ASSIGN_LABEL_PROMPT.format(labels=FOCUS_LABELS)
+ASSIGN_ATTACK_TYPE_SYSTEM_PROMPT = ASSIGN_ATTACK_TYPE_PROMPT.format(types=ATTACK_TYPE_LABELS)
+ENRICH_FIELD_SYSTEM_PROMPTS = {
+    field: prompt.format(labels=FOCUS_LABELS, types=ATTACK_TYPE_LABELS)
+    for field, prompt in ENRICH_FIELD_PROMPTS.items()
+}
+
+
+def configure_tasks(models: dict[str, str] | None = None, *, input_tokens: int | None = None) -> None:
+    for task, model in (models or {}).items():
+        if task not in OPENAI_TASKS:
+            raise ValueError(f"Unknown OpenAI task '{task}' (expected one of {', '.join(OPENAI_TASKS)})")
+        OPENAI_TASKS[task].model = model
+    if input_tokens is not None:
+        for config in OPENAI_TASKS.values():
+            config.input_tokens = input_tokens
 
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
+
+@functools.cache
+def _encoding(model: str) -> t.Any:
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # Encodings are downloaded on first use, which fails offline
+        print(f"[!] No tokenizer for {model}, estimating token counts: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    if encoding := _encoding(model):
+        return len(encoding.encode(text, disallowed_special=()))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def trim_to_tokens(text: str, max_tokens: int, model: str) -> str:
+    if encoding := _encoding(model):
+        tokens = encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens]).rstrip()
+
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    # Cut at a word boundary when there is one
+    return text[:limit].rsplit(maxsplit=1)[0] if " " in text[:limit] else text[:limit]
+
+
+def _task_request(task: str, system_prompt: str, text: str, **extra: t.Any) -> dict:
+    config = OPENAI_TASKS[task]
+    return {
+        "model": config.model,
+        "messages": [
             {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"{abstract}"},
+            {"role": "user", "content": trim_to_tokens(text, config.input_tokens, config.model)},
         ],
-        temperature=0.5,
-        max_tokens=10,
+        "temperature": config.temperature,
+        "max_tokens": config.max_tokens,
+        **extra,
+    }
+
+
+def request_tokens(request: dict) -> int:
+    # Prompt tokens a request will be billed for (near enough)
+    model = request["model"]
+    tokens = sum(count_tokens(m["content"], model) + MESSAGE_OVERHEAD_TOKENS for m in request["messages"])
+    if response_format := request.get("response_format"):
+        tokens += _schema_tokens(json.dumps(response_format, sort_keys=True), model)
+    return tokens
+
+
+@functools.cache
+def _schema_tokens(schema: str, model: str) -> int:
+    return count_tokens(schema, model)
+
+
+class OpenAILimiter:
+    """
+    Requests and tokens per minute, limited separately, so each call has
+    to clear both buckets before it goes out. Everything sending chat
+    completions on the same account should share one.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = OPENAI_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = OPENAI_TOKENS_PER_MINUTE,
+    ) -> None:
+        self.requests = TokenBucket(requests_per_minute / 60, capacity=requests_per_minute / 6)
+        self.tokens = TokenBucket(tokens_per_minute / 60, capacity=tokens_per_minute / 6)
+
+    async def acquire(self, request: dict) -> None:
+        await self.requests.acquire()
+        await self.tokens.acquire(request_tokens(request) + request["max_tokens"])
+
+    def throttle(self, retry_after: float) -> None:
+        self.requests.throttle(retry_after)
+        self.tokens.throttle(retry_after)
+
+    def recover(self) -> None:
+        self.requests.recover()
+        self.tokens.recover()
+
+
+def _retry_after(error: openai.RateLimitError, attempt: int) -> float:
+    return float(error.response.headers.get("retry-after", 2**attempt))
+
+
+def _api_url(base_url: str | None) -> str:
+    return base_url or os.environ.get("OPENAI_BASE_URL") or OPENAI_API_URL
+
+
+def get_openai_client(token: str, base_url: str | None = None) -> OpenAIClient:
+    http_client = get_http_client("openai", _api_url(base_url), follow_redirects=True)
+    return openai.OpenAI(api_key=token, base_url=base_url, http_client=http_client)
+
+
+def get_async_openai_client(token: str, base_url: str | None = None) -> AsyncOpenAIClient:
+    # A plain httpx client (which the SDK accepts) rather than its own
+    # DefaultAsyncHttpxClient, so requests go through the shared pool
+    http_client = get_async_http_client("openai", _api_url(base_url), follow_redirects=True)
+    return openai.AsyncOpenAI(api_key=token, base_url=base_url, http_client=http_client)
+
+
+def _record_usage(usage: t.Any) -> None:
+    prompt_tokens, completion_tokens, cached_tokens = usage_tokens(usage)
+    METRICS.record(
+        "openai",
+        calls=1,
+        prompt_tokens=prompt_tokens,
+        cached_tokens=cached_tokens,
+        completion_tokens=completion_tokens,
     )
 
-    content = response.choices[0].message.content.strip()  # type: ignore
+
+def _complete(client: OpenAIClient, request: dict, cache: LLMCache | None = None) -> str:
+    key = LLMCache.key(request) if cache else None
+    if cache and key and (cached := cache.get(key)) is not None:
+        return cached
+
+    response = client.chat.completions.create(**request)
+    _record_usage(response.usage)
+    content = response.choices[0].message.content  # type: ignore
+
+    if cache and key:
+        cache.set(key, content)
+    return content
+
+
+async def _acomplete(
+    client: AsyncOpenAIClient,
+    request: dict,
+    cache: LLMCache | None = None,
+    *,
+    governor: SpendGovernor | None = None,
+    limiter: OpenAILimiter | None = None,
+) -> str | None:
+    # None means the spend ceiling left no room for this request
+    key = LLMCache.key(request) if cache else None
+    if cache and key and (cached := cache.get(key)) is not None:
+        return cached
+
+    reservation: Reservation | None = None
+    if governor:
+        reservation = governor.reserve(request["model"], request_tokens(request), request["max_tokens"])
+        if reservation is None:
+            return None
+
+    try:
+        if limiter:
+            await limiter.acquire(request)
+        response = await client.chat.completions.create(**request)
+    except BaseException:
+        if governor and reservation:
+            governor.release(reservation)
+        raise
+
+    if limiter:
+        limiter.recover()
+    _record_usage(response.usage)
+    if governor and reservation:
+        governor.settle(reservation, request["model"], response.usage)
+    content = response.choices[0].message.content  # type: ignore
+
+    if cache and key:
+        cache.set(key, content)
+    return content
+
+
+def summarize_abstract_with_openai(client: OpenAIClient, abstract: str, *, cache: LLMCache | None = None) -> str:
+    request = _task_request("summarize", SUMMARIZE_ABSTRACT_PROMPT, abstract)
+    return _complete(client, request, cache).strip()
+
+
+def get_focus_label_from_abstract(client: OpenAIClient, abstract: str, *, cache: LLMCache | None = None) -> Focus | None:
+    request = _task_request("focus", ASSIGN_LABEL_SYSTEM_PROMPT, abstract)
+    content = _complete(client, request, cache).strip()
     if content not in [f.value for f in Focus]:
         return None
 
     return Focus(content)
 
-def get_attack_type_from_abstract(client: OpenAIClient, abstract: str) -> AttackType | None:
-    system_prompt = ASSIGN_ATTACK_TYPE_PROMPT.format(
-        types="\n".join([f"- `{t.value}`: {ATTACK_TYPE_DESCRIPTIONS[t]}" for t in AttackType])
+def get_attack_type_from_abstract(client: OpenAIClient, abstract: str, *, cache: LLMCache | None = None) -> AttackType | None:
+    request = _task_request("attack_type", ASSIGN_ATTACK_TYPE_SYSTEM_PROMPT, abstract)
+    content = _complete(client, request, cache).strip()
+    content = content.strip("`")
+
+    if content not in [t.value for t in AttackType]:
+        print(f"Invalid attack type: {content}")
+        return None
+
+    return AttackType(content)
+
+
+@dataclass
+class Enrichment:
+    summary: str | None = None
+    focus: Focus | None = None
+    attack_type: AttackType | None = None
+
+
+def _parse_enrichment(content: str | None) -> Enrichment:
+    # ValueError for anything that isn't the JSON object we asked for
+    data = json.loads(content or "null")
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object, got {content!r:.50}")
+    return _enrichment_from(data)
+
+
+def _enrichment_from(data: dict) -> Enrichment:
+    # Labels we don't know come back as None
+    focus = data.get("focus")
+    attack_type = data.get("attack_type")
+    return Enrichment(
+        summary=(data.get("summary") or "").strip() or None,
+        focus=Focus(focus) if focus in [f.value for f in Focus] else None,
+        attack_type=AttackType(attack_type) if attack_type in [t.value for t in AttackType] else None,
     )
 
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"{abstract}"},
-        ],
-        temperature=0.5,
-        max_tokens=10,
+
+def _enrichment_request(abstract: str, fields: t.Sequence[str] = ENRICH_FIELDS) -> dict:
+    # Shared between live calls and Batch API request lines
+    system_prompt = "\n".join([ENRICH_PAPER_PROMPT, *(ENRICH_FIELD_SYSTEM_PROMPTS[f] for f in fields)])
+    schema = {
+        "type": "object",
+        "properties": {f: ENRICH_FIELD_SCHEMAS[f] for f in fields},
+        "required": list(fields),
+        "additionalProperties": False,
+    }
+    response_format = {
+        "type": "json_schema",
+        "json_schema": {"name": "paper_enrichment", "strict": True, "schema": schema},
+    }
+    return _task_request("enrich", system_prompt, abstract, response_format=response_format)
+
+
+def _field_cache_keys(reference: str, fields: t.Sequence[str]) -> dict[str, str]:
+    # Each field is cached on its own instructions alone, so editing one
+    # attack type description only misses for attack types
+    config = OPENAI_TASKS["enrich"]
+    text = trim_to_tokens(reference, config.input_tokens, config.model)
+    return {
+        field: LLMCache.key(
+            {
+                "model": config.model,
+                "temperature": config.temperature,
+                "instructions": [ENRICH_PAPER_PROMPT, ENRICH_FIELD_SYSTEM_PROMPTS[field]],
+                "schema": ENRICH_FIELD_SCHEMAS[field],
+                "text": text,
+            }
+        )
+        for field in fields
+    }
+
+
+def _cached_fields(cache: LLMCache, keys: dict[str, str]) -> Enrichment:
+    # Whatever fields are cached - an entry that no longer parses is a miss
+    return _enrichment_from({field: value for field, key in keys.items() if (value := cache.get(key)) is not None})
+
+
+def _cache_fields(cache: LLMCache, keys: dict[str, str], enrichment: Enrichment) -> None:
+    for field, key in keys.items():
+        if value := getattr(enrichment, field):
+            cache.set(key, getattr(value, "value", value))
+
+
+async def enrich_abstract_with_openai(
+    client: AsyncOpenAIClient,
+    abstract: str,
+    *,
+    cache: LLMCache | None = None,
+    governor: SpendGovernor | None = None,
+) -> Enrichment | None:
+    content = await _acomplete(client, _enrichment_request(abstract), cache, governor=governor)
+    try:
+        return _parse_enrichment(content) if content else None
+    except ValueError as e:
+        print(f"[!] Invalid enrichment response: {e}")
+        return None
+
+
+@functools.cache
+def _relevance_prompt(topic: str) -> str:
+    return RELEVANCE_PROMPT.format(topic=topic)
+
+
+async def is_relevant_with_openai(
+    client: AsyncOpenAIClient,
+    text: str,
+    topic: str,
+    *,
+    cache: LLMCache | None = None,
+    governor: SpendGovernor | None = None,
+    limiter: OpenAILimiter | None = None,
+) -> bool:
+    request = _task_request("relevance", _relevance_prompt(topic), text)
+
+    error: openai.OpenAIError | None = None
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            content = await _acomplete(client, request, cache, governor=governor, limiter=limiter)
+            # Over the spend ceiling we keep the paper too
+            return content is None or not content.strip().lower().startswith("no")
+        except openai.RateLimitError as e:
+            error = e
+            if not limiter:
+                break
+            METRICS.record("openai", retries=1)
+            limiter.throttle(_retry_after(e, attempt))
+        except openai.OpenAIError as e:
+            error = e
+            break
+
+    # Fail open - a stray paper is cheaper than a lost one
+    METRICS.record("openai", errors=1)
+    print(f"[!] Relevance check failed: {error}")
+    return True
+
+
+def missing_fields(paper: Paper) -> tuple[str, ...]:
+    # What's left to ask for - labels can come from kNN or Notion, and a
+    # summary only makes sense with an abstract to compress
+    if not (paper.abstract or paper.summary):
+        return ()
+    missing = {
+        "summary": bool(paper.abstract and not paper.summary),
+        "focus": not paper.focus,
+        "attack_type": not paper.attack_type,
+    }
+    return tuple(field for field in ENRICH_FIELDS if missing[field])
+
+
+def needs_enrichment(paper: Paper) -> bool:
+    return bool(missing_fields(paper))
+
+
+def apply_enrichment(paper: Paper, enrichment: Enrichment) -> None:
+    # Only fill gaps - never overwrite values someone set in Notion
+    if not paper.summary and enrichment.summary:
+        paper.summary = enrichment.summary
+    if not paper.focus:
+        paper.focus = enrichment.focus
+    if not paper.attack_type:
+        paper.attack_type = enrichment.attack_type
+
+
+def get_paper_enricher(
+    client: AsyncOpenAIClient,
+    *,
+    concurrency: int = OPENAI_CONCURRENCY,
+    requests_per_minute: int = OPENAI_REQUESTS_PER_MINUTE,
+    tokens_per_minute: int = OPENAI_TOKENS_PER_MINUTE,
+    cache: LLMCache | None = None,
+    governor: SpendGovernor | None = None,
+    limiter: OpenAILimiter | None = None,
+) -> t.Callable[[Paper], t.Awaitable[None]]:
+    """
+    Build a coroutine function that enriches one paper at a time while
+    sharing rate limits and concurrency across every call - for callers
+    that stream papers in rather than holding a full list. Pass a
+    `limiter` to share the rate limits with other requests too.
+    """
+
+    limiter = limiter or OpenAILimiter(requests_per_minute, tokens_per_minute)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    # One completion per distinct request for the enricher's lifetime, so
+    # the same abstract arriving twice (e.g. from two topic databases at
+    # once) waits on the first call instead of making its own
+    completions: dict[str, asyncio.Future[Enrichment | None]] = {}
+
+    async def _enrich(paper: Paper) -> None:
+        reference = paper.abstract or paper.summary
+        if not reference:
+            return
+
+        # Cache hits don't need to wait on the rate limiters, and only
+        # the fields still missing after them are asked for
+        field_keys = _field_cache_keys(reference, missing_fields(paper)) if cache else {}
+        if cache:
+            apply_enrichment(paper, _cached_fields(cache, field_keys))
+        if not (fields := missing_fields(paper)):
+            return
+
+        request = _enrichment_request(reference, fields)
+        key = LLMCache.key(request)
+        if key in completions:
+            if enrichment := await completions[key]:
+                apply_enrichment(paper, enrichment)
+            return
+
+        completion: asyncio.Future[Enrichment | None] = asyncio.get_running_loop().create_future()
+        completions[key] = completion
+        enrichment: Enrichment | None = None
+        try:
+            async with semaphore:
+                for attempt in range(1, MAX_RETRIES + 1):
+                    try:
+                        content = await _acomplete(client, request, governor=governor, limiter=limiter)
+                        if content is None:
+                            # Out of budget - the paper goes out unenriched
+                            break
+                        enrichment = _parse_enrichment(content)
+                        apply_enrichment(paper, enrichment)
+                        if cache:
+                            _cache_fields(cache, {f: field_keys[f] for f in fields}, enrichment)
+                        break
+                    except openai.RateLimitError as e:
+                        METRICS.record("openai", retries=1)
+                        limiter.throttle(_retry_after(e, attempt))
+                    except (openai.OpenAIError, ValueError) as e:
+                        METRICS.record("openai", errors=1)
+                        print(f"[!] Failed to enrich \"{(paper.title or '')[:50]}\": {e}")
+                        enrichment = None
+                        break
+                else:
+                    METRICS.record("openai", errors=1)
+                    title = (paper.title or "")[:50]
+                    print(f"[!] Failed to enrich \"{title}\": still rate limited after {MAX_RETRIES} attempts")
+        finally:
+            completion.set_result(enrichment)
+
+    return _enrich
+
+
+async def enrich_papers_with_openai(
+    client: AsyncOpenAIClient,
+    papers: list[Paper],
+    *,
+    concurrency: int = OPENAI_CONCURRENCY,
+    requests_per_minute: int = OPENAI_REQUESTS_PER_MINUTE,
+    tokens_per_minute: int = OPENAI_TOKENS_PER_MINUTE,
+    cache: LLMCache | None = None,
+    governor: SpendGovernor | None = None,
+) -> None:
+    enrich = get_paper_enricher(
+        client,
+        concurrency=concurrency,
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+        cache=cache,
+        governor=governor,
     )
+    progress = tqdm.tqdm(total=len(papers))
 
-    content = response.choices[0].message.content.strip()  # type: ignore
-    content = content.strip("`")
+    async def _tracked(paper: Paper) -> None:
+        await enrich(paper)
+        progress.update(1)
 
-    if content not in [t.value for t in AttackType]:
-        print(f"Invalid attack type: {content}")
+    await asyncio.gather(*[_tracked(paper) for paper in papers])
+    progress.close()
+
+
+def enrichment_keys(paper: Paper) -> list[str]:
+    # Papers from arXiv search don't have a page_id until they're written,
+    # so results can come back keyed by either one.
+    keys: list[str] = []
+    if paper.page_id:
+        keys.append(paper.page_id)
+    if paper.arxiv_id:
+        keys.append(f"arxiv:{paper.arxiv_id}")
+    return keys
+
+
+def _load_batch_state(path: str) -> dict | None:
+    if not os.path.exists(path):
         return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_batch_state(path: str, state: dict) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(state, f, indent=2)
+
+
+async def submit_enrichment_batch(
+    client: AsyncOpenAIClient, papers: list[Paper], path: str, *, governor: SpendGovernor | None = None
+) -> tuple[str, dict[str, dict[str, str]]] | None:
+    lines: list[str] = []
+    cache_keys: dict[str, dict[str, str]] = {}
+    seen: set[str] = set()
+    for paper in papers:
+        keys = enrichment_keys(paper)
+        reference = paper.abstract or paper.summary
+        if not keys or not reference or keys[0] in seen:
+            continue
+        fields = missing_fields(paper)
+        request = _enrichment_request(reference, fields)
+        # Submitted requests are spent as far as this run is concerned
+        if governor and not governor.reserve(
+            request["model"], request_tokens(request), request["max_tokens"], batch=True
+        ):
+            break
+        seen.add(keys[0])
+        cache_keys[keys[0]] = _field_cache_keys(reference, fields)
+        lines.append(
+            json.dumps(
+                {
+                    "custom_id": keys[0],
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": request,
+                }
+            )
+        )
+
+    if not lines:
+        return None
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
 
-    return AttackType(content)
\ No newline at end of file
+    with open(path, "rb") as f:
+        input_file = await client.files.create(file=f, purpose="batch")
+
+    batch = await client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    return batch.id, cache_keys
+
+
+def _parse_batch_output(
+    content: str,
+    cache: LLMCache | None = None,
+    cache_keys: dict[str, dict[str, str]] | None = None,
+    *,
+    governor: SpendGovernor | None = None,
+) -> dict[str, Enrichment]:
+    enrichments: dict[str, Enrichment] = {}
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+
+        record = json.loads(line)
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            print(f"[!] Batch request {record.get('custom_id')} failed: {record.get('error')}")
+            continue
+
+        try:
+            usage = response["body"].get("usage")
+            _record_usage(usage)
+            if governor:
+                governor.record(response["body"].get("model", OPENAI_TASKS["enrich"].model), usage, batch=True)
+            content = response["body"]["choices"][0]["message"]["content"]
+            enrichment = enrichments[record["custom_id"]] = _parse_enrichment(content)
+            # State from before per-field caching holds one key per request
+            field_keys = (cache_keys or {}).get(record["custom_id"])
+            if cache and isinstance(field_keys, dict):
+                _cache_fields(cache, field_keys, enrichment)
+        except (KeyError, IndexError, ValueError) as e:
+            print(f"[!] Invalid batch response for {record.get('custom_id')}: {e}")
+
+    return enrichments
+
+
+def _cached_enrichments(papers: list[Paper], cache: LLMCache) -> tuple[dict[str, Enrichment], list[Paper]]:
+    # Cached fields by enrichment key, and the papers that still have
+    # fields to ask for (as copies, with the cached ones filled in)
+    cached: dict[str, Enrichment] = {}
+    remaining: list[Paper] = []
+    for paper in papers:
+        reference = paper.abstract or paper.summary
+        if not reference:
+            continue
+        enrichment = _cached_fields(cache, _field_cache_keys(reference, missing_fields(paper)))
+        if enrichment != Enrichment():
+            for key in enrichment_keys(paper):
+                cached[key] = enrichment
+            paper = copy.copy(paper)
+            apply_enrichment(paper, enrichment)
+        if needs_enrichment(paper):
+            remaining.append(paper)
+    return cached, remaining
+
+
+async def process_enrichment_batch(
+    client: AsyncOpenAIClient,
+    papers: list[Paper],
+    state_path: str = OPENAI_BATCH_STATE,
+    *,
+    cache: LLMCache | None = None,
+    governor: SpendGovernor | None = None,
+) -> dict[str, Enrichment] | None:
+    """
+    Drive the Batch API across runs. The first call submits a batch and
+    persists its id; later calls poll it and return the results keyed by
+    `enrichment_keys` once it completes. Cached results are returned
+    straight away instead of being submitted; None means nothing is
+    ready to apply yet.
+    """
+
+    state = _load_batch_state(state_path)
+    if state:
+        batch = await client.batches.retrieve(state["batch_id"])
+        if batch.status in ("validating", "in_progress", "finalizing"):
+            counts = batch.request_counts
+            progress = f" ({counts.completed}/{counts.total})" if counts else ""
+            print(f"    |- Batch {batch.id} is {batch.status}{progress}")
+            # Anything we've already answered is applied straight away,
+            # even while a batch is still running
+            return (_cached_enrichments(papers, cache)[0] if cache else {}) or None
+
+        os.remove(state_path)
+        if batch.status == "completed" and batch.output_file_id:
+            content = await client.files.content(batch.output_file_id)
+            # Parsed first, so the cache then holds the batch's fields
+            # together with any answered before it was submitted
+            results = _parse_batch_output(content.text, cache, state.get("cache_keys"), governor=governor)
+            return {**results, **(_cached_enrichments(papers, cache)[0] if cache else {})}
+
+        print(f"[!] Batch {batch.id} ended with status {batch.status}, resubmitting")
+
+    # Cached fields don't go in the batch
+    input_path = os.path.join(os.path.dirname(state_path) or ".", "openai_batch_input.jsonl")
+    cached, remaining = _cached_enrichments(papers, cache) if cache else ({}, papers)
+    if cached:
+        print(f"    |- {len(remaining)} papers left after cache hits")
+
+    submitted = await submit_enrichment_batch(client, remaining, input_path, governor=governor)
+    if submitted:
+        batch_id, cache_keys = submitted
+        _save_batch_state(
+            state_path,
+            {
+                "batch_id": batch_id,
+                "submitted": datetime.now(timezone.utc).isoformat(),
+                "cache_keys": cache_keys,
+            },
+        )
+        print(f"    |- Submitted batch {batch_id} for {len(cache_keys)} papers")
+
+    return cached or None
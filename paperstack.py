@@ -1,21 +1,94 @@
+from __future__ import annotations
+
 import argparse
 import asyncio
 import os
+import time
+import typing as t
+from collections import Counter
+from dataclasses import dataclass, field, replace
 from datetime import datetime
 
-from arxiv_utils import fill_papers_with_arxiv, search_arxiv_as_paper
+from _types import Paper, PaperIndex
+from arxiv_utils import (
+    ARXIV_WATERMARK_PATH,
+    fill_papers_with_arxiv,
+    iter_arxiv_as_paper,
+    load_arxiv_watermark,
+    save_arxiv_watermark,
+)
+from budget_utils import SpendGovernor
+from cache_utils import LLM_CACHE_PATH, RESPONSE_CACHE_PATH, LLMCache, ResponseCache
+from checkpoint_utils import CHECKPOINT_PATH, Checkpoint
+from config_utils import Target, load_targets, make_target
+from embedding_utils import (
+    EMBEDDING_CACHE_PATH,
+    KNN_BATCH_SIZE,
+    EmbeddingCache,
+    EmbeddingIndex,
+    embed_papers,
+    paper_text,
+    propagate_labels,
+    rank_by_similarity,
+)
+from http_utils import configure_http, connection_summary
+from lazy_utils import lazy_import
+from metrics_utils import METRICS
+from mirror_utils import ARXIV_MIRROR_PATH, ArxivMirror
 from notion_utils import (
+    NOTION_CONCURRENCY,
+    NOTION_FULL_SYNC_DAYS,
+    NOTION_REQUESTS_PER_SECOND,
+    WriteSummary,
     get_notion_client,
+    get_snapshot_path,
     get_papers_from_notion,
-    write_papers_to_notion,
+    write_paper_to_notion,
 )
 from openai_utils import (
-    get_attack_type_from_abstract,
-    get_focus_label_from_abstract,
-    get_openai_client,
-    summarize_abstract_with_openai,
+    OPENAI_CONCURRENCY,
+    OPENAI_INPUT_TOKENS,
+    OPENAI_REQUESTS_PER_MINUTE,
+    OPENAI_BATCH_STATE,
+    OPENAI_TASKS,
+    OPENAI_TOKENS_PER_MINUTE,
+    OpenAILimiter,
+    apply_enrichment,
+    configure_tasks,
+    enrichment_keys,
+    get_async_openai_client,
+    get_paper_enricher,
+    is_relevant_with_openai,
+    needs_enrichment,
+    process_enrichment_batch,
+)
+from pipeline_utils import SharedSource, Stage, iter_in_thread, iter_list, run_pipeline, timed
+from rate_utils import TokenBucket
+from relevance_utils import (
+    RELEVANCE_LLM_BAND,
+    RELEVANCE_MIN_CORPUS,
+    RELEVANCE_REJECTED_PATH,
+    RELEVANCE_THRESHOLD,
+    RelevanceModel,
+    index_rejected,
+    load_rejected,
+    reject,
+    save_rejected,
+)
+from scholar_utils import (
+    S2_CONCURRENCY,
+    S2_FRONTIER_PATH,
+    S2_REQUEST_BUDGET,
+    S2_SEED_BATCH_SIZE,
+    Crawler,
+    Recommender,
 )
-from scholar_utils import get_recommended_arxiv_ids_from_semantic_scholar
+
+if t.TYPE_CHECKING:
+    from notion_utils import NotionClient
+    from openai_utils import AsyncOpenAIClient
+
+httpx = lazy_import("httpx")
 
 ARXIV_SEARCH = """\
 "adversarial attacks" OR "language model attacks" OR "LLM vulnerabilities" OR \
@@ -23,6 +96,341 @@ ARXIV_SEARCH = """\
 """
 
 
+@dataclass
+class Shared:
+    notion_client: NotionClient
+    notion_limiter: TokenBucket
+    openai_client: AsyncOpenAIClient
+    openai_limiter: OpenAILimiter
+    enrich: t.Callable[[Paper], t.Awaitable[None]]
+    governor: SpendGovernor
+    llm_cache: LLMCache | None
+    response_cache: ResponseCache | None
+    embedding_cache: EmbeddingCache | None
+    arxiv_mirror: ArxivMirror | None
+
+    # How many targets run each arXiv query, and the one search per query
+    search_users: Counter[str]
+    searches: dict[str, SharedSource] = field(default_factory=dict)
+    multiple: bool = False
+
+
+def shared_search(
+    searches: dict[str, SharedSource], query: str, start: t.Callable[[], t.AsyncIterator[Paper]]
+) -> SharedSource:
+    # Shared by query string only - different queries that overlap still
+    # search separately, and only their enrichment and writes are deduped
+    if query not in searches:
+        searches[query] = SharedSource(start())
+    return searches[query]
+
+
+def save_watermarks(searches: dict[str, SharedSource], unwritten: set[str], path: str) -> None:
+    # Only move the watermarks once everything found is safely in Notion,
+    # for every target sharing the search - the rest is found again next run
+    for query, search in searches.items():
+        if query in unwritten:
+            print(f"[!] Not moving the arXiv watermark for {query[:40]!r}, some papers weren't written")
+        elif search.papers and (newest_arxiv_id := search.papers[0].arxiv_id):
+            save_arxiv_watermark(query, newest_arxiv_id, path)
+
+
+async def run_target(args: argparse.Namespace, target: Target, shared: Shared) -> bool:
+    # Returns whether every paper made it into Notion
+    notion_client = shared.notion_client
+    openai_client = shared.openai_client
+    notion_limiter = shared.notion_limiter
+    llm_cache = shared.llm_cache
+    response_cache = shared.response_cache
+    embedding_cache = shared.embedding_cache
+    enrich = shared.enrich
+    governor = shared.governor
+    arxiv_mirror = shared.arxiv_mirror
+
+    # Output from concurrent targets interleaves, so label it
+    tag = f"[{target.name}] " if shared.multiple else ""
+
+    checkpoint = Checkpoint(target.checkpoint, resume=args.resume)
+
+    with METRICS.stage("notion_read"):
+        print(f" |- {tag}Getting papers from Notion [{target.database_id}]")
+        papers = await get_papers_from_notion(
+            notion_client,
+            target.database_id,
+            snapshot_path=get_snapshot_path(target.database_id) if args.incremental else None,
+            full_sync_days=args.full_sync_days,
+            limiter=notion_limiter,
+        )
+        print(f"    |- {len(papers)} existing papers")
+
+    if checkpoint.entries:
+        restored = checkpoint.restore(papers)
+        papers.extend(restored)
+        print(f" |- {tag}Resumed {len(checkpoint.entries)} unsaved papers ({len(restored)} new)")
+
+    for p in papers:
+        if p.published and p.published < datetime.fromisoformat("2024-07-01 00:00:00+00:00"):
+            p.explored = True
+
+        if len(p.authors) > 5:
+            p.authors = p.authors[:5]
+
+    if not checkpoint.done("arxiv_fill") and not all([p.has_arxiv_props() for p in papers]):
+        with METRICS.stage("arxiv_fill"):
+            print(f" |- {tag}Filling in missing data from arXiv")
+            # arxiv pages with blocking sleeps, so keep it off the loop
+            papers = await asyncio.to_thread(fill_papers_with_arxiv, papers, cache=response_cache, mirror=arxiv_mirror)
+            checkpoint.save(papers, stage="arxiv_fill")
+
+    index = PaperIndex(papers)
+
+    relevance: RelevanceModel | None = None
+    rejected: dict[str, dict] = {}
+    previously_rejected = 0
+    if args.relevance_filter:
+        relevance = RelevanceModel(papers)
+        if relevance.size < RELEVANCE_MIN_CORPUS:
+            print(f"[!] {tag}Only {relevance.size} papers to learn relevance from, not filtering")
+            relevance = None
+        else:
+            rejected = load_rejected(target.rejected)
+            previously_rejected = len(rejected)
+            index_rejected(index, rejected)
+
+    async def search() -> t.AsyncIterator[Paper]:
+        query = target.arxiv_search_query
+        print(f" |- {tag}Searching arXiv for new papers")
+
+        def start() -> t.AsyncIterator[Paper]:
+            since, last_seen_id = None, None
+            if not args.no_arxiv_watermark:
+                # Other targets' papers don't count towards a shared search
+                if shared.search_users[query] == 1:
+                    since = max([p.published for p in papers if p.published], default=None)
+                last_seen_id = load_arxiv_watermark(query, args.arxiv_watermark)
+
+            # Timed as it pages, not for as long as targets are consuming it
+            return timed(
+                iter_in_thread(
+                    iter_arxiv_as_paper(
+                        query,
+                        max_results=args.arxiv_max_results,
+                        since=since,
+                        last_seen_id=last_seen_id,
+                        mirror=arxiv_mirror,
+                    )
+                ),
+                "arxiv_search",
+            )
+
+        async for result in shared_search(shared.searches, query, start).subscribe():
+            # Each target gets its own copy to track and write
+            searched_paper = replace(result, authors=list(result.authors))
+            if searched_paper not in index:
+                print(f"    |- {searched_paper.title[:50]}...")
+                index.add(searched_paper)
+                papers.append(searched_paper)
+                yield searched_paper
+        checkpoint.save(papers, stage="arxiv_search")
+
+    async def search_ranked() -> t.AsyncIterator[Paper]:
+        # Ranking needs every result, so this gives up streaming the search
+        found = [paper async for paper in search()]
+        with METRICS.stage("embed"):
+            vectors = await embed_papers(openai_client, found, embedding_cache, governor=governor)
+            ranked = rank_by_similarity(corpus, found, vectors)
+
+        print(f" |- {tag}Keeping {min(len(ranked), args.local_max_results)}/{len(ranked)} most similar arXiv results")
+        for score, paper in ranked[: args.local_max_results]:
+            print(f"    |- {score:.2f} {(paper.title or '')[:50]}...")
+            yield paper
+
+        # Drop the rest so they're neither enriched nor written
+        dropped = {id(paper) for _, paper in ranked[args.local_max_results :]}
+        papers[:] = [p for p in papers if id(p) not in dropped]
+        checkpoint.save(papers)
+
+    corpus: EmbeddingIndex | None = None
+    if embedding_cache:
+        with METRICS.stage("embed"):
+            print(f" |- {tag}Embedding existing papers")
+            vectors = await embed_papers(openai_client, papers, embedding_cache, governor=governor)
+            corpus = EmbeddingIndex(papers, vectors)
+            print(f"    |- {len(corpus)} papers indexed")
+
+    recommender: Recommender | Crawler | None = None
+    if args.search_semantic_scholar and not checkpoint.done("s2_recommend"):
+        if args.s2_crawl:
+            # Similarity to the corpus is one of the crawl priorities
+            crawl_relevance = relevance or RelevanceModel(papers)
+            recommender = Crawler(
+                index,
+                target.frontier,
+                budget=args.s2_request_budget,
+                concurrency=args.s2_concurrency,
+                cache=response_cache,
+                relevance=crawl_relevance if crawl_relevance.size >= RELEVANCE_MIN_CORPUS else None,
+            )
+        else:
+            recommender = Recommender(index, concurrency=args.s2_concurrency, cache=response_cache)
+
+    notion_summary = WriteSummary()
+    written = 0
+    knn_labelled = 0
+    start = time.monotonic()
+
+    async def filter_relevant(batch: list[Paper]) -> list[Paper]:
+        # Only papers that aren't in Notion yet are up for rejection
+        candidates = [p for p in batch if not p.page_id]
+        kept = [p for p in batch if p.page_id]
+        dropped: set[int] = set()
+        for paper, score in zip(candidates, relevance.scores(candidates).tolist()):
+            reason = None
+            if score < args.relevance_threshold:
+                reason = "keywords"
+            elif (
+                args.relevance_llm
+                and score < RELEVANCE_LLM_BAND
+                and not await is_relevant_with_openai(
+                    openai_client,
+                    paper_text(paper) or "",
+                    target.arxiv_search_query,
+                    cache=llm_cache,
+                    governor=governor,
+                    limiter=shared.openai_limiter,
+                )
+            ):
+                reason = "llm"
+
+            if reason:
+                reject(rejected, paper, score, reason)
+                dropped.add(id(paper))
+            else:
+                kept.append(paper)
+
+        # By identity and in one pass - equal copies can belong to other batches
+        if dropped:
+            papers[:] = [p for p in papers if id(p) not in dropped]
+        return kept
+
+    async def label_papers(batch: list[Paper]) -> None:
+        nonlocal knn_labelled
+        unlabelled = [p for p in batch if needs_enrichment(p) and not (p.focus and p.attack_type)]
+        if unlabelled:
+            vectors = await embed_papers(openai_client, unlabelled, embedding_cache, governor=governor)
+            knn_labelled += propagate_labels(corpus, unlabelled, vectors)
+
+    async def enrich_papers(batch: list[Paper]) -> None:
+        for paper in batch:
+            if needs_enrichment(paper):
+                await enrich(paper)
+
+    async def write_papers(batch: list[Paper]) -> None:
+        nonlocal written
+        for paper in batch:
+            if not paper.has_changed():
+                continue
+
+            await write_paper_to_notion(notion_client, target.database_id, paper, notion_limiter, notion_summary)
+            if paper.has_changed():
+                # Failed - it's retried after the pipeline and stays checkpointed
+                continue
+            written += 1
+            if written % args.flush_every == 0:
+                checkpoint.save(papers)
+
+    # Off-topic papers are dropped before they cost a seed lookup,
+    # an enrichment call or a Notion page
+    relevance_stages: list[Stage] = []
+    if relevance:
+        relevance_stages.append(Stage("relevance", filter_relevant, workers=4, batch_size=16))
+
+    # Seeds go to Semantic Scholar before they're written so marking them
+    # explored doesn't cost a second write. The Batch API can't stream, so
+    # in that mode the pipeline only covers discovery.
+    explore_stages: list[Stage] = []
+    if recommender:
+        explore_stages.append(
+            Stage("s2_recommend", recommender.explore, workers=args.s2_concurrency, batch_size=S2_SEED_BATCH_SIZE)
+        )
+
+    # Neighbours that agree strongly label a paper for free, leaving the
+    # LLM only what's still missing
+    enrich_stages: list[Stage] = []
+    if args.knn_labels:
+        enrich_stages.append(Stage("knn_labels", label_papers, batch_size=KNN_BATCH_SIZE))
+    if not args.openai_batch:
+        enrich_stages.append(Stage("openai_enrich", enrich_papers, workers=args.openai_concurrency))
+        enrich_stages.append(Stage("notion_write", write_papers, workers=args.notion_concurrency))
+
+    stages = relevance_stages + explore_stages + enrich_stages
+
+    pending = [p for p in papers if needs_enrichment(p) or p.has_changed() or (recommender and not p.explored)]
+    sources = [iter_list(pending)]
+    if args.search_arxiv and not checkpoint.done("arxiv_search"):
+        sources.append(search_ranked() if args.recommend_local else search())
+
+    if stages or len(sources) > 1:
+        print(f" |- {tag}Streaming papers through the pipeline")
+        await run_pipeline(sources, stages)
+
+    if recommender:
+        with METRICS.stage("s2_recommend"):
+            print(f" |- {tag}Getting related papers from Semantic Scholar")
+            recommended_papers = await asyncio.to_thread(
+                fill_papers_with_arxiv, await recommender.results(), cache=response_cache, mirror=arxiv_mirror
+            )
+            for paper in recommended_papers:
+                index.add(paper)
+                papers.append(paper)
+            print(f"    |- {len(recommended_papers)} new papers")
+        checkpoint.save(papers, stage="s2_recommend")
+
+        if recommended_papers and (relevance_stages or enrich_stages):
+            await run_pipeline([iter_list(recommended_papers)], relevance_stages + enrich_stages)
+
+    if relevance:
+        print(f" |- {tag}Rejected {len(rejected) - previously_rejected} off-topic papers ({len(rejected)} in total)")
+        save_rejected(rejected, target.rejected)
+
+    if args.knn_labels:
+        print(f" |- {tag}Labelled {knn_labelled} papers from their neighbours")
+
+    to_enrich = [p for p in papers if needs_enrichment(p)]
+    if args.openai_batch and (to_enrich or os.path.exists(target.openai_batch_state)):
+        with METRICS.stage("openai_enrich"):
+            print(f" |- {tag}Enriching {len(to_enrich)} papers with the OpenAI Batch API")
+            enrichments = await process_enrichment_batch(
+                openai_client, to_enrich, target.openai_batch_state, cache=llm_cache, governor=governor
+            )
+            if enrichments is not None:
+                # Results can be for papers an earlier run wrote without
+                # them, which come back from Notion with no abstract
+                applied = 0
+                for paper in papers:
+                    key = next((k for k in enrichment_keys(paper) if k in enrichments), None)
+                    if key:
+                        apply_enrichment(paper, enrichments[key])
+                        applied += 1
+                print(f"    |- Applied {applied} batch results")
+
+    # Batch results, plus anything the pipeline failed to write
+    to_write = [p for p in papers if p.has_changed()]
+    if to_write:
+        print(f" |- {tag}Writing {len(to_write)} updates back to Notion")
+        await run_pipeline(
+            [iter_list(to_write)], [Stage("notion_write", write_papers, workers=args.notion_concurrency)]
+        )
+
+    notion_summary.elapsed = time.monotonic() - start
+    print(f" |- {tag}Notion: {notion_summary}")
+
+    # Anything that failed to write stays checkpointed for --resume
+    checkpoint.finish(papers)
+
+    return not notion_summary.failed and not checkpoint.entries
+
+
 async def main():
     parser = argparse.ArgumentParser()
 
@@ -38,84 +446,293 @@ async def main():
         default=os.environ.get("NOTION_DATABASE_ID"),
         help="Notion database id",
     )
+    parser.add_argument(
+        "--config",
+        type=str,
+        help="TOML file listing several target databases to sync in one run (see config_utils.py)",
+    )
+    parser.add_argument(
+        "--notion-base-url",
+        type=str,
+        default=os.environ.get("NOTION_BASE_URL"),
+        help="Notion API base url (for proxies or local stubs)",
+    )
+    parser.add_argument(
+        "--http2",
+        action="store_true",
+        default=False,
+        help="Use HTTP/2 for Notion, OpenAI and Semantic Scholar (needs the h2 package)",
+    )
+    parser.add_argument(
+        "--notion-timeout-ms",
+        type=int,
+        help="Notion read timeout (defaults to http_utils.HTTP_TIMEOUTS)",
+    )
     parser.add_argument(
         "--openai-token",
         type=str,
         default=os.environ.get("OPENAI_API_TOKEN"),
         help="OpenAI token",
     )
+    parser.add_argument(
+        "--openai-base-url",
+        type=str,
+        default=os.environ.get("OPENAI_BASE_URL"),
+        help="OpenAI API base url (for proxies or local stubs)",
+    )
     parser.add_argument("--arxiv-search-query", type=str, default=ARXIV_SEARCH)
     parser.add_argument("--search-arxiv", action="store_true", default=False)
+    parser.add_argument("--arxiv-max-results", type=int, default=500)
+    parser.add_argument(
+        "--arxiv-watermark",
+        type=str,
+        default=ARXIV_WATERMARK_PATH,
+        help="Where to persist the newest arXiv id seen per query",
+    )
+    parser.add_argument(
+        "--no-arxiv-watermark",
+        action="store_true",
+        default=False,
+        help="Page through all --arxiv-max-results instead of stopping at known papers",
+    )
+    parser.add_argument(
+        "--arxiv-mirror",
+        action="store_true",
+        default=False,
+        help="Answer arXiv searches and fills from a local OAI-PMH mirror, harvesting it daily",
+    )
+    parser.add_argument("--arxiv-mirror-path", type=str, default=ARXIV_MIRROR_PATH)
     parser.add_argument("--search-semantic-scholar", action="store_true", default=False)
+    parser.add_argument(
+        "--s2-concurrency",
+        type=int,
+        default=S2_CONCURRENCY,
+        help="Maximum in-flight Semantic Scholar requests",
+    )
+    parser.add_argument(
+        "--s2-crawl",
+        action="store_true",
+        default=False,
+        help="Crawl citations from the most promising unexplored papers first, keeping the frontier between runs",
+    )
+    parser.add_argument(
+        "--s2-request-budget",
+        type=int,
+        default=S2_REQUEST_BUDGET,
+        help="Semantic Scholar requests each target's crawl may make per run",
+    )
+    parser.add_argument("--s2-frontier", type=str, default=S2_FRONTIER_PATH)
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        default=False,
+        help="Only read pages edited since the last run, using a local snapshot",
+    )
+    parser.add_argument(
+        "--full-sync-days",
+        type=float,
+        default=NOTION_FULL_SYNC_DAYS,
+        help="Days between full reconciliations in incremental mode",
+    )
+    parser.add_argument(
+        "--notion-concurrency",
+        type=int,
+        default=NOTION_CONCURRENCY,
+        help="Maximum in-flight Notion writes",
+    )
+    parser.add_argument(
+        "--notion-rps",
+        type=float,
+        default=NOTION_REQUESTS_PER_SECOND,
+        help="Average Notion requests per second",
+    )
+    parser.add_argument(
+        "--openai-concurrency",
+        type=int,
+        default=OPENAI_CONCURRENCY,
+        help="Maximum in-flight OpenAI requests",
+    )
+    parser.add_argument("--openai-rpm", type=int, default=OPENAI_REQUESTS_PER_MINUTE)
+    parser.add_argument("--openai-tpm", type=int, default=OPENAI_TOKENS_PER_MINUTE)
+    parser.add_argument(
+        "--openai-batch",
+        action="store_true",
+        default=False,
+        help="Enrich through the OpenAI Batch API, resuming any pending batch",
+    )
+    parser.add_argument("--openai-batch-state", type=str, default=OPENAI_BATCH_STATE)
+    parser.add_argument(
+        "--openai-model",
+        type=str,
+        action="append",
+        default=[],
+        metavar="TASK=MODEL",
+        help=f"Model for one kind of request ({', '.join(OPENAI_TASKS)}), repeatable",
+    )
+    parser.add_argument(
+        "--openai-input-tokens",
+        type=int,
+        default=OPENAI_INPUT_TOKENS,
+        help="Trim abstracts to this many tokens before sending them",
+    )
+    parser.add_argument("--openai-max-tokens", type=int, help="Stop making OpenAI requests past this many tokens")
+    parser.add_argument("--openai-max-dollars", type=float, help="Stop making OpenAI requests past this spend (USD)")
+    parser.add_argument("--llm-cache", type=str, default=LLM_CACHE_PATH, help="LLM result cache path")
+    parser.add_argument("--no-llm-cache", action="store_true", default=False)
+    parser.add_argument(
+        "--response-cache",
+        type=str,
+        default=RESPONSE_CACHE_PATH,
+        help="arXiv/Semantic Scholar response cache path (see `python cache_utils.py`)",
+    )
+    parser.add_argument("--no-response-cache", action="store_true", default=False)
+    parser.add_argument(
+        "--recommend-local",
+        action="store_true",
+        default=False,
+        help="Keep only the arXiv results most similar to papers already in Notion",
+    )
+    parser.add_argument("--local-max-results", type=int, default=50)
+    parser.add_argument(
+        "--knn-labels",
+        action="store_true",
+        default=False,
+        help="Label papers from their nearest neighbours in Notion before asking the LLM",
+    )
+    parser.add_argument("--embedding-cache", type=str, default=EMBEDDING_CACHE_PATH)
+    parser.add_argument(
+        "--relevance-filter",
+        action="store_true",
+        default=False,
+        help="Drop new papers that look off-topic next to those already in Notion",
+    )
+    parser.add_argument(
+        "--relevance-threshold",
+        type=float,
+        default=RELEVANCE_THRESHOLD,
+        help="Minimum keyword score, relative to the median paper already in Notion",
+    )
+    parser.add_argument(
+        "--relevance-llm",
+        action="store_true",
+        default=False,
+        help="Ask an LLM about papers scoring below the typical paper",
+    )
+    parser.add_argument("--rejected", type=str, default=RELEVANCE_REJECTED_PATH)
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help="Pick up unsaved work from the last interrupted run",
+    )
+    parser.add_argument("--checkpoint", type=str, default=CHECKPOINT_PATH)
+    parser.add_argument(
+        "--flush-every",
+        type=int,
+        default=50,
+        help="Checkpoint after every N papers written to Notion",
+    )
+    parser.add_argument("--report", type=str, help="Write a JSON run report (stage timings, API calls)")
+    parser.add_argument("--prometheus", type=str, help="Write run metrics in Prometheus text format")
 
     args = parser.parse_args()
     print("[+] Paperstack")
 
-    notion_client = get_notion_client(args.notion_token)
-    openai_client = get_openai_client(args.openai_token)
+    METRICS.report_path = args.report
+    METRICS.prometheus_path = args.prometheus
+    configure_http(http2=args.http2)
 
-    print(f" |- Getting papers from Notion [{args.database_id}]")
-    papers = await get_papers_from_notion(notion_client, args.database_id)
-    print(f"    |- {len(papers)} existing papers")
+    state_paths = {
+        "checkpoint": args.checkpoint,
+        "rejected": args.rejected,
+        "openai_batch_state": args.openai_batch_state,
+        "frontier": args.s2_frontier,
+    }
+    if args.config:
+        targets = load_targets(args.config, arxiv_search_query=args.arxiv_search_query, **state_paths)
+        print(f" |- {len(targets)} targets from {args.config}")
+    else:
+        targets = [make_target(args.database_id, args.arxiv_search_query, **state_paths)]
 
-    for p in papers:
-        if p.published < datetime.fromisoformat("2024-07-01 00:00:00+00:00"):
-            p.explored = True
+    arxiv_mirror = None
+    if args.arxiv_mirror:
+        arxiv_mirror = ArxivMirror(args.arxiv_mirror_path)
+        if arxiv_mirror.is_stale():
+            with METRICS.stage("arxiv_harvest"):
+                print(f" |- Harvesting arXiv metadata into {args.arxiv_mirror_path}")
+                try:
+                    await asyncio.to_thread(arxiv_mirror.harvest)
+                except (httpx.HTTPError, RuntimeError) as e:
+                    # A stale mirror is still useful - only an empty one isn't
+                    print(f"[!] arXiv harvest failed: {e}")
+        if not arxiv_mirror.size:
+            print("[!] arXiv mirror is empty, using the arXiv API")
+            arxiv_mirror.close()
+            arxiv_mirror = None
 
-        if len(p.authors) > 5:
-            p.authors = p.authors[:5]
+    try:
+        models = dict(option.split("=", 1) for option in args.openai_model)
+        configure_tasks(models, input_tokens=args.openai_input_tokens)
+    except ValueError as e:
+        parser.error(f"--openai-model: {e}")
 
-    if not all([p.has_arxiv_props() for p in papers]):
-        print(" |- Filling in missing data from arXiv")
-        papers = fill_papers_with_arxiv(papers)
-
-    if args.search_arxiv:
-        print(" |- Searching arXiv for new papers")
-        existing_titles = [paper.title for paper in papers]
-        for searched_paper in search_arxiv_as_paper(
-            args.arxiv_search_query, max_results=500
-        ):
-            if searched_paper.title not in existing_titles:
-                print(f"    |- {searched_paper.title[:50]}...")
-                papers.append(searched_paper)
+    openai_client = get_async_openai_client(args.openai_token, args.openai_base_url)
+    llm_cache = None if args.no_llm_cache else LLMCache(args.llm_cache)
+    governor = SpendGovernor(args.openai_max_tokens, args.openai_max_dollars)
+    openai_limiter = OpenAILimiter(args.openai_rpm, args.openai_tpm)
 
-    if args.search_semantic_scholar:
-        to_explore = [p for p in papers if not p.explored]
-        if to_explore:
-            print(" |- Getting related papers from Semantic Scholar")
-            recommended_papers = get_recommended_arxiv_ids_from_semantic_scholar(to_explore)
-            papers.extend(fill_papers_with_arxiv(recommended_papers))
-            print(f"    |- {len(recommended_papers)} new papers")
-        else:
-            print(" |- All papers have been explored")
-
-    if not all([paper.summary for paper in papers]):
-        print(" |- Building summaries with OpenAI")
-        for paper in [p for p in papers if not p.summary and p.abstract]:
-            print(f"    |- {paper.title[:50]}...")
-            paper.summary = summarize_abstract_with_openai(
-                openai_client, paper.abstract
-            )
+    # Everything below is shared by all targets: one Notion request budget
+    # (it's per integration, not per database), one OpenAI rate limit, one
+    # enrichment in-flight dedup, and one copy of each distinct arXiv search
+    shared = Shared(
+        notion_client=get_notion_client(args.notion_token, args.notion_base_url, args.notion_timeout_ms),
+        notion_limiter=TokenBucket(args.notion_rps),
+        openai_client=openai_client,
+        openai_limiter=openai_limiter,
+        enrich=get_paper_enricher(
+            openai_client,
+            concurrency=args.openai_concurrency,
+            cache=llm_cache,
+            governor=governor,
+            limiter=openai_limiter,
+        ),
+        governor=governor,
+        llm_cache=llm_cache,
+        response_cache=None if args.no_response_cache else ResponseCache(args.response_cache),
+        embedding_cache=EmbeddingCache(args.embedding_cache) if args.recommend_local or args.knn_labels else None,
+        arxiv_mirror=arxiv_mirror,
+        search_users=Counter(target.arxiv_search_query for target in targets if args.search_arxiv),
+        multiple=len(targets) > 1,
+    )
 
-    if not all([paper.focus for paper in papers]):
-        print(" |- Assigning focus labels with OpenAI")
-        for paper in [p for p in papers if not p.focus and (p.abstract or p.summary)]:
-            reference = paper.abstract or paper.summary
-            paper.focus = get_focus_label_from_abstract(openai_client, reference)
-            print(f"    |- {paper.focus}")
-
-    if not all([paper.attack_type for paper in papers]):
-        print(" |- Assigning attack types with OpenAI")
-        for paper in [p for p in papers if not p.attack_type and (p.abstract or p.summary)]:
-            reference = paper.abstract or paper.summary
-            paper.attack_type = get_attack_type_from_abstract(openai_client, reference)
-            print(f"    |- {paper.attack_type}")
-            
-    to_write = [p for p in papers if p.has_changed()]
-    if to_write:
-        print(f" |- Writing {len(to_write)} updates back to Notion")
-        await write_papers_to_notion(notion_client, args.database_id, to_write)
+    written = await asyncio.gather(*[run_target(args, target, shared) for target in targets])
+
+    if not args.no_arxiv_watermark:
+        unwritten = {target.arxiv_search_query for target, ok in zip(targets, written) if not ok}
+        save_watermarks(shared.searches, unwritten, args.arxiv_watermark)
+
+    print(f" |- OpenAI spend: {governor}")
+
+    if shared.embedding_cache:
+        print(f" |- Embedding cache: {shared.embedding_cache}")
+        shared.embedding_cache.save()
+
+    if shared.llm_cache:
+        print(f" |- LLM cache: {shared.llm_cache}")
+        shared.llm_cache.close()
+
+    if shared.response_cache:
+        print(f" |- Response cache: {shared.response_cache}")
+        shared.response_cache.close()
+
+    if shared.arxiv_mirror:
+        print(f" |- arXiv mirror: {shared.arxiv_mirror}")
+        shared.arxiv_mirror.close()
+
+    if connections := connection_summary():
+        print(f" |- Connections: {connections}")
 
+    METRICS.flush()
     print("[+] Done!")
 
 
@@ -0,0 +1,168 @@
+import asyncio
+import typing as t
+from dataclasses import dataclass
+
+from _types import Paper
+from metrics_utils import METRICS
+
+# Papers allowed to wait between two stages. Producers block once a queue
+# is full, so memory stays flat however many papers discovery turns up.
+PIPELINE_QUEUE_SIZE = 32
+
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    name: str
+    # Returning a list passes on only those papers; None passes the batch
+    handler: t.Callable[[list[Paper]], t.Awaitable[list[Paper] | None]]
+    workers: int = 1
+    # Papers handed to the handler at once (fewer when input runs out)
+    batch_size: int = 1
+
+
+async def iter_in_thread(iterable: t.Iterable[Paper]) -> t.AsyncIterator[Paper]:
+    # Blocking iterators (arxiv paging, with its sleeps) run off the loop
+    iterator = iter(iterable)
+    while (item := await asyncio.to_thread(next, iterator, _DONE)) is not _DONE:
+        yield t.cast(Paper, item)
+
+
+async def iter_list(papers: list[Paper]) -> t.AsyncIterator[Paper]:
+    for paper in papers:
+        yield paper
+
+
+async def _produce(source: t.AsyncIterator[Paper], queue: asyncio.Queue) -> None:
+    async for paper in source:
+        await queue.put(paper)
+
+
+async def timed(source: t.AsyncIterator[Paper], stage: str) -> t.AsyncIterator[Paper]:
+    # Times producing each paper under `stage`, but not the consumer's
+    # work (or backpressure) while the source is suspended
+    iterator = aiter(source)
+    while True:
+        with METRICS.stage(stage, flush=False):
+            try:
+                paper = await anext(iterator)
+            except StopAsyncIteration:
+                break
+        yield paper
+
+
+async def _drain(source: t.AsyncIterator[Paper]) -> None:
+    async for _ in source:
+        pass
+
+
+async def _consume(stage: Stage, inbox: asyncio.Queue, outbox: asyncio.Queue | None) -> None:
+    async def _worker() -> None:
+        done = False
+        while not done:
+            batch: list[Paper] = []
+            while len(batch) < stage.batch_size:
+                if (paper := await inbox.get()) is _DONE:
+                    done = True
+                    break
+                batch.append(paper)
+
+            if not batch:
+                continue
+
+            # Only the handler call is timed, not waiting on the queues
+            try:
+                with METRICS.stage(stage.name, flush=False):
+                    kept = await stage.handler(batch)
+                batch = batch if kept is None else kept
+            except Exception as e:
+                print(f"[!] {stage.name} failed for {len(batch)} papers: {e}")
+            if outbox is not None:
+                for paper in batch:
+                    await outbox.put(paper)
+
+    await asyncio.gather(*[_worker() for _ in range(stage.workers)])
+    METRICS.flush()
+
+
+async def run_pipeline(
+    sources: list[t.AsyncIterator[Paper]],
+    stages: list[Stage],
+    *,
+    queue_size: int = PIPELINE_QUEUE_SIZE,
+) -> None:
+    """
+    Stream papers from every source through each stage in order, with a
+    bounded queue between stages. Every stage runs at once, so a paper can
+    be written while later ones are still being discovered and the run
+    takes about as long as its slowest service rather than the sum.
+    """
+
+    if not stages:
+        # Sources still have to run - searches add what they find as they go
+        await asyncio.gather(*[_drain(source) for source in sources])
+        return
+
+    queues: list[asyncio.Queue] = [asyncio.Queue(maxsize=queue_size) for _ in stages]
+    consumers = [
+        asyncio.create_task(_consume(stage, queues[i], queues[i + 1] if i + 1 < len(stages) else None))
+        for i, stage in enumerate(stages)
+    ]
+
+    try:
+        await asyncio.gather(*[_produce(source, queues[0]) for source in sources])
+
+        # Drain stage by stage - each worker stops at its own sentinel
+        for i, stage in enumerate(stages):
+            for _ in range(stage.workers):
+                await queues[i].put(_DONE)
+            await consumers[i]
+    finally:
+        for consumer in consumers:
+            consumer.cancel()
+
+
+class SharedSource:
+    """
+    Runs one source once and replays it to any number of subscribers,
+    each seeing every paper as soon as it arrives - so targets sharing a
+    search don't each page through it.
+    """
+
+    def __init__(self, source: t.AsyncIterator[Paper]) -> None:
+        self.papers: list[Paper] = []
+        self.done = False
+        self._source = source
+        self._changed = asyncio.Condition()
+        self._task: asyncio.Task | None = None
+
+    async def _run(self) -> None:
+        try:
+            async for paper in self._source:
+                async with self._changed:
+                    self.papers.append(paper)
+                    self._changed.notify_all()
+        finally:
+            async with self._changed:
+                self.done = True
+                self._changed.notify_all()
+
+    async def subscribe(self) -> t.AsyncIterator[Paper]:
+        # Started by the first subscriber, inside its context
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+        position = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: position < len(self.papers) or self.done)
+                if position >= len(self.papers):
+                    break
+                paper = self.papers[position]
+            position += 1
+            yield paper
+
+        # Surface a failed search to every subscriber
+        if self._task.done() and self._task.exception():
+            raise self._task.exception()  # type: ignore
@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Async token bucket shared between concurrent callers.
+
+    Tokens refill continuously at `rate` per second up to `capacity`. When
+    a service tells us we're throttled, `throttle` blocks every caller for
+    the requested period and halves the rate; each success afterwards
+    recovers a slice of it until we're back at the configured rate.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None, *, min_rate: float | None = None) -> None:
+        self.max_rate = rate
+        self.min_rate = min_rate if min_rate is not None else rate / 8
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+
+                wait = self._blocked_until - now
+                if wait <= 0:
+                    if self._tokens >= amount:
+                        self._tokens -= amount
+                        return
+                    wait = (amount - self._tokens) / self.rate
+
+                await asyncio.sleep(wait)
+
+    def throttle(self, retry_after: float) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        self._tokens = 0.0
+        self._blocked_until = max(self._blocked_until, now + retry_after)
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def recover(self) -> None:
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
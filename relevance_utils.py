@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+import typing as t
+from collections import Counter
+from datetime import datetime, timezone
+
+from _types import Paper, PaperIndex, normalize_arxiv_id, title_fingerprint
+from embedding_utils import paper_text
+from lazy_utils import lazy_import
+
+if t.TYPE_CHECKING:
+    import numpy as np
+else:
+    np = lazy_import("numpy")
+
+RELEVANCE_REJECTED_PATH = ".paperstack/rejected.json"
+
+# Scores are scaled so the median paper already in Notion scores 1.0.
+# Anything under the threshold is rejected outright, anything under the
+# band is only kept if the (optional) LLM gate agrees.
+RELEVANCE_THRESHOLD = 0.3
+RELEVANCE_LLM_BAND = 1.0
+
+# Too few papers and the vocabulary says nothing about the topic
+RELEVANCE_MIN_CORPUS = 20
+
+TOKEN_PATTERN = re.compile(r"[a-z][a-z0-9\-]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can for from has have in is it its of on or our that the their these this "
+    "to we which with while paper propose proposed show results approach method methods using based".split()
+)
+
+
+def _tokenize(text: str) -> list[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class RelevanceModel:
+    """
+    TF-IDF fitted on the papers already in Notion. A paper's score is the
+    cosine similarity of its (sublinear, l2 normalised) TF-IDF vector to
+    the corpus centroid - cheap, and good at spotting off-topic results.
+    """
+
+    def __init__(self, papers: list[Paper]) -> None:
+        documents = [_tokenize(text) for p in papers if (text := paper_text(p))]
+        self.size = len(documents)
+
+        frequency: Counter[str] = Counter()
+        for tokens in documents:
+            frequency.update(set(tokens))
+
+        self.vocabulary = {term: i for i, term in enumerate(frequency)}
+        self.idf = np.array(
+            [math.log((1 + self.size) / (1 + frequency[term])) + 1 for term in self.vocabulary], dtype=np.float32
+        )
+
+        centroid = np.zeros(len(self.vocabulary), dtype=np.float32)
+        vectors = [self._vector(tokens) for tokens in documents]
+        for indices, values in vectors:
+            np.add.at(centroid, indices, values)
+        self.centroid = centroid / (np.linalg.norm(centroid) or 1.0)
+
+        raw = np.array([self.centroid[indices] @ values for indices, values in vectors], dtype=np.float32)
+        self.scale = float(np.median(raw)) if len(raw) and np.median(raw) > 0 else 1.0
+
+    def _vector(self, tokens: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        # Sparse (indices, values); terms outside the corpus can't add similarity
+        counts = Counter(token for token in tokens if token in self.vocabulary)
+        indices = np.array([self.vocabulary[term] for term in counts], dtype=np.int64)
+        values = (1 + np.log(np.array(list(counts.values()), dtype=np.float32))) * self.idf[indices]
+        return indices, values / (np.linalg.norm(values) or 1.0)
+
+    def scores(self, papers: list[Paper]) -> np.ndarray:
+        scores = np.zeros(len(papers), dtype=np.float32)
+        for row, paper in enumerate(papers):
+            if text := paper_text(paper):
+                indices, values = self._vector(_tokenize(text))
+                scores[row] = self.centroid[indices] @ values / self.scale
+        return scores
+
+
+def rejection_key(paper: Paper) -> str | None:
+    if paper.arxiv_id:
+        return normalize_arxiv_id(paper.arxiv_id)
+    if paper.title:
+        return f"title:{title_fingerprint(paper.title)}"
+    return None
+
+
+def load_rejected(path: str = RELEVANCE_REJECTED_PATH) -> dict[str, dict]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_rejected(rejected: dict[str, dict], path: str = RELEVANCE_REJECTED_PATH) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(rejected, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def reject(rejected: dict[str, dict], paper: Paper, score: float, reason: str) -> None:
+    if key := rejection_key(paper):
+        rejected[key] = {
+            "title": paper.title,
+            "score": round(score, 3),
+            "reason": reason,
+            "rejected": datetime.now(timezone.utc).isoformat(),
+        }
+
+
+def index_rejected(index: PaperIndex, rejected: dict[str, dict]) -> None:
+    # Known rejections look like papers we already have, so searches and
+    # recommendations skip them before fetching anything more
+    for key, entry in rejected.items():
+        if key.startswith("title:"):
+            index.add(title=entry.get("title"))
+        else:
+            index.add(arxiv_id=key)
@@ -1,60 +1,577 @@
-from semanticscholar import SemanticScholar  # type: ignore
-from tqdm import tqdm  # type: ignore
+from __future__ import annotations
 
-from _types import Paper
+import asyncio
+import json
+import math
+import os
+import typing as t
+from collections import Counter
+from datetime import datetime
 
-client = SemanticScholar()
+from _types import Paper, PaperIndex, normalize_arxiv_id
+from cache_utils import MISS, ResponseCache
+from http_utils import get_async_http_client
+from lazy_utils import lazy_import
+from metrics_utils import METRICS
+from rate_utils import TokenBucket
 
+if t.TYPE_CHECKING:
+    from relevance_utils import RelevanceModel
 
-def get_recommended_arxiv_ids_from_semantic_scholar(
-    papers: list[Paper], max_results: int = 10, min_year: int = 2018
-) -> list[Paper]:
-    results: list[dict] = []
-    for paper in tqdm(papers):
-        if not paper.url:
-            continue
+semanticscholar = lazy_import("semanticscholar")
+tqdm = lazy_import("tqdm")
+
+# Seeds per multi-paper recommendation request. Smaller batches give a
+# finer agreement signal (batch hits) for ranking at the cost of more requests.
+S2_SEED_BATCH_SIZE = 20
+S2_LOOKUP_BATCH_SIZE = 500
+S2_CONCURRENCY = 2
+
+S2_API_URL = os.environ.get("S2_API_URL", "https://api.semanticscholar.org")
+
+# Unauthenticated Semantic Scholar access is shared and roughly 1 req/s
+S2_REQUESTS_PER_SECOND = 1
+
+# Retry constants
+MAX_RETRIES = 5
+RETRY_DELAY = 5
+
+# Citation crawl (--s2-crawl). The frontier is kept between runs and
+# each run spends at most S2_REQUEST_BUDGET requests expanding it.
+S2_FRONTIER_PATH = ".paperstack/s2_frontier.json"
+S2_REQUEST_BUDGET = 100
+
+# Neighbours per edge (citations, references) of an expanded paper - one page
+S2_CRAWL_NEIGHBOURS = 100
+
+# Discovered papers kept in the frontier, best first
+S2_FRONTIER_MAX_CANDIDATES = 10_000
+
+# Citation counts of waiting seeds are refreshed after this many days
+S2_FRONTIER_REFRESH_DAYS = 30
+
+S2_NODE_FIELDS = ["paperId", "externalIds", "title", "abstract", "year", "publicationDate", "citationCount"]
+
+_client: semanticscholar.AsyncSemanticScholar | None = None
+
+
+def get_s2_client() -> semanticscholar.AsyncSemanticScholar:
+    # Built on first use - most runs never search Semantic Scholar
+    global _client
+    if _client is None:
+        # We handle 429s ourselves so the shared limiter sees them
+        _client = _pooled_client_class()(retry=False, api_url=S2_API_URL)
+    return _client
+
+
+def _pooled_client_class() -> type[semanticscholar.AsyncSemanticScholar]:
+    # Defined on first use, as subclassing loads semanticscholar
+
+    class PooledRequester(semanticscholar.ApiRequester.ApiRequester):
+        """
+        The package's requester opens a new client (and connection) for
+        every request. This one sends on the shared pool and raises the
+        same errors.
+        """
+
+        def __init__(self, timeout: int, retry: bool = True) -> None:
+            super().__init__(timeout, retry)
+            self.client = get_async_http_client("s2", S2_API_URL)
+
+        async def get_data_async(self, url: str, parameters: str, headers: dict, payload: dict | None = None) -> t.Any:
+            response = await self.client.request(
+                "POST" if payload else "GET", url, params=parameters.lstrip("&"), headers=headers, json=payload
+            )
+
+            errors = semanticscholar.SemanticScholarException
+            exception = {
+                400: errors.BadQueryParametersException,
+                403: PermissionError,
+                404: errors.ObjectNotFoundException,
+                429: ConnectionRefusedError,
+                500: errors.InternalServerErrorException,
+                504: errors.GatewayTimeoutException,
+            }.get(response.status_code)
+            if exception:
+                raise exception(f"HTTP status {response.status_code}: {response.text[:200]}")
+            if response.status_code != 200:
+                return {}
+
+            data = response.json()
+            return {} if len(data) == 1 and "error" in data else data
+
+    class PooledSemanticScholar(semanticscholar.AsyncSemanticScholar):
+        def __init__(self, **kwargs: t.Any) -> None:
+            super().__init__(**kwargs)
+            self._requester = PooledRequester(self._timeout, self._retry)
+
+    return PooledSemanticScholar
 
-        if not paper.arxiv_id:
-            continue
 
+async def _request(limiter: TokenBucket, call, *args, spend: t.Callable[[], bool] | None = None, **kwargs):
+    # `spend` is asked before every attempt, retries included, and stops
+    # the request once it returns False
+    for attempt in range(1, MAX_RETRIES + 1):
+        if spend and not spend():
+            raise RuntimeError("Semantic Scholar request budget spent")
+        await limiter.acquire()
+        METRICS.record("s2", calls=1)
         try:
-            results.extend(
-                client.get_recommended_papers(
-                    f"arXiv:{paper.arxiv_id}", limit=max_results * 2
+            result = await call(*args, **kwargs)
+            limiter.recover()
+            return result
+        except ConnectionRefusedError:
+            # The semanticscholar package raises this for HTTP 429
+            METRICS.record("s2", retries=1)
+            limiter.throttle(RETRY_DELAY * 2 ** (attempt - 1))
+
+    METRICS.record("s2", errors=1)
+    raise ConnectionRefusedError(f"Still rate limited after {MAX_RETRIES} attempts")
+
+
+def _rank(result: dict, batches: int, now: datetime) -> float:
+    # Seed batches agreeing on a paper matter most, then impact, then freshness
+    citations = math.log1p(result.get("citationCount") or 0)
+    age = now.year - (result.get("year") or now.year)
+    recency = math.exp(-age / 2)
+    return 2.0 * batches + citations + 2.0 * recency
+
+
+class Recommender:
+    """
+    Collects Semantic Scholar recommendations for batches of seed papers
+    as they arrive, then ranks and hydrates everything at the end. Seeds
+    are marked explored as soon as their batch has been asked about.
+
+    S2 recommends for a whole batch of seeds at once, so agreement is
+    counted in batches: `batch_hits` is how many seed batches recommended
+    a paper, not how many seeds.
+    """
+
+    def __init__(
+        self,
+        index: PaperIndex,
+        max_results: int = 10,
+        min_year: int = 2018,
+        *,
+        concurrency: int = S2_CONCURRENCY,
+        cache: ResponseCache | None = None,
+    ) -> None:
+        self.index = index
+        self.cache = cache
+        self.max_results = max_results
+        self.min_year = min_year
+        self.limiter = TokenBucket(S2_REQUESTS_PER_SECOND)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.batch_hits: Counter[str] = Counter()
+        self.recommended: dict[str, dict] = {}
+
+    async def explore(self, papers: list[Paper]) -> None:
+        seeds = [p for p in papers if not p.explored and p.url and p.arxiv_id]
+        for i in range(0, len(seeds), S2_SEED_BATCH_SIZE):
+            batch = seeds[i : i + S2_SEED_BATCH_SIZE]
+            results = await self._recommend(batch)
+            if results is None:
+                continue
+
+            for result in results:
+                self.batch_hits[result["paperId"]] += 1
+                self.recommended.setdefault(result["paperId"], result)
+            for paper in batch:
+                paper.explored = True
+
+    async def _recommend(self, batch: list[Paper]) -> list[dict] | None:
+        key = ",".join(sorted(normalize_arxiv_id(p.arxiv_id) for p in batch if p.arxiv_id))
+        if self.cache and (cached := self.cache.get("s2_recommend", key)) is not MISS:
+            return cached or []
+
+        async with self.semaphore:
+            try:
+                results = await _request(
+                    self.limiter,
+                    get_s2_client().get_recommended_papers_from_lists,
+                    [f"arXiv:{p.arxiv_id}" for p in batch],
+                    fields=["paperId", "externalIds", "title"],
+                    limit=min(500, self.max_results * 2 * len(batch)),
+                )
+            except Exception as e:
+                print(f"[!] {e}")
+                return None
+
+        recommended = [result.raw_data for result in results]
+        if self.cache:
+            self.cache.set("s2_recommend", key, recommended or None)
+        return recommended
+
+    async def _lookup(self, paper_ids: list[str]) -> list[dict]:
+        found: list[dict] = []
+        missing: list[str] = []
+        for paper_id in paper_ids:
+            cached = self.cache.get("s2_paper", paper_id) if self.cache else MISS
+            if cached is MISS:
+                missing.append(paper_id)
+            elif cached:
+                found.append(cached)
+
+        # Hydrate the rest in bulk rather than per paper
+        for i in range(0, len(missing), S2_LOOKUP_BATCH_SIZE):
+            chunk = missing[i : i + S2_LOOKUP_BATCH_SIZE]
+            try:
+                results = await _request(
+                    self.limiter,
+                    get_s2_client().get_papers,
+                    chunk,
+                    fields=["paperId", "externalIds", "title", "abstract", "year", "citationCount"],
+                )
+            except Exception as e:
+                print(f"[!] {e}")
+                continue
+
+            by_id = {result.raw_data["paperId"]: result.raw_data for result in results}
+            found.extend(by_id.values())
+            if self.cache:
+                for paper_id in chunk:
+                    self.cache.set("s2_paper", paper_id, by_id.get(paper_id))
+
+        return found
+
+    async def results(self) -> list[Paper]:
+        # Drop anything we already know before paying for the lookups
+        candidates: list[str] = []
+        seen = PaperIndex()
+        for paper_id, result in self.recommended.items():
+            external_ids = result.get("externalIds") or {}
+            if "ArXiv" not in external_ids:
+                continue
+
+            arxiv_id = external_ids["ArXiv"]
+            doi = external_ids.get("DOI")
+            if seen.match(arxiv_id=arxiv_id, title=result["title"]):
+                continue
+
+            if self.index.match(arxiv_id=arxiv_id, doi=doi, title=result["title"]):
+                continue
+
+            seen.add(arxiv_id=arxiv_id, title=result["title"])
+            candidates.append(paper_id)
+
+        filtered = [r for r in await self._lookup(candidates) if (r.get("year") or 0) >= self.min_year]
+
+        now = datetime.now()
+        filtered.sort(key=lambda r: _rank(r, self.batch_hits[r["paperId"]], now), reverse=True)
+
+        recommended_papers: list[Paper] = []
+        for result in filtered[: self.max_results]:
+            recommended_papers.append(
+                Paper(
+                    title=result["title"],
+                    url=f'https://arxiv.org/abs/{result["externalIds"]["ArXiv"]}',
+                    abstract=result["abstract"],
                 )
             )
-            paper.explored = True
-        except Exception as e:
-            print(f"[!] {e}]")
-            pass
 
-    filtered: list[dict] = []
-    for result in results:
-        if "ArXiv" not in result["externalIds"]:
-            continue
+        return recommended_papers
+
+
+async def get_recommended_arxiv_ids_from_semantic_scholar(
+    papers: list[Paper],
+    max_results: int = 10,
+    min_year: int = 2018,
+    *,
+    index: PaperIndex | None = None,
+    concurrency: int = S2_CONCURRENCY,
+    cache: ResponseCache | None = None,
+) -> list[Paper]:
+    recommender = Recommender(
+        index or PaperIndex(papers), max_results, min_year, concurrency=concurrency, cache=cache
+    )
+
+    seeds = [p for p in papers if p.url and p.arxiv_id]
+    batches = [seeds[i : i + S2_SEED_BATCH_SIZE] for i in range(0, len(seeds), S2_SEED_BATCH_SIZE)]
+    progress = tqdm.tqdm(total=len(batches))
+
+    async def _explore(batch: list[Paper]) -> None:
+        await recommender.explore(batch)
+        progress.update(1)
+
+    await asyncio.gather(*[_explore(batch) for batch in batches])
+    progress.close()
+
+    return await recommender.results()
+
+
+def _age(node: dict, now: datetime) -> float:
+    # Years since publication, to the day when S2 knows it
+    if published := node.get("published"):
+        return max((now - datetime.fromisoformat(published)).days / 365, 0.0)
+    return max(now.year - (node.get("year") or now.year), 0)
+
+
+def _priority(node: dict, now: datetime) -> float:
+    # On-topic first, then papers gathering citations quickly, then fresh
+    # ones. Discovered papers also count the expanded papers linking to them.
+    age = _age(node, now)
+    velocity = math.log1p((node.get("citations") or 0) / max(age, 0.5))
+    recency = math.exp(-age / 2)
+    return 3.0 * node.get("similarity", 1.0) + velocity + 2.0 * recency + 2.0 * node.get("links", 0)
+
+
+def _node(result: dict) -> dict:
+    return {
+        "title": result.get("title"),
+        "year": result.get("year"),
+        "published": result.get("publicationDate"),
+        "citations": result.get("citationCount"),
+    }
+
+
+class Crawler:
+    """
+    Citation-graph crawl over a frontier kept between runs, as an
+    alternative to `Recommender` with the same `explore`/`results` shape.
+
+    Unexplored papers queue up as seeds while they stream past. `results`
+    then expands the highest priority seeds first - their references,
+    citations and Semantic Scholar recommendations - until the run's
+    request budget is spent, and returns the best papers discovered.
+    Seeds are only marked explored once they've been expanded, so the
+    rest wait for the next run, and discovered papers that weren't
+    returned stay in the frontier collecting links from later expansions.
+    """
+
+    def __init__(
+        self,
+        index: PaperIndex,
+        path: str = S2_FRONTIER_PATH,
+        max_results: int = 10,
+        min_year: int = 2018,
+        *,
+        budget: int = S2_REQUEST_BUDGET,
+        concurrency: int = S2_CONCURRENCY,
+        cache: ResponseCache | None = None,
+        relevance: RelevanceModel | None = None,
+    ) -> None:
+        self.index = index
+        self.path = path
+        self.max_results = max_results
+        self.min_year = min_year
+        self.budget = budget
+        self.cache = cache
+        self.relevance = relevance
+        self.limiter = TokenBucket(S2_REQUESTS_PER_SECOND)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.requests = 0
+
+        # Seeds by arXiv id, discovered papers by S2 paper id
+        self.seeds: dict[str, dict] = {}
+        self.candidates: dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.seeds = state["seeds"]
+            self.candidates = state["candidates"]
+
+        self.queued: dict[str, Paper] = {}
+        self._unscored: dict[str, Paper] = {}
+
+    @property
+    def remaining(self) -> int:
+        return self.budget - self.requests
+
+    def _spend(self) -> bool:
+        # Every request sent counts, including retries after a 429
+        if self.requests >= self.budget:
+            return False
+        self.requests += 1
+        return True
 
-        arxiv_id = result["externalIds"]["ArXiv"]
-        if arxiv_id in [f["externalIds"]["ArXiv"] for f in filtered]:
-            continue
+    async def explore(self, papers: list[Paper]) -> None:
+        for paper in papers:
+            if not paper.explored and paper.url and paper.arxiv_id:
+                self.queued[normalize_arxiv_id(paper.arxiv_id)] = paper
 
-        if result["title"] in [p.title for p in papers]:
-            continue
+    async def _fetch(
+        self, source: str | None, key: str, parse: t.Callable[[t.Any], list[dict]], call, *args, **kwargs
+    ) -> list[dict] | None:
+        if self.cache and source and (cached := self.cache.get(source, key)) is not MISS:
+            return cached or []
 
-        if result["year"] < min_year:
-            continue
+        async with self.semaphore:
+            try:
+                found = parse(await _request(self.limiter, call, *args, spend=self._spend, **kwargs))
+            except Exception as e:
+                print(f"[!] {e}")
+                return None
 
-        filtered.append(result)
+        if self.cache and source:
+            self.cache.set(source, key, found or None)
+        return found
 
-    # TODO: Sort by something important
+    async def _hydrate(self) -> None:
+        # Seeds need citation counts to be ranked. The frontier remembers
+        # them, so only new (or stale) seeds cost a lookup.
+        now = datetime.now()
+        missing = [
+            key
+            for key in self.queued
+            if (now - datetime.fromisoformat(self.seeds.get(key, {}).get("checked", "1970-01-01"))).days
+            >= S2_FRONTIER_REFRESH_DAYS
+        ]
+        for i in range(0, len(missing), S2_LOOKUP_BATCH_SIZE):
+            if self.remaining < 1:
+                break
 
-    recommended_papers: list[Paper] = []
-    for result in filtered:
-        recommended_papers.append(
-            Paper(
-                title=result["title"],
-                url=f'https://arxiv.org/abs/{result["externalIds"]["ArXiv"]}',
-                abstract=result["abstract"],
+            chunk = missing[i : i + S2_LOOKUP_BATCH_SIZE]
+            results = await self._fetch(
+                None,
+                "",
+                lambda papers: [paper.raw_data for paper in papers],
+                get_s2_client().get_papers,
+                [f"arXiv:{key}" for key in chunk],
+                fields=S2_NODE_FIELDS,
             )
+            if results is None:
+                continue
+
+            by_id = {
+                normalize_arxiv_id(external_ids["ArXiv"]): result
+                for result in results
+                if "ArXiv" in (external_ids := result.get("externalIds") or {})
+            }
+            for key in chunk:
+                # Papers S2 doesn't know are still worth expanding on recency alone
+                self.seeds[key] = {**_node(by_id.get(key, {})), "checked": now.isoformat()}
+
+        unscored = [key for key in self.queued if "similarity" not in self.seeds.setdefault(key, {})]
+        for key, score in zip(unscored, self._similarity([self.queued[key] for key in unscored])):
+            self.seeds[key]["similarity"] = score
+            if not self.seeds[key].get("year") and (published := self.queued[key].published):
+                self.seeds[key]["year"] = published.year
+
+    def _similarity(self, papers: list[Paper]) -> list[float]:
+        if not self.relevance:
+            return [1.0] * len(papers)
+        # Relative to the median paper already in Notion (1.0)
+        return [min(score, 2.0) for score in self.relevance.scores(papers).tolist()]
+
+    def _discover(self, result: dict) -> None:
+        external_ids = result.get("externalIds") or {}
+        if not result.get("paperId") or "ArXiv" not in external_ids:
+            return
+        if (result.get("year") or 0) < self.min_year:
+            return
+
+        arxiv_id = external_ids["ArXiv"]
+        if normalize_arxiv_id(arxiv_id) in self.queued:
+            return
+        if self.index.match(arxiv_id=arxiv_id, doi=external_ids.get("DOI"), title=result.get("title")):
+            return
+
+        node = self.candidates.setdefault(result["paperId"], {"arxiv_id": arxiv_id, "links": 0})
+        node.update(_node(result))
+        node["links"] += 1
+        if "similarity" not in node:
+            self._unscored[result["paperId"]] = Paper(
+                title=result.get("title"), abstract=result.get("abstract") or result.get("title")
+            )
+
+    async def _expand(self, keys: list[str]) -> None:
+        async def _edges(key: str) -> bool:
+            found = await asyncio.gather(
+                self._fetch(
+                    "s2_citations",
+                    key,
+                    lambda results: [r["citingPaper"] for r in results.raw_data],
+                    get_s2_client().get_paper_citations,
+                    f"arXiv:{key}",
+                    fields=S2_NODE_FIELDS,
+                    limit=S2_CRAWL_NEIGHBOURS,
+                ),
+                self._fetch(
+                    "s2_references",
+                    key,
+                    lambda results: [r["citedPaper"] for r in results.raw_data],
+                    get_s2_client().get_paper_references,
+                    f"arXiv:{key}",
+                    fields=S2_NODE_FIELDS,
+                    limit=S2_CRAWL_NEIGHBOURS,
+                ),
+            )
+            for results in found:
+                for result in results or []:
+                    self._discover(result)
+            return all(results is not None for results in found)
+
+        recommended, *expanded = await asyncio.gather(
+            self._fetch(
+                "s2_related",
+                ",".join(sorted(keys)),
+                lambda papers: [paper.raw_data for paper in papers],
+                get_s2_client().get_recommended_papers_from_lists,
+                [f"arXiv:{key}" for key in keys],
+                fields=S2_NODE_FIELDS,
+                limit=min(500, self.max_results * 2 * len(keys)),
+            ),
+            *[_edges(key) for key in keys],
+        )
+        for result in recommended or []:
+            self._discover(result)
+
+        for key, ok in zip(keys, expanded):
+            if ok and recommended is not None:
+                self.queued[key].explored = True
+                self.seeds.pop(key, None)
+
+    async def results(self) -> list[Paper]:
+        await self._hydrate()
+
+        now = datetime.now()
+        seeds = sorted(self.queued, key=lambda key: _priority(self.seeds[key], now), reverse=True)
+
+        # Rounds of the best seeds that are left: citations and references
+        # for each, plus one recommendation request for the round
+        expanded = 0
+        while expanded < len(seeds) and self.remaining >= 3:
+            size = min(S2_SEED_BATCH_SIZE, (self.remaining - 1) // 2)
+            batch = seeds[expanded : expanded + size]
+            await self._expand(batch)
+            expanded += len(batch)
+
+        unscored = list(self._unscored)
+        for paper_id, score in zip(unscored, self._similarity(list(self._unscored.values()))):
+            self.candidates[paper_id]["similarity"] = score
+        self._unscored.clear()
+
+        print(
+            f"    |- Expanded {expanded}/{len(seeds)} frontier papers with {self.requests}/{self.budget} requests, "
+            f"{len(self.candidates)} papers discovered"
         )
 
-    return recommended_papers[:max_results]
+        ranked = sorted(self.candidates, key=lambda paper_id: _priority(self.candidates[paper_id], now), reverse=True)
+        recommended_papers: list[Paper] = []
+        for paper_id in ranked:
+            if len(recommended_papers) >= self.max_results:
+                break
+
+            node = self.candidates[paper_id]
+            # Found by another route (e.g. the arXiv search) since
+            if self.index.match(arxiv_id=node["arxiv_id"], title=node["title"]):
+                del self.candidates[paper_id]
+                continue
+
+            recommended_papers.append(Paper(title=node["title"], url=f"https://arxiv.org/abs/{node['arxiv_id']}"))
+            del self.candidates[paper_id]
+
+        self.save(now)
+        return recommended_papers
+
+    def save(self, now: datetime | None = None) -> None:
+        # Only seeds still waiting to be expanded are worth remembering
+        now = now or datetime.now()
+        seeds = {key: self.seeds[key] for key, paper in self.queued.items() if not paper.explored and key in self.seeds}
+        ranked = sorted(self.candidates, key=lambda paper_id: _priority(self.candidates[paper_id], now), reverse=True)
+        candidates = {paper_id: self.candidates[paper_id] for paper_id in ranked[:S2_FRONTIER_MAX_CANDIDATES]}
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump({"seeds": seeds, "candidates": candidates}, f)
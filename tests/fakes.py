@@ -0,0 +1,204 @@
+import asyncio
+import json
+import types
+import typing as t
+from datetime import datetime, timezone
+
+import arxiv
+import httpx
+import openai
+
+from _types import normalize_arxiv_id
+
+ENRICHMENT = json.dumps({"summary": "A short summary.", "focus": "Offensive", "attack_type": "Prompt Injection"})
+
+
+def completion(content: str | None, model: str = "stub", prompt_tokens: int = 800, completion_tokens: int = 60):
+    return types.SimpleNamespace(
+        model=model,
+        choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))],
+        usage=types.SimpleNamespace(
+            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, prompt_tokens_details=None
+        ),
+    )
+
+
+def rate_limit_error() -> openai.RateLimitError:
+    response = httpx.Response(429, headers={"retry-after": "0"}, request=httpx.Request("POST", "http://openai"))
+    return openai.RateLimitError("slow down", response=response, body=None)
+
+
+class FakeOpenAI:
+    """
+    Stands in for AsyncOpenAI's chat completions. `replies` are returned
+    (or raised) in order, then `default` for every call after them.
+    """
+
+    def __init__(self, *replies, default=ENRICHMENT, delay: float = 0.0) -> None:
+        self.replies = list(replies)
+        self.default = default
+        self.delay = delay
+        self.requests: list[dict] = []
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._create))
+
+    async def _create(self, **request):
+        self.requests.append(request)
+        await asyncio.sleep(self.delay)
+        reply = self.replies.pop(0) if self.replies else self.default
+        if isinstance(reply, BaseException):
+            raise reply
+        return completion(reply, request.get("model", "stub"))
+
+
+class FakeBatches:
+    """
+    Stands in for AsyncOpenAI's files and batches. Batches stay
+    in_progress until `complete` is called with their output lines.
+    """
+
+    def __init__(self) -> None:
+        self.uploads: list[bytes] = []
+        self.status = "in_progress"
+        self.output: str | None = None
+        self.files = types.SimpleNamespace(create=self._upload, content=self._content)
+        self.batches = types.SimpleNamespace(create=self._create, retrieve=self._retrieve)
+
+    def complete(self, output: str) -> None:
+        self.status = "completed"
+        self.output = output
+
+    async def _upload(self, file, purpose: str):
+        self.uploads.append(file.read())
+        return types.SimpleNamespace(id=f"file-{len(self.uploads)}")
+
+    async def _content(self, file_id: str):
+        return types.SimpleNamespace(text=self.output)
+
+    async def _create(self, input_file_id: str, endpoint: str, completion_window: str):
+        return types.SimpleNamespace(id=f"batch-{len(self.uploads)}")
+
+    async def _retrieve(self, batch_id: str):
+        done = self.status == "completed"
+        return types.SimpleNamespace(
+            id=batch_id,
+            status=self.status,
+            output_file_id="file-output" if done else None,
+            request_counts=types.SimpleNamespace(completed=0, total=1),
+        )
+
+
+def batch_line(custom_id: str, content: str = ENRICHMENT, status_code: int = 200) -> str:
+    body = {
+        "model": "stub",
+        "choices": [{"message": {"content": content}}],
+        "usage": {"prompt_tokens": 800, "completion_tokens": 60},
+    }
+    return json.dumps({"custom_id": custom_id, "response": {"status_code": status_code, "body": body}, "error": None})
+
+
+def arxiv_result(arxiv_id: str, title: str | None = None, published: datetime | None = None):
+    return types.SimpleNamespace(
+        title=title or f"Paper {arxiv_id}",
+        entry_id=f"http://arxiv.org/abs/{arxiv_id}",
+        summary=f"Abstract of {arxiv_id}.",
+        authors=[types.SimpleNamespace(name="Ada Lovelace")],
+        published=published or datetime(2024, 1, 1, tzinfo=timezone.utc),
+        get_short_id=lambda: arxiv_id,
+    )
+
+
+class FakeArxiv:
+    """
+    Stands in for an arxiv.Client. id_list searches answer from `known`,
+    anything else returns `results` in order; `searches` records each one.
+    """
+
+    def __init__(self, known: list[str] | None = None, results: list | None = None, fail: bool = False) -> None:
+        self.known = {normalize_arxiv_id(arxiv_id): arxiv_result(arxiv_id) for arxiv_id in known or []}
+        self.results_ = results or []
+        self.fail = fail
+        self.searches: list = []
+        self.yielded = 0
+
+    def results(self, search):
+        self.searches.append(search)
+        if self.fail:
+            raise arxiv.ArxivError("http://arxiv", 3, "unavailable")
+        if search.id_list:
+            # arXiv answers with the latest version
+            return iter([self.known[key] for i in search.id_list if (key := normalize_arxiv_id(i)) in self.known])
+        return self._iterate()
+
+    def _iterate(self):
+        for result in self.results_:
+            self.yielded += 1
+            yield result
+
+
+def s2_paper(paper_id: str, arxiv_id: str | None = None, *, year: int = 2024, citations: int = 0, **extra) -> dict:
+    return {
+        "paperId": paper_id,
+        "externalIds": {"ArXiv": arxiv_id} if arxiv_id else {},
+        "title": f"Paper {paper_id}",
+        "abstract": f"Abstract of {paper_id}.",
+        "year": year,
+        "citationCount": citations,
+        **extra,
+    }
+
+
+class FakeS2:
+    """
+    Stands in for AsyncSemanticScholar. `papers` are looked up by S2 id or
+    "arXiv:<id>", `recommend(seeds)` picks what a seed list is recommended
+    (everything in `recommended` by default) and `throttled` calls raise
+    the package's 429 error first. `calls` records (method, args).
+    """
+
+    def __init__(
+        self,
+        papers: list[dict] | None = None,
+        recommended: list[dict] | None = None,
+        *,
+        recommend: t.Callable[[list[str]], list[dict]] | None = None,
+        citations: dict[str, list[dict]] | None = None,
+        references: dict[str, list[dict]] | None = None,
+        throttled: int = 0,
+    ) -> None:
+        self.papers: dict[str, dict] = {}
+        for paper in [*(papers or []), *(recommended or [])]:
+            self.papers[paper["paperId"]] = paper
+            if arxiv_id := paper["externalIds"].get("ArXiv"):
+                self.papers[f"arXiv:{arxiv_id}"] = paper
+        self.recommend = recommend or (lambda seeds: list(recommended or []))
+        self.citations = citations or {}
+        self.references = references or {}
+        self.throttled = throttled
+        self.calls: list[tuple[str, t.Any]] = []
+
+    def _call(self, method: str, args: t.Any) -> None:
+        self.calls.append((method, args))
+        if self.throttled:
+            self.throttled -= 1
+            raise ConnectionRefusedError("HTTP status 429 Too Many Requests.")
+
+    def count(self, method: str) -> int:
+        return sum(1 for name, _ in self.calls if name == method)
+
+    async def get_recommended_papers_from_lists(self, seeds: list[str], fields=None, limit: int = 100):
+        self._call("recommend", seeds)
+        return [types.SimpleNamespace(raw_data=paper) for paper in self.recommend(seeds)[:limit]]
+
+    async def get_papers(self, paper_ids: list[str], fields=None):
+        self._call("papers", paper_ids)
+        return [types.SimpleNamespace(raw_data=self.papers[i]) for i in paper_ids if i in self.papers]
+
+    async def get_paper_citations(self, paper_id: str, fields=None, limit: int = 100):
+        self._call("citations", paper_id)
+        key = paper_id.removeprefix("arXiv:")
+        return types.SimpleNamespace(raw_data=[{"citingPaper": p} for p in self.citations.get(key, [])[:limit]])
+
+    async def get_paper_references(self, paper_id: str, fields=None, limit: int = 100):
+        self._call("references", paper_id)
+        key = paper_id.removeprefix("arXiv:")
+        return types.SimpleNamespace(raw_data=[{"citedPaper": p} for p in self.references.get(key, [])[:limit]])
@@ -0,0 +1,84 @@
+import pytest
+
+import arxiv_utils
+from _types import Paper, normalize_arxiv_id
+from arxiv_utils import _lookup_ids, fill_papers_with_arxiv, search_arxiv_by_ids
+from cache_utils import MISS, ResponseCache
+from fakes import FakeArxiv
+
+
+@pytest.fixture
+def fake_arxiv(monkeypatch):
+    def install(client: FakeArxiv) -> FakeArxiv:
+        monkeypatch.setattr(arxiv_utils, "get_arxiv_clients", lambda: (client, client))
+        return client
+
+    return install
+
+
+@pytest.mark.parametrize(
+    "arxiv_id, normalized",
+    [("2401.00001", "2401.00001"), ("2401.00001v3", "2401.00001"), (" arXiv:2401.00001v1 ", "2401.00001")],
+)
+def test_normalize_arxiv_id(arxiv_id, normalized):
+    assert normalize_arxiv_id(arxiv_id) == normalized
+
+
+def test_ids_are_looked_up_in_chunks(fake_arxiv, monkeypatch):
+    monkeypatch.setattr(arxiv_utils, "ARXIV_ID_LIST_CHUNK", 2)
+    ids = [f"2401.0000{i}" for i in range(5)]
+    client = fake_arxiv(FakeArxiv(known=[f"{i}v2" for i in ids[:4]]))
+    results, requests, failed = search_arxiv_by_ids(ids)
+
+    assert requests == 3
+    assert [len(search.id_list) for search in client.searches] == [2, 2, 1]
+    assert sorted(results) == ids[:4]
+    assert not failed
+
+
+def test_failed_chunks_are_reported_not_treated_as_missing(fake_arxiv):
+    fake_arxiv(FakeArxiv(fail=True))
+    results, requests, failed = search_arxiv_by_ids(["2401.00001"])
+    assert results == {}
+    assert failed == {"2401.00001"}
+
+
+def test_lookups_use_the_cache_and_cache_what_they_find(fake_arxiv, tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    cache.set("arxiv_id", "2401.00001", {"title": "Cached"})
+    client = fake_arxiv(FakeArxiv(known=["2401.00002"]))
+    found, requests = _lookup_ids(["2401.00001", "2401.00002", "2401.00003"], cache, None)
+
+    assert client.searches[0].id_list == ["2401.00002", "2401.00003"]
+    assert found["2401.00001"] == {"title": "Cached"}
+    assert found["2401.00002"]["title"] == "Paper 2401.00002"
+    assert found["2401.00003"] is None
+    assert cache.get("arxiv_id", "2401.00003") is None
+    assert cache.get("arxiv_id", "2401.00002") is not MISS
+
+
+def test_fill_resolves_ids_in_bulk_then_falls_back_to_titles(fake_arxiv, monkeypatch):
+    fake_arxiv(FakeArxiv(known=["2401.00001"]))
+    titles: list[str] = []
+    monkeypatch.setattr(arxiv_utils, "_lookup_title", lambda title, cache, mirror: titles.append(title))
+    papers = [
+        Paper(url="https://arxiv.org/abs/2401.00001"),
+        Paper(title="Only a title"),
+        Paper(
+            title="Complete",
+            url="https://arxiv.org/abs/2401.00009",
+            authors=["A"],
+            published=arxiv_utils.datetime(2024, 1, 1),
+        ),
+    ]
+    fill_papers_with_arxiv(papers)
+
+    assert papers[0].title == "Paper 2401.00001"
+    assert papers[0].abstract == "Abstract of 2401.00001."
+    assert titles == ["Only a title"]
+
+
+def test_versioned_ids_match_their_results(fake_arxiv):
+    fake_arxiv(FakeArxiv(known=["2401.00001v3"]))
+    found, _ = _lookup_ids(["2401.00001v2"], None, None)
+    assert found["2401.00001v2"]["entry_id"] == "http://arxiv.org/abs/2401.00001v3"
@@ -0,0 +1,65 @@
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+import http_utils
+from _types import Paper
+from benchmark import NOTION_PAGE_SIZE, StubConfig, StubServer, measure_import_time
+from notion_utils import get_notion_client, get_papers_from_notion, write_papers_to_notion
+from rate_utils import TokenBucket
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    # A fresh pool per test - pooled async connections belong to the loop that opened them
+    monkeypatch.setattr(http_utils, "_pools", {})
+    servers: list[StubServer] = []
+
+    def start(size: int, **config) -> StubServer:
+        server = StubServer(size, StubConfig(latency=0, **config))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_notion_stub_pages_through_the_synthetic_database(stub):
+    server = stub(NOTION_PAGE_SIZE * 2 + 50)
+    client = get_notion_client("stub", f"{server.url}/notion")
+
+    async def run() -> tuple[list[Paper], list[Paper]]:
+        papers = await get_papers_from_notion(client, "benchmark")
+        await write_papers_to_notion(client, "benchmark", [Paper(title="New")], limiter=TokenBucket(1000))
+        return papers, await get_papers_from_notion(client, "benchmark")
+
+    papers, after = asyncio.run(run())
+
+    assert len(papers) == NOTION_PAGE_SIZE * 2 + 50
+    # Created pages are kept, so a second run reads them back
+    assert len(after) == len(papers) + 1
+    assert "New" in {paper.title for paper in after}
+    # Schema and three queries per read, plus the create
+    assert server.stats.requests == {"notion": 9}
+
+
+def test_injected_faults_are_counted(stub):
+    server = stub(1, throttle_rate=1.0)
+    response = httpx.get(f"{server.url}/s2/graph/v1/paper/batch")
+
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+    assert server.stats.throttled == {"s2": 1}
+
+
+def test_import_time_is_measured_for_the_module_and_its_imports():
+    total, children = measure_import_time("notion_utils", runs=1)
+
+    assert total > 0
+    assert "http_utils" in {name for _, name in children}
+    assert [ms for ms, _ in children] == sorted((ms for ms, _ in children), reverse=True)
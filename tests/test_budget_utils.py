@@ -0,0 +1,60 @@
+import types
+
+import pytest
+
+from budget_utils import FALLBACK_PRICE, OPENAI_PRICES, SpendGovernor, model_price, usage_cost, usage_tokens
+
+
+def test_dated_snapshots_cost_the_same_as_their_alias():
+    assert model_price("gpt-4o-mini-2024-07-18") is OPENAI_PRICES["gpt-4o-mini"]
+    assert model_price("gpt-4o-2024-08-06") is OPENAI_PRICES["gpt-4o"]
+    # Unknown models are charged as the priciest we know, erring towards stopping early
+    assert model_price("unknown-model") is FALLBACK_PRICE
+
+
+def test_usage_cost_discounts_cached_prompts_and_batches():
+    # gpt-4o-mini: $0.15 in, $0.075 cached in, $0.60 out per million tokens
+    assert usage_cost("gpt-4o-mini", 1_000_000, 1_000_000) == pytest.approx(0.75)
+    assert usage_cost("gpt-4o-mini", 1_000_000, 0, cached_tokens=500_000) == pytest.approx(0.1125)
+    assert usage_cost("gpt-4o-mini", 1_000_000, 1_000_000, batch=True) == pytest.approx(0.375)
+
+
+def test_usage_is_read_from_sdk_objects_and_batch_output_dicts():
+    sdk = types.SimpleNamespace(
+        prompt_tokens=100, completion_tokens=20, prompt_tokens_details=types.SimpleNamespace(cached_tokens=64)
+    )
+    assert usage_tokens(sdk) == (100, 20, 64)
+    assert usage_tokens({"prompt_tokens": 100, "completion_tokens": 20}) == (100, 20, 0)
+    assert usage_tokens(None) == (0, 0, 0)
+
+
+def test_reservations_in_flight_count_against_the_ceiling():
+    governor = SpendGovernor(max_tokens=1000)
+    first = governor.reserve("gpt-4o-mini", 400, 100)
+    second = governor.reserve("gpt-4o-mini", 400, 100)
+
+    assert first and second
+    assert governor.reserve("gpt-4o-mini", 1, 0) is None
+    assert governor.exhausted and governor.skipped == 1
+
+    # Settling charges what was actually used and frees the rest
+    governor.settle(first, "gpt-4o-mini", {"prompt_tokens": 300, "completion_tokens": 50})
+    assert governor.tokens == 350
+    assert governor.reserve("gpt-4o-mini", 100, 50)
+
+
+def test_released_reservations_cost_nothing():
+    governor = SpendGovernor(max_dollars=0.001)
+    reservation = governor.reserve("gpt-4o-mini", 4000, 200)
+    assert reservation is not None
+    assert governor.reserve("gpt-4o-mini", 4000, 200) is None
+
+    governor.release(reservation)
+    assert (governor.tokens, governor.dollars) == (0, 0.0)
+    assert governor.reserve("gpt-4o-mini", 4000, 200)
+
+
+def test_no_ceiling_never_skips():
+    governor = SpendGovernor()
+    assert all(governor.reserve("gpt-4o", 10**6, 10**6) for _ in range(10))
+    assert str(governor) == "0 tokens, $0.0000 of no ceiling"
@@ -0,0 +1,94 @@
+import time
+
+from cache_utils import MISS, NEGATIVE_CACHE_MAX_DAYS, RESPONSE_CACHE_TTLS, LLMCache, ResponseCache
+
+
+def test_llm_cache_round_trips_and_counts(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm.sqlite"))
+    key = LLMCache.key({"model": "m", "messages": [{"role": "user", "content": "x"}]})
+    assert cache.get(key) is None
+    cache.set(key, "answer")
+    assert cache.get(key) == "answer"
+    assert (cache.hits, cache.misses, cache.size) == (1, 1, 1)
+
+
+def test_llm_cache_key_ignores_dict_order_but_not_content():
+    assert LLMCache.key({"a": 1, "b": 2}) == LLMCache.key({"b": 2, "a": 1})
+    assert LLMCache.key({"a": 1}) != LLMCache.key({"a": 2})
+
+
+def test_llm_cache_evicts_least_recently_used(tmp_path):
+    path = str(tmp_path / "llm.sqlite")
+    cache = LLMCache(path, max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, key)
+        time.sleep(0.01)
+    cache.get("a")
+    cache.close()
+
+    cache = LLMCache(path, max_entries=2)
+    assert cache.size == 2
+    assert cache.get("a") == "a"
+    assert cache.get("b") is None
+
+
+def test_llm_cache_evicts_old_entries(tmp_path):
+    path = str(tmp_path / "llm.sqlite")
+    cache = LLMCache(path)
+    cache.set("old", "value")
+    cache.close()
+
+    cache = LLMCache(path, max_age_days=-1)
+    assert cache.get("old") is None
+
+
+def _ttl_days(cache: ResponseCache, source: str) -> list[float]:
+    return [round((expires - fetched) / 86400, 3) for _, _, _, fetched, expires, _ in cache.entries(source)]
+
+
+def test_response_cache_tells_not_found_from_missing(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    assert cache.get("arxiv_id", "2401.00001") is MISS
+
+    cache.set("arxiv_id", "2401.00001", {"title": "Found"})
+    cache.set("arxiv_id", "2401.00002", None)
+
+    assert cache.get("arxiv_id", "2401.00001") == {"title": "Found"}
+    assert cache.get("arxiv_id", "2401.00002") is None
+    assert cache.get("arxiv_title", "2401.00001") is MISS
+    assert (cache.hits, cache.misses) == (2, 2)
+    # Newest first: the "not found" is re-checked long before the hit goes stale
+    assert _ttl_days(cache, "arxiv_id") == [1, RESPONSE_CACHE_TTLS["arxiv_id"]]
+
+
+def test_not_found_rechecks_back_off_until_found(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    ttls = []
+    for _ in range(8):
+        cache.set("s2_paper", "missing", None)
+        ttls.extend(_ttl_days(cache, "s2_paper"))
+
+    assert ttls == [1, 2, 4, 8, 16, 32, NEGATIVE_CACHE_MAX_DAYS, NEGATIVE_CACHE_MAX_DAYS]
+
+    # Found at last - a later miss starts the back-off over
+    cache.set("s2_paper", "missing", {"paperId": "p"})
+    cache.set("s2_paper", "missing", None)
+    assert _ttl_days(cache, "s2_paper") == [1]
+
+
+def test_expired_responses_miss_and_can_be_purged(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    cache.set("arxiv_id", "fresh", {"title": "Fresh"})
+    cache.set("arxiv_id", "stale", {"title": "Stale"})
+    cache.set("arxiv_id", "empty", None)
+    cache.set("s2_paper", "empty", None)
+    cache._db.execute("UPDATE responses SET expires = 0 WHERE key = 'stale'")
+
+    assert cache.get("arxiv_id", "stale") is MISS
+    assert cache.stats() == [("arxiv_id", 3, 1, 1), ("s2_paper", 1, 1, 0)]
+
+    assert cache.purge(expired=True) == 1
+    assert cache.purge("arxiv_id", empty=True) == 1
+    assert cache.get("s2_paper", "empty") is None
+    assert cache.purge() == 2
+    assert cache.get("arxiv_id", "fresh") is MISS
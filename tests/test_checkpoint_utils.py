@@ -0,0 +1,92 @@
+import json
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+from _types import AttackType, Focus, Paper
+from checkpoint_utils import Checkpoint, checkpoint_key
+
+
+def _loaded(i: int, **fields) -> Paper:
+    return Paper(page_id=f"page-{i}", url=f"https://arxiv.org/abs/2401.0000{i}", track_changes=True, **fields)
+
+
+def test_checkpoint_keys_prefer_arxiv_ids():
+    assert checkpoint_key(_loaded(1)) == "arxiv:2401.00001"
+    assert checkpoint_key(Paper(page_id="page-1", title="Title")) == "page-1"
+    assert checkpoint_key(Paper(title="A Title!")) == "title:atitle"
+    assert checkpoint_key(Paper()) is None
+
+
+def test_unsaved_changes_survive_a_restart(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    enriched = _loaded(1, title="Enriched")
+    enriched.summary = "Summary"
+    enriched.focus = Focus.Offensive
+    enriched.attack_type = AttackType.PromptInjection
+    discovered = Paper(
+        title="Discovered",
+        url="https://arxiv.org/abs/2401.00009",
+        abstract="Abstract",
+        published=datetime(2024, 1, 9, tzinfo=timezone.utc),
+    )
+    checkpoint = Checkpoint(path)
+    checkpoint.save([enriched, _loaded(2, title="Untouched"), discovered], stage="arxiv_search")
+
+    resumed = Checkpoint(path, resume=True)
+    reloaded = [_loaded(1, title="Enriched"), _loaded(2, title="Untouched")]
+    new = resumed.restore(reloaded)
+
+    assert resumed.run == checkpoint.run
+    assert resumed.done("arxiv_search")
+    assert set(resumed.entries) == {"arxiv:2401.00001", "arxiv:2401.00009"}
+    assert reloaded[0].summary == "Summary"
+    assert reloaded[0].focus is Focus.Offensive
+    assert reloaded[0].changed_fields() == {"summary", "focus", "attack_type"}
+    assert not reloaded[1].has_changed()
+    assert [paper.title for paper in new] == ["Discovered"]
+    assert new[0].abstract == "Abstract"
+    assert new[0].published == datetime(2024, 1, 9, tzinfo=timezone.utc)
+
+
+def test_checkpoints_are_ignored_without_resume(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    Checkpoint(path).save([Paper(title="Discovered")], stage="s2_recommend")
+
+    fresh = Checkpoint(path)
+    assert not fresh.entries
+    assert not fresh.done("s2_recommend")
+
+
+def test_only_discovery_stages_can_be_skipped(tmp_path):
+    with pytest.raises(AssertionError):
+        Checkpoint(str(tmp_path / "checkpoint.json")).save([], stage="notion_write")
+
+
+def test_finishing_keeps_failed_writes_but_not_stages(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    checkpoint = Checkpoint(path)
+    failed = Paper(title="Failed to write")
+    checkpoint.save([failed], stage="arxiv_fill")
+    checkpoint.finish([failed])
+
+    state = json.load(open(path))
+    assert state["stages"] == []
+    assert list(state["papers"]) == ["title:failedtowrite"]
+
+    # A later --resume retries the write but runs discovery again
+    resumed = Checkpoint(path, resume=True)
+    assert resumed.entries
+    assert not resumed.done("arxiv_fill")
+
+
+def test_finishing_with_everything_written_removes_the_checkpoint(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    checkpoint = Checkpoint(path)
+    written = Paper(title="Written")
+    checkpoint.save([written], stage="arxiv_fill")
+    written.mark_saved()
+    checkpoint.finish([written])
+
+    assert not os.path.exists(path)
@@ -0,0 +1,58 @@
+import pytest
+
+from config_utils import load_targets, make_target
+
+STATE_PATHS = {
+    "checkpoint": ".paperstack/checkpoint.json",
+    "rejected": ".paperstack/rejected.json",
+    "openai_batch_state": ".paperstack/openai_batch.json",
+    "frontier": ".paperstack/s2_frontier.json",
+}
+
+
+def _load(tmp_path, config: str):
+    path = tmp_path / "targets.toml"
+    path.write_text(config)
+    return load_targets(str(path), arxiv_search_query="default query", **STATE_PATHS)
+
+
+def test_a_single_target_keeps_the_default_state_paths():
+    target = make_target("db-1", "query", **STATE_PATHS)
+
+    assert target.name == "db-1"
+    assert target.checkpoint == STATE_PATHS["checkpoint"]
+    assert target.frontier == STATE_PATHS["frontier"]
+
+
+def test_targets_get_their_own_state_files(tmp_path):
+    targets = _load(
+        tmp_path,
+        """
+        [[targets]]
+        name = "llm security"
+        database_id = "db-1"
+        arxiv_search_query = "prompt injection"
+
+        [[targets]]
+        database_id = "db-2"
+        """,
+    )
+
+    assert [(t.name, t.database_id, t.arxiv_search_query) for t in targets] == [
+        ("llm security", "db-1", "prompt injection"),
+        ("db-2", "db-2", "default query"),
+    ]
+    assert targets[0].checkpoint == ".paperstack/checkpoint-llm-security.json"
+    assert targets[0].rejected == ".paperstack/rejected-llm-security.json"
+    assert targets[1].openai_batch_state == ".paperstack/openai_batch-db-2.json"
+    assert targets[1].frontier == ".paperstack/s2_frontier-db-2.json"
+
+
+def test_targets_need_a_database_id(tmp_path):
+    with pytest.raises(ValueError, match="no database_id"):
+        _load(tmp_path, '[[targets]]\nname = "missing"\n')
+
+
+def test_target_names_must_be_unique(tmp_path):
+    with pytest.raises(ValueError, match="unique"):
+        _load(tmp_path, '[[targets]]\ndatabase_id = "a"\nname = "x"\n\n[[targets]]\ndatabase_id = "b"\nname = "x"\n')
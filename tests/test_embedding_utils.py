@@ -0,0 +1,141 @@
+import asyncio
+import types
+
+import numpy as np
+
+from _types import AttackType, Focus, Paper
+from budget_utils import SpendGovernor
+from embedding_utils import EmbeddingCache, EmbeddingIndex, embed_papers, propagate_labels, rank_by_similarity
+from fakes import FakeOpenAI
+from openai_utils import get_paper_enricher
+
+
+class FakeEmbeddings:
+    # Each text embeds along the axis named by its first abstract word
+    AXES = ("injection", "poisoning", "evasion")
+
+    def __init__(self) -> None:
+        self.inputs: list[list[str]] = []
+        self.embeddings = types.SimpleNamespace(create=self._create)
+
+    async def _create(self, model: str, input: list[str]):
+        self.inputs.append(input)
+        data = [
+            types.SimpleNamespace(index=i, embedding=self._embed(text)) for i, text in reversed(list(enumerate(input)))
+        ]
+        return types.SimpleNamespace(data=data, usage=types.SimpleNamespace(prompt_tokens=len(input)))
+
+    def _embed(self, text: str) -> list[float]:
+        vector = [0.0] * len(self.AXES)
+        vector[self.AXES.index(text.split("\n\n")[1].split()[0])] = 2.0
+        return vector
+
+
+def _paper(title: str, abstract: str | None, **labels) -> Paper:
+    return Paper(title=title, abstract=abstract, **labels)
+
+
+def _unit(*rows: list[float]) -> np.ndarray:
+    vectors = np.array(rows, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_only_uncached_texts_are_embedded(tmp_path):
+    path = str(tmp_path / "embeddings.npz")
+    client = FakeEmbeddings()
+    papers = [_paper("a", "injection attacks"), _paper("b", "evasion attacks"), _paper("c", None)]
+    cache = EmbeddingCache(path)
+    vectors = asyncio.run(embed_papers(client, papers, cache))
+    cache.save()
+
+    assert vectors.shape == (3, 3)
+    # Unit length, lined up with the papers, zeros for papers without text
+    assert np.allclose(vectors, [[1, 0, 0], [0, 0, 1], [0, 0, 0]])
+
+    cache = EmbeddingCache(path)
+    papers.append(_paper("d", "poisoning attacks"))
+    again = asyncio.run(embed_papers(client, papers + [papers[0]], cache))
+
+    assert client.inputs[-1] == ["d\n\npoisoning attacks"]
+    assert np.allclose(again[0], again[4])
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_embeddings_are_charged_to_the_spend_governor(tmp_path):
+    client = FakeEmbeddings()
+    papers = [_paper("a", "injection attacks"), _paper("b", "evasion attacks")]
+    governor = SpendGovernor(max_dollars=1.0)
+    asyncio.run(embed_papers(client, papers, EmbeddingCache(str(tmp_path / "a.npz")), governor=governor))
+
+    # The fake reports a token per text
+    assert governor.tokens == 2
+    assert governor.dollars > 0
+
+    # Past the ceiling nothing is sent and the papers get zero rows
+    client = FakeEmbeddings()
+    governor = SpendGovernor(max_tokens=1)
+    vectors = asyncio.run(embed_papers(client, papers, EmbeddingCache(str(tmp_path / "b.npz")), governor=governor))
+
+    assert not client.inputs
+    assert governor.skipped == 1
+    assert not vectors.any()
+
+
+def test_search_returns_the_nearest_papers_first():
+    papers = [_paper(str(i), "x") for i in range(4)]
+    vectors = _unit([1, 0], [0, 1], [1, 1], [1, 0])
+    vectors[3] = 0
+    index = EmbeddingIndex(papers, vectors)
+
+    scores, indices = index.search(_unit([1, 0.1]), k=5)
+
+    # The paper without an embedding isn't indexed
+    assert len(index) == 3
+    assert [index.papers[i].title for i in indices[0]] == ["0", "2", "1"]
+    assert scores[0][0] > scores[0][1] > scores[0][2]
+
+
+def test_new_papers_are_ranked_by_similarity_to_the_corpus():
+    corpus = EmbeddingIndex([_paper("a", "x"), _paper("b", "x")], _unit([1, 0], [1, 0.2]))
+    near, far = _paper("near", "x"), _paper("far", "x")
+
+    ranked = rank_by_similarity(corpus, [far, near], _unit([0, 1], [1, 0.1]), k=2)
+
+    assert [paper.title for _, paper in ranked] == ["near", "far"]
+
+
+def test_labels_propagate_only_when_neighbours_agree():
+    labelled = [
+        _paper(f"{i}", "x", focus=Focus.Offensive, attack_type=AttackType.PromptInjection if i < 2 else None)
+        for i in range(4)
+    ]
+    labelled += [_paper("other", "x", focus=Focus.Defensive, attack_type=AttackType.ModelEvasion)]
+    index = EmbeddingIndex(labelled, _unit([1, 0], [1, 0.05], [1, 0.1], [1, 0.15], [0, 1]))
+
+    agreed = _paper("agreed", "x")
+    already = _paper("already", "x", focus=Focus.Safety)
+    distant = _paper("distant", "x")
+    count = propagate_labels(index, [agreed, already, distant], _unit([1, 0.02], [1, 0.02], [-1, 0]))
+
+    assert count == 1
+    assert agreed.focus is Focus.Offensive
+    # Only two neighbours carry an attack type - too few votes
+    assert agreed.attack_type is None
+    assert already.focus is Focus.Safety
+    assert distant.focus is None
+
+
+def test_knn_labelled_papers_only_ask_the_llm_for_a_summary():
+    neighbours = [_paper(f"{i}", "x", focus=Focus.Offensive, attack_type=AttackType.PromptInjection) for i in range(3)]
+    index = EmbeddingIndex(neighbours, _unit([1, 0], [1, 0.05], [1, 0.1]))
+    paper = _paper("new", "A new abstract.")
+    assert propagate_labels(index, [paper], _unit([1, 0.02])) == 1
+
+    client = FakeOpenAI(default='{"summary": "A short summary."}')
+    asyncio.run(get_paper_enricher(client, requests_per_minute=60_000, tokens_per_minute=10**9)(paper))
+
+    schema = client.requests[0]["response_format"]["json_schema"]["schema"]
+    assert list(schema["properties"]) == ["summary"]
+    assert "attack_type" not in client.requests[0]["messages"][0]["content"]
+    assert paper.summary == "A short summary."
+    assert paper.attack_type is AttackType.PromptInjection
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+import http_utils
+from benchmark import StubConfig, StubServer
+from http_utils import (
+    HTTP_DEFAULT_TIMEOUT,
+    _cap_connect,
+    connection_summary,
+    get_async_http_client,
+    get_http_client,
+    get_http_session,
+    http_timeout,
+)
+from metrics_utils import METRICS
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(http_utils, "_pools", {})
+    server = StubServer(0, StubConfig(latency=0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _connections(service: str) -> tuple[int, int]:
+    totals = METRICS.report()["totals"].get(service, {})
+    return totals.get("connections", 0), totals.get("reused", 0)
+
+
+def test_timeouts_are_per_host():
+    assert http_timeout("https://api.openai.com/v1/chat/completions") == (5, 120)
+    assert http_timeout("https://export.arxiv.org/api/query") == (10, 60)
+    assert http_timeout("https://example.com") == HTTP_DEFAULT_TIMEOUT
+    assert http_timeout(None) == HTTP_DEFAULT_TIMEOUT
+
+
+def test_flat_timeouts_still_connect_within_the_hosts_limit():
+    request = httpx.Request("GET", "https://api.notion.com")
+    request.extensions["timeout"] = {"connect": 60, "read": 60, "write": 60, "pool": 60}
+    _cap_connect(request, 5)
+
+    assert request.extensions["timeout"] == {"connect": 5, "read": 60, "write": 60, "pool": 60}
+
+
+def test_sync_clients_share_one_pool_and_count_reuse(server):
+    with get_http_client("test-sync", server.url) as first:
+        first.get(f"{server.url}/s2/paper")
+    # Closing a client leaves the shared pool - and its warm connection - open
+    with get_http_client("test-sync-other", server.url) as second:
+        second.get(f"{server.url}/s2/paper")
+        second.get(f"{server.url}/s2/paper")
+
+    assert _connections("test-sync") == (1, 0)
+    assert _connections("test-sync-other") == (0, 2)
+
+
+def test_async_clients_count_new_and_reused_connections(server):
+    async def run() -> None:
+        async with get_async_http_client("test-async", server.url) as client:
+            for _ in range(3):
+                await client.get(f"{server.url}/s2/paper")
+
+    asyncio.run(run())
+    assert _connections("test-async") == (1, 2)
+    assert "test-async 1 opened/2 reused" in connection_summary()
+
+
+def test_requests_sessions_share_one_pool_and_get_a_timeout(server, monkeypatch):
+    sent: list[dict] = []
+    send = http_utils._pool("requests").send
+
+    def record(request, **kwargs):
+        sent.append(kwargs)
+        return send(request, **kwargs)
+
+    monkeypatch.setattr(http_utils._pool("requests"), "send", record)
+    get_http_session("test-requests", server.url).get(f"{server.url}/s2/paper")
+    get_http_session("test-requests", server.url).get(f"{server.url}/s2/paper", timeout=3)
+
+    assert _connections("test-requests") == (1, 1)
+    assert [kwargs["timeout"] for kwargs in sent] == [HTTP_DEFAULT_TIMEOUT, 3]
+
+
+def test_http2_falls_back_without_h2(monkeypatch, capsys):
+    monkeypatch.setattr(http_utils, "_http2", False)
+    monkeypatch.setattr(http_utils.importlib.util, "find_spec", lambda name: None)
+    http_utils.configure_http(http2=True)
+
+    assert http_utils._http2 is False
+    assert "HTTP/2 needs the h2 package" in capsys.readouterr().out
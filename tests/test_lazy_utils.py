@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+import types
+
+import pytest
+
+from lazy_utils import lazy_import
+
+# Only imported once a run actually needs them
+HEAVY_MODULES = ("arxiv", "httpx", "notion_client", "numpy", "openai", "semanticscholar", "tiktoken", "tqdm")
+
+
+def test_modules_only_run_on_first_attribute_access(tmp_path, monkeypatch):
+    (tmp_path / "lazy_probe.py").write_text("open(__file__ + '.ran', 'w').close()\nVALUE = 42\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "lazy_probe", raising=False)
+
+    module = lazy_import("lazy_probe")
+    assert sys.modules["lazy_probe"] is module
+    assert not (tmp_path / "lazy_probe.py.ran").exists()
+
+    assert module.VALUE == 42
+    assert (tmp_path / "lazy_probe.py.ran").exists()
+    assert lazy_import("lazy_probe") is module
+
+
+def test_loaded_modules_are_returned_as_they_are():
+    assert lazy_import("json") is sys.modules["json"]
+
+
+def test_missing_modules_fail_straight_away():
+    with pytest.raises(ModuleNotFoundError):
+        lazy_import("paperstack_no_such_module")
+
+
+def test_importing_paperstack_leaves_heavy_dependencies_unloaded():
+    check = (
+        "import sys, types, paperstack\n"
+        f"print(' '.join(m for m in {HEAVY_MODULES!r} if type(sys.modules.get(m)) is types.ModuleType))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", check],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.split() == []
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import time
+
+import pipeline_utils
+from metrics_utils import RunMetrics
+from pipeline_utils import iter_list, timed
+
+
+def test_counters_land_in_the_active_stage():
+    metrics = RunMetrics()
+    metrics.record("notion", calls=1)
+    with metrics.stage("write", flush=False):
+        metrics.record("notion", calls=2, retries=1)
+        with metrics.stage("enrich", flush=False):
+            metrics.record("openai", calls=1, prompt_tokens=100)
+        metrics.record("notion", calls=1)
+
+    report = metrics.report()
+    assert report["stages"]["other"]["services"]["notion"]["calls"] == 1
+    assert report["stages"]["write"]["services"]["notion"]["calls"] == 3
+    assert report["stages"]["enrich"]["services"]["openai"]["prompt_tokens"] == 100
+    assert report["totals"]["notion"]["calls"] == 4
+    assert report["totals"]["notion"]["retries"] == 1
+
+
+def test_gathered_work_stays_in_the_stage_that_started_it():
+    metrics = RunMetrics()
+
+    async def call(service: str) -> None:
+        await asyncio.sleep(0)
+        metrics.record(service, calls=1)
+
+    async def run() -> None:
+        with metrics.stage("search", flush=False):
+            task = asyncio.gather(call("arxiv"), call("arxiv"))
+        with metrics.stage("write", flush=False):
+            await task
+
+    asyncio.run(run())
+    assert metrics.report()["stages"]["search"]["services"]["arxiv"]["calls"] == 2
+
+
+def test_stage_time_accumulates():
+    metrics = RunMetrics()
+    for _ in range(2):
+        with metrics.stage("search", flush=False):
+            time.sleep(0.01)
+
+    assert metrics.stages["search"].wall_s >= 0.02
+
+
+def test_prometheus_exposition():
+    metrics = RunMetrics()
+    with metrics.stage("write", flush=False):
+        metrics.record("notion", calls=3)
+
+    text = metrics.prometheus()
+    assert 'paperstack_stage_seconds{stage="write"}' in text
+    assert 'paperstack_calls_total{stage="write",service="notion"} 3' in text
+    assert "# TYPE paperstack_retries_total counter" in text
+
+
+def test_stages_flush_the_report(tmp_path):
+    metrics = RunMetrics()
+    metrics.report_path = str(tmp_path / "reports" / "run.json")
+    metrics.prometheus_path = str(tmp_path / "run.prom")
+    with metrics.stage("search"):
+        metrics.record("arxiv", calls=1)
+
+    assert json.load(open(metrics.report_path))["totals"]["arxiv"]["calls"] == 1
+    assert "paperstack_calls_total" in open(metrics.prometheus_path).read()
+
+
+def test_timed_sources_exclude_the_consumers_time(monkeypatch):
+    metrics = RunMetrics()
+    monkeypatch.setattr(pipeline_utils, "METRICS", metrics)
+
+    async def run() -> int:
+        count = 0
+        async for _ in timed(iter_list([None, None]), "search"):  # type: ignore[list-item]
+            count += 1
+            await asyncio.sleep(0.05)
+        return count
+
+    assert asyncio.run(run()) == 2
+    assert metrics.stages["search"].wall_s < 0.05
@@ -0,0 +1,132 @@
+import threading
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import benchmark
+import http_utils
+import mirror_utils
+from benchmark import ARXIV_SEARCH_TOTAL, StubConfig, StubServer
+from mirror_utils import ArxivMirror, _parse_record, to_fts_query
+
+RECORD = """\
+<record xmlns="http://www.openarchives.org/OAI/2.0/">
+  <header><identifier>oai:arXiv.org:2401.00001</identifier><datestamp>2024-01-03</datestamp></header>
+  <metadata>
+    <arXiv xmlns="http://arxiv.org/OAI/arXiv/">
+      <created>2024-01-01</created>
+      <authors>
+        <author><keyname>Lovelace</keyname><forenames>Ada</forenames></author>
+        <author><keyname>Turing</keyname><forenames>Alan M.</forenames><suffix>Jr</suffix></author>
+      </authors>
+      <title>Prompt Injection
+        in the Wild</title>
+      <categories>cs.CR cs.CL</categories>
+      <abstract>  We study prompt
+        injection.  </abstract>
+    </arXiv>
+  </metadata>
+</record>"""
+
+
+def _record(title: str, abstract: str, published: str, categories: str = "cs.CR") -> dict:
+    return {
+        "title": title,
+        "abstract": abstract,
+        "authors": ["Ada Lovelace"],
+        "published": published,
+        "categories": categories,
+    }
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    mirror = ArxivMirror(str(tmp_path / "mirror.sqlite"))
+    mirror._store(
+        [
+            ("2401.00001", _record("Prompt injection attacks", "Attacks on LLM agents.", "2024-01-01")),
+            ("2401.00002", _record("Jailbreaking GPT-4", "Prompt attacks on aligned models.", "2024-01-02")),
+            ("2401.00003", _record("Protein folding", "Graph networks for proteins.", "2024-01-03", "q-bio.BM")),
+        ]
+    )
+    yield mirror
+    mirror.close()
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("ti:injection", 'title:"injection"'),
+        ('abs:"prompt injection"', 'abstract:"prompt injection"'),
+        ("cat:cs.CR AND all:llm", 'categories:"cs.CR" AND "llm"'),
+        ("(ti:llm OR abs:GPT-4) ANDNOT au:smith", '( title:"llm" OR abstract:"GPT-4" ) NOT authors:"smith"'),
+        ("jailbreak", '"jailbreak"'),
+    ],
+)
+def test_arxiv_queries_translate_to_fts(query, expected):
+    assert to_fts_query(query) == expected
+
+
+def test_oai_records_are_parsed_and_cleaned():
+    arxiv_id, record = _parse_record(ET.fromstring(RECORD))
+
+    assert arxiv_id == "2401.00001"
+    assert record["title"] == "Prompt Injection in the Wild"
+    assert record["abstract"] == "We study prompt injection."
+    assert record["authors"] == ["Ada Lovelace", "Alan M. Turing Jr"]
+    assert record["published"] == "2024-01-01T00:00:00+00:00"
+
+
+def test_withdrawn_records_are_marked_for_deletion():
+    record = ET.fromstring(
+        '<record xmlns="http://www.openarchives.org/OAI/2.0/"><header status="deleted">'
+        "<identifier>oai:arXiv.org:2401.00001v2</identifier></header></record>"
+    )
+    assert _parse_record(record) == ("2401.00001", None)
+
+
+def test_lookups_by_id_and_title(mirror):
+    assert mirror.get("arXiv:2401.00002v3")["title"] == "Jailbreaking GPT-4"
+    assert mirror.get_by_title("prompt injection ATTACKS!")["entry_id"] == "http://arxiv.org/abs/2401.00001"
+    assert mirror.get("2401.99999") is None
+    assert (mirror.hits, mirror.misses) == (2, 1)
+
+
+def test_search_is_full_text_and_newest_first(mirror):
+    assert [arxiv_id for arxiv_id, _ in mirror.search("prompt")] == ["2401.00002", "2401.00001"]
+    assert [arxiv_id for arxiv_id, _ in mirror.search("ti:prompt")] == ["2401.00001"]
+    assert [arxiv_id for arxiv_id, _ in mirror.search("cat:cs.CR ANDNOT abs:agents")] == ["2401.00002"]
+    assert [arxiv_id for arxiv_id, _ in mirror.search("prompt", 1)] == ["2401.00002"]
+
+
+def test_updates_and_deletions_reach_the_search_index(mirror):
+    mirror._store([("2401.00001", _record("Renamed", "Nothing relevant.", "2024-01-01")), ("2401.00002", None)])
+
+    assert mirror.search("prompt") == []
+    assert [arxiv_id for arxiv_id, _ in mirror.search("renamed")] == ["2401.00001"]
+    assert mirror.size == 2
+
+
+def test_harvests_page_through_sets_and_then_only_pull_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(http_utils, "_pools", {})
+    monkeypatch.setattr(benchmark, "OAI_PAGE_SIZE", 200)
+    server = StubServer(3, StubConfig(latency=0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(mirror_utils, "ARXIV_OAI_URL", f"{server.url}/oai")
+
+    mirror = ArxivMirror(str(tmp_path / "mirror.sqlite"))
+    try:
+        assert mirror.is_stale()
+        assert mirror.harvest() == 3 + ARXIV_SEARCH_TOTAL
+        assert mirror.size == 3 + ARXIV_SEARCH_TOTAL
+        assert not mirror.is_stale()
+        # Three pages of the one populated set, one empty answer for each other set
+        assert server.stats.requests["oai"] == 3 + 2
+
+        # The next harvest starts from the last one's day
+        assert mirror.harvest() < ARXIV_SEARCH_TOTAL
+        assert mirror.size == 3 + ARXIV_SEARCH_TOTAL
+    finally:
+        mirror.close()
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,275 @@
+import asyncio
+import json
+import types
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+import notion_utils
+from _types import Paper
+from notion_utils import (
+    _dirty_fields,
+    _normalize,
+    _page_to_paper,
+    get_papers_from_notion,
+    get_snapshot_path,
+    iter_papers_from_notion,
+    write_papers_to_notion,
+)
+from rate_utils import TokenBucket
+
+
+def _page(i: int, edited: str = "2025-01-01T00:00:00.000Z", **extra) -> dict:
+    return {
+        "id": f"page-{i}",
+        "last_edited_time": edited,
+        "properties": {
+            "Title": {"title": [{"plain_text": f"Paper {i}"}]},
+            "URL": {"url": f"https://arxiv.org/abs/2401.{i:05d}"},
+            "Notes": {"rich_text": [{"plain_text": "Not synced"}]},
+        },
+        **extra,
+    }
+
+
+class FakeDatabases:
+    def __init__(self, pages: list[dict], page_size: int = 2) -> None:
+        self.pages = pages
+        self.page_size = page_size
+        self.queries: list[dict] = []
+        self.fail = False
+        self.throttled = 0
+
+    async def retrieve(self, database_id: str) -> dict:
+        return {"properties": {name: {"id": f"id-{name}"} for name in notion_utils.NOTION_PROPERTIES}}
+
+    async def query(self, database_id: str, **kwargs) -> dict:
+        self.queries.append(kwargs)
+        if self.fail:
+            raise notion_utils.notion_client.errors.RequestTimeoutError()
+        if self.throttled:
+            self.throttled -= 1
+            errors = notion_utils.notion_client.errors
+            response = httpx.Response(429, headers={"retry-after": "0"}, request=httpx.Request("POST", "http://n"))
+            raise errors.APIResponseError(response, "slow down", errors.APIErrorCode.RateLimited)
+        start = int(kwargs.get("start_cursor") or 0)
+        end = start + self.page_size
+        return {
+            "results": self.pages[start:end],
+            "has_more": end < len(self.pages),
+            "next_cursor": str(end) if end < len(self.pages) else None,
+        }
+
+
+def _client(pages: list[dict]):
+    return types.SimpleNamespace(databases=FakeDatabases(pages))
+
+
+def _read(client, path: str, **kwargs):
+    return asyncio.run(get_papers_from_notion(client, "db", snapshot_path=path, **kwargs))
+
+
+def test_snapshot_path_is_per_database(tmp_path):
+    assert get_snapshot_path("ab-cd", str(tmp_path)) == str(tmp_path / "notion_abcd.json")
+
+
+def test_full_sync_pages_through_and_saves_a_projected_snapshot(tmp_path):
+    path = str(tmp_path / "snapshot.json")
+    client = _client([_page(i) for i in range(5)])
+    papers = _read(client, path)
+
+    assert [p.title for p in papers] == [f"Paper {i}" for i in range(5)]
+    assert len(client.databases.queries) == 3
+    assert "filter" not in client.databases.queries[0]
+    assert client.databases.queries[0]["filter_properties"][0] == "id-Title"
+
+    snapshot = json.load(open(path))
+    assert snapshot["cursor"] == "2025-01-01T00:00:00.000Z"
+    assert "Notes" not in snapshot["pages"]["page-0"]["properties"]
+
+
+def test_incremental_sync_only_asks_for_changes(tmp_path):
+    path = str(tmp_path / "snapshot.json")
+    _read(_client([_page(i) for i in range(3)]), path)
+
+    changed = [
+        _page(1, "2025-02-01T00:00:00.000Z", properties={"Title": {"title": [{"plain_text": "Renamed"}]}}),
+        _page(2, "2025-02-01T00:00:00.000Z", archived=True),
+        _page(3, "2025-02-01T00:00:00.000Z"),
+    ]
+    client = _client(changed)
+    papers = _read(client, path)
+
+    query = client.databases.queries[0]
+    assert query["filter"]["last_edited_time"] == {"on_or_after": "2025-01-01T00:00:00.000Z"}
+    assert sorted(p.title for p in papers) == ["Paper 0", "Paper 3", "Renamed"]
+    assert json.load(open(path))["cursor"] == "2025-02-01T00:00:00.000Z"
+
+
+def test_stale_snapshot_gets_a_full_sync(tmp_path):
+    path = str(tmp_path / "snapshot.json")
+    _read(_client([_page(i) for i in range(3)]), path)
+
+    # A full sync is the only way deletions show up
+    client = _client([_page(0)])
+    papers = _read(client, path, full_sync_days=-1)
+    assert "filter" not in client.databases.queries[0]
+    assert [p.title for p in papers] == ["Paper 0"]
+
+
+def test_failed_sync_leaves_the_snapshot_alone(tmp_path, monkeypatch):
+    monkeypatch.setattr(notion_utils, "MAX_RETRIES", 1)
+    path = str(tmp_path / "snapshot.json")
+    _read(_client([_page(i) for i in range(3)]), path)
+    before = open(path).read()
+
+    client = _client([_page(4)])
+    client.databases.fail = True
+    assert _read(client, path) == []
+    assert open(path).read() == before
+
+
+def test_rate_limited_reads_throttle_the_shared_bucket_and_retry():
+    client = _client([_page(i) for i in range(3)])
+    client.databases.throttled = 1
+    limiter = TokenBucket(1000, capacity=100)
+    papers = asyncio.run(get_papers_from_notion(client, "db", limiter=limiter))
+
+    assert len(papers) == 3
+    assert len(client.databases.queries) == 3
+    assert limiter.rate < limiter.max_rate
+
+
+class FakePages:
+    def __init__(self) -> None:
+        self.updates: list[tuple[str, dict]] = []
+        self.creates: list[dict] = []
+
+    async def update(self, page_id: str, properties: dict) -> dict:
+        self.updates.append((page_id, properties))
+        return {"id": page_id}
+
+    async def create(self, parent: dict, properties: dict) -> dict:
+        self.creates.append(properties)
+        return {"id": f"created-{len(self.creates)}"}
+
+
+def _write(papers: list[Paper]):
+    client = types.SimpleNamespace(pages=FakePages())
+    summary = asyncio.run(write_papers_to_notion(client, "db", papers, limiter=TokenBucket(1000)))
+    return client.pages, summary
+
+
+def _loaded(**fields) -> Paper:
+    return Paper(page_id="page-1", track_changes=True, **fields)
+
+
+def test_normalize_shapes_values_the_way_notion_stores_them():
+    assert _normalize("title", "  Title  ") == "Title"
+    assert _normalize("summary", "   ") is None
+    assert _normalize("summary", "x" * 3000) == "x" * notion_utils.NOTION_TEXT_LIMIT
+    assert _normalize("authors", ["Lovelace, Ada", "  Alan   Turing ", ","]) == ["Lovelace Ada", "Alan Turing"]
+    assert _normalize("authors", []) is None
+
+    published = datetime(2024, 1, 1, 2, tzinfo=timezone(timedelta(hours=2)))
+    assert _normalize("published", published) == datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def test_dirty_fields_ignore_changes_that_normalize_away():
+    paper = _loaded(title="Title", authors=["Ada Lovelace"], summary="Summary")
+    paper.title = "Title "
+    paper.authors = ["Ada  Lovelace"]
+    paper.summary = "New summary"
+
+    assert paper.changed_fields() == {"title", "authors", "summary"}
+    assert _dirty_fields(paper) == {"summary"}
+
+
+def test_new_and_untracked_papers_are_fully_dirty():
+    assert _dirty_fields(Paper(title="New")) == notion_utils.TRACKED_FIELDS
+    assert _dirty_fields(Paper(page_id="page-1", title="Untracked")) == notion_utils.TRACKED_FIELDS
+
+
+def test_only_dirty_properties_are_written():
+    unchanged = _loaded(title="Unchanged", explored=True)
+    # Re-setting what Notion already holds, as main does for old papers
+    unchanged.explored = True
+    noop = _loaded(title="Noop", authors=["A", "B"])
+    noop.authors = ["A ", "B"]
+    changed = _loaded(title="Changed", url="https://arxiv.org/abs/2401.00001", explored=False)
+    changed.explored = True
+    new = Paper(title="New", url="https://arxiv.org/abs/2401.00002")
+
+    pages, summary = _write([unchanged, noop, changed, new])
+
+    assert pages.updates == [("page-1", {"Explored": {"checkbox": True}})]
+    assert pages.creates == [
+        {"Title": {"title": [{"text": {"content": "New"}}]}, "URL": {"url": "https://arxiv.org/abs/2401.00002"}}
+    ]
+    assert (summary.written, summary.skipped, summary.failed) == (2, 2, 0)
+    assert new.page_id == "created-1"
+    assert not any(paper.has_changed() for paper in [unchanged, noop, changed, new])
+
+
+def test_odd_rows_parse_without_crashing():
+    page = {
+        "id": "page-1",
+        "properties": {
+            "Title": {"title": [{"plain_text": "Multi"}, {"text": {"content": "part"}}, {}]},
+            "URL": {"url": None},
+            "Summary": {"rich_text": []},
+            "Authors": {"multi_select": [{"name": "Ada"}, {"name": ""}]},
+            "Published": {"date": {"start": "not a date"}},
+            "Focus": {"select": {"name": "Hand-made option"}},
+            "Attack Type": {"select": None},
+            "Explored": {"formula": {"boolean": True}},
+        },
+    }
+    paper = _page_to_paper(page)
+
+    assert paper is not None
+    assert (paper.title, paper.url, paper.summary) == ("Multipart", None, None)
+    assert paper.authors == ["Ada"]
+    assert (paper.published, paper.focus, paper.attack_type) == (None, None, None)
+    # Unreadable rather than "not explored"
+    assert paper.explored is None
+    assert paper.track_changes and not paper.has_changed()
+
+
+def test_rows_without_a_title_or_url_are_skipped():
+    assert _page_to_paper({"id": "page-1", "properties": {"Title": {"title": []}}}) is None
+    assert _page_to_paper({"id": "page-2"}) is None
+
+
+def test_explored_is_read_when_the_checkbox_is_there():
+    page = _page(1)
+    page["properties"]["Explored"] = {"checkbox": False}
+    paper = _page_to_paper(page)
+
+    assert paper is not None and paper.explored is False
+
+
+def test_streamed_reads_yield_each_chunk_as_it_arrives():
+    client = _client([_page(i) for i in range(5)])
+
+    async def run() -> list[tuple[str | None, int]]:
+        # How many queries had been sent when each paper arrived
+        return [(paper.title, len(client.databases.queries)) async for paper in iter_papers_from_notion(client, "db")]
+
+    assert asyncio.run(run()) == [(f"Paper {i}", i // 2 + 1) for i in range(5)]
+    assert client.databases.queries[0]["filter_properties"] == [
+        f"id-{name}" for name in notion_utils.NOTION_PROPERTIES
+    ]
+
+
+def test_reads_fall_back_to_every_property_without_the_schema():
+    client = _client([_page(0)])
+
+    async def retrieve(database_id: str) -> dict:
+        raise notion_utils.notion_client.errors.RequestTimeoutError()
+
+    client.databases.retrieve = retrieve
+    papers = asyncio.run(get_papers_from_notion(client, "db"))
+
+    assert [paper.title for paper in papers] == ["Paper 0"]
+    assert "filter_properties" not in client.databases.queries[0]
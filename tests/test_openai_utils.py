@@ -0,0 +1,322 @@
+import asyncio
+import copy
+import json
+import os
+
+import pytest
+
+import openai_utils
+from _types import AttackType, Focus, Paper
+from budget_utils import SpendGovernor
+from cache_utils import LLMCache
+from fakes import ENRICHMENT, FakeBatches, FakeOpenAI, batch_line, rate_limit_error
+from metrics_utils import METRICS
+from openai_utils import (
+    ENRICH_FIELDS,
+    Enrichment,
+    _cache_fields,
+    _enrichment_request,
+    _field_cache_keys,
+    _parse_batch_output,
+    _parse_enrichment,
+    _task_request,
+    apply_enrichment,
+    configure_tasks,
+    get_paper_enricher,
+    missing_fields,
+    needs_enrichment,
+    process_enrichment_batch,
+    trim_to_tokens,
+)
+
+
+def _errors() -> int:
+    return METRICS.report()["totals"].get("openai", {}).get("errors", 0)
+
+
+def _enricher(client: FakeOpenAI, **kwargs):
+    return get_paper_enricher(client, requests_per_minute=60_000, tokens_per_minute=10**9, **kwargs)
+
+
+def _cache_enrichment(cache: LLMCache, reference: str, content: str = ENRICHMENT) -> None:
+    _cache_fields(cache, _field_cache_keys(reference, ENRICH_FIELDS), _parse_enrichment(content))
+
+
+def test_parse_enrichment_drops_unknown_labels():
+    enrichment = _parse_enrichment('{"summary": " Short. ", "focus": "Offensive", "attack_type": "Telepathy"}')
+    assert enrichment == Enrichment(summary="Short.", focus=Focus.Offensive, attack_type=None)
+
+
+@pytest.mark.parametrize("content", [None, "", "not json", "[1, 2]", '"text"'])
+def test_parse_enrichment_rejects_anything_but_an_object(content):
+    with pytest.raises(ValueError):
+        _parse_enrichment(content)
+
+
+def test_needs_enrichment():
+    assert needs_enrichment(Paper(abstract="An abstract."))
+    assert needs_enrichment(Paper(summary="A summary.", focus=Focus.Safety))
+    assert not needs_enrichment(Paper(summary="A summary.", focus=Focus.Safety, attack_type=AttackType.Other))
+    assert not needs_enrichment(Paper(title="Nothing to go on"))
+
+
+def test_only_missing_fields_are_requested():
+    assert missing_fields(Paper(abstract="An abstract.")) == ("summary", "focus", "attack_type")
+    assert missing_fields(Paper(abstract="An abstract.", focus=Focus.Safety)) == ("summary", "attack_type")
+    # Without an abstract there's nothing to summarise
+    assert missing_fields(Paper(summary="A summary.")) == ("focus", "attack_type")
+
+    request = _enrichment_request("An abstract.", ("attack_type",))
+    assert request["response_format"]["json_schema"]["schema"]["required"] == ["attack_type"]
+    assert "`summary`" not in request["messages"][0]["content"]
+
+
+def test_apply_enrichment_only_fills_gaps():
+    paper = Paper(abstract="An abstract.", focus=Focus.Defensive)
+    apply_enrichment(paper, Enrichment(summary="Generated.", focus=Focus.Offensive, attack_type=AttackType.Other))
+    assert paper.summary == "Generated."
+    assert paper.focus == Focus.Defensive
+    assert paper.attack_type == AttackType.Other
+
+
+def test_enricher_makes_one_request_per_distinct_abstract():
+    client = FakeOpenAI(delay=0.01)
+    enrich = _enricher(client)
+    papers = [Paper(abstract="Same abstract."), Paper(abstract="Same abstract."), Paper(abstract="Another.")]
+
+    async def run() -> None:
+        await asyncio.gather(*[enrich(paper) for paper in papers])
+
+    asyncio.run(run())
+    assert len(client.requests) == 2
+    assert all(paper.summary == "A short summary." for paper in papers)
+    assert client.requests[0]["response_format"]["type"] == "json_schema"
+
+
+def test_enricher_retries_rate_limits():
+    client = FakeOpenAI(rate_limit_error(), rate_limit_error())
+    paper = Paper(abstract="An abstract.")
+    asyncio.run(_enricher(client)(paper))
+
+    assert len(client.requests) == 3
+    assert paper.attack_type == AttackType.PromptInjection
+
+
+def test_enricher_reports_papers_still_rate_limited(monkeypatch, capsys):
+    monkeypatch.setattr(openai_utils, "MAX_RETRIES", 2)
+    client = FakeOpenAI(default=rate_limit_error())
+    paper = Paper(title="Throttled paper", abstract="An abstract.")
+    errors = _errors()
+    asyncio.run(_enricher(client)(paper))
+
+    assert len(client.requests) == 2
+    assert paper.summary is None
+    assert _errors() == errors + 1
+    assert "still rate limited after 2 attempts" in capsys.readouterr().out
+
+
+def test_enricher_skips_papers_without_text():
+    client = FakeOpenAI()
+    asyncio.run(_enricher(client)(Paper(title="Title only")))
+    assert not client.requests
+
+
+def test_parse_batch_output_skips_failed_and_invalid_lines(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm.sqlite"))
+    content = "\n".join(
+        [
+            batch_line("page-1"),
+            batch_line("page-2", status_code=500),
+            batch_line("page-3", content="not json"),
+            "",
+        ]
+    )
+    keys = {"page-1": _field_cache_keys("First.", ENRICH_FIELDS), "page-3": _field_cache_keys("Third.", ENRICH_FIELDS)}
+    enrichments = _parse_batch_output(content, cache, keys)
+
+    assert list(enrichments) == ["page-1"]
+    assert enrichments["page-1"].focus == Focus.Offensive
+    assert cache.get(keys["page-1"]["focus"]) == "Offensive"
+    assert cache.get(keys["page-3"]["focus"]) is None
+
+
+def test_batch_is_submitted_then_polled_then_applied(tmp_path):
+    client = FakeBatches()
+    state = str(tmp_path / "batch.json")
+    papers = [
+        Paper(page_id="page-1", abstract="First."),
+        Paper(url="https://arxiv.org/abs/2401.00002", abstract="Second."),
+    ]
+
+    assert asyncio.run(process_enrichment_batch(client, papers, state)) is None
+    lines = [json.loads(line) for line in client.uploads[0].decode().splitlines()]
+    assert [line["custom_id"] for line in lines] == ["page-1", "arxiv:2401.00002"]
+    assert json.loads(open(state).read())["batch_id"] == "batch-1"
+
+    # Still running - nothing to apply, nothing resubmitted
+    assert asyncio.run(process_enrichment_batch(client, papers, state)) is None
+    assert len(client.uploads) == 1
+
+    client.complete("\n".join(batch_line(line["custom_id"]) for line in lines))
+    enrichments = asyncio.run(process_enrichment_batch(client, papers, state))
+    assert set(enrichments) == {"page-1", "arxiv:2401.00002"}
+    assert not os.path.exists(state)
+
+
+def test_cached_results_apply_while_a_batch_is_pending(tmp_path):
+    client = FakeBatches()
+    cache = LLMCache(str(tmp_path / "llm.sqlite"))
+    state = str(tmp_path / "batch.json")
+    first = Paper(page_id="page-1", abstract="First.")
+    asyncio.run(process_enrichment_batch(client, [first], state, cache=cache))
+
+    # Answered since (e.g. by a live run) while the batch is still going
+    second = Paper(page_id="page-2", abstract="Second.")
+    _cache_enrichment(cache, "Second.")
+    enrichments = asyncio.run(process_enrichment_batch(client, [first, second], state, cache=cache))
+
+    assert set(enrichments) == {"page-2"}
+
+
+def test_batches_only_ask_for_fields_missing_from_the_cache(tmp_path):
+    client = FakeBatches()
+    cache = LLMCache(str(tmp_path / "llm.sqlite"))
+    state = str(tmp_path / "batch.json")
+    paper = Paper(page_id="page-1", abstract="First.")
+    _cache_fields(cache, _field_cache_keys("First.", ["summary"]), Enrichment(summary="Cached summary."))
+
+    asyncio.run(process_enrichment_batch(client, [paper], state, cache=cache))
+    line = json.loads(client.uploads[0].decode())
+    assert line["body"]["response_format"]["json_schema"]["schema"]["required"] == ["focus", "attack_type"]
+
+    # The result comes back with the cached summary alongside the batch's labels
+    client.complete(batch_line("page-1", json.dumps({"focus": "Safety", "attack_type": "Other"})))
+    enrichments = asyncio.run(process_enrichment_batch(client, [paper], state, cache=cache))
+    assert enrichments["page-1"] == Enrichment("Cached summary.", Focus.Safety, AttackType.Other)
+
+
+def test_enricher_answers_cache_hits_without_a_request(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm.sqlite"))
+    _cache_enrichment(cache, "Cached.")
+    client = FakeOpenAI()
+    paper = Paper(abstract="Cached.")
+    asyncio.run(_enricher(client, cache=cache)(paper))
+
+    assert not client.requests
+    assert paper.focus == Focus.Offensive
+
+
+def test_editing_an_attack_type_description_only_misses_for_attack_types(tmp_path, monkeypatch):
+    cache = LLMCache(str(tmp_path / "llm.sqlite"))
+    _cache_enrichment(cache, "Cached.")
+    prompts = dict(openai_utils.ENRICH_FIELD_SYSTEM_PROMPTS)
+    prompts["attack_type"] = prompts["attack_type"].replace("Prompt injection is", "Prompt injection was")
+    monkeypatch.setattr(openai_utils, "ENRICH_FIELD_SYSTEM_PROMPTS", prompts)
+
+    client = FakeOpenAI(default='{"attack_type": "Other"}')
+    paper = Paper(abstract="Cached.")
+    asyncio.run(_enricher(client, cache=cache)(paper))
+
+    # Summary and focus are still cache hits - only the attack type is asked for again
+    assert [request["response_format"]["json_schema"]["schema"]["required"] for request in client.requests] == [
+        ["attack_type"]
+    ]
+    assert paper.summary == "A short summary."
+    assert paper.focus == Focus.Offensive
+    assert paper.attack_type == AttackType.Other
+
+
+def test_enricher_treats_a_bad_cache_entry_as_a_miss(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm.sqlite"))
+    _cache_enrichment(cache, "Corrupt.")
+    key = _field_cache_keys("Corrupt.", ["focus"])["focus"]
+    cache.set(key, "Telepathy")
+    client = FakeOpenAI(default='{"focus": "Offensive"}')
+    paper = Paper(abstract="Corrupt.")
+    asyncio.run(_enricher(client, cache=cache)(paper))
+
+    assert len(client.requests) == 1
+    assert paper.focus == Focus.Offensive
+    assert cache.get(key) == "Offensive"
+
+
+def test_enricher_survives_malformed_completions(capsys):
+    client = FakeOpenAI(default="[]", delay=0.01)
+    enrich = _enricher(client)
+    papers = [Paper(title="Listed", abstract="One."), Paper(title="Waiting", abstract="One.")]
+
+    async def run() -> None:
+        await asyncio.gather(*[enrich(paper) for paper in papers])
+
+    asyncio.run(run())
+    assert len(client.requests) == 1
+    assert all(paper.summary is None for paper in papers)
+    assert 'Failed to enrich "Listed"' in capsys.readouterr().out
+
+
+@pytest.fixture
+def tasks(monkeypatch):
+    monkeypatch.setattr(openai_utils, "OPENAI_TASKS", copy.deepcopy(openai_utils.OPENAI_TASKS))
+    return openai_utils.OPENAI_TASKS
+
+
+@pytest.fixture
+def no_tokenizer(monkeypatch):
+    monkeypatch.setattr(openai_utils, "tiktoken", None)
+    openai_utils._encoding.cache_clear()
+    yield
+    openai_utils._encoding.cache_clear()
+
+
+def test_tasks_can_use_their_own_model_and_input_budget(tasks):
+    configure_tasks({"enrich": "gpt-4.1-mini"}, input_tokens=128)
+
+    assert tasks["enrich"].model == "gpt-4.1-mini"
+    assert tasks["relevance"].model == "gpt-4o-mini"
+    assert {config.input_tokens for config in tasks.values()} == {128}
+    with pytest.raises(ValueError, match="Unknown OpenAI task 'translate'"):
+        configure_tasks({"translate": "gpt-4o"})
+
+
+def test_inputs_are_trimmed_at_a_word_boundary(no_tokenizer):
+    # Four characters a token without a tokenizer
+    assert trim_to_tokens("alpha beta gamma delta epsilon", 5, "gpt-4o-mini") == "alpha beta gamma"
+    assert trim_to_tokens("x" * 30, 5, "gpt-4o-mini") == "x" * 20
+    assert trim_to_tokens("short", 5, "gpt-4o-mini") == "short"
+
+
+def test_requests_follow_their_task_config(tasks, no_tokenizer):
+    configure_tasks({"summarize": "gpt-4.1-nano"}, input_tokens=2)
+    request = _task_request("summarize", "System prompt.", "A much longer abstract than two tokens.")
+
+    assert request["model"] == "gpt-4.1-nano"
+    assert request["max_tokens"] == tasks["summarize"].max_tokens
+    assert request["messages"][0]["content"] == "System prompt."
+    assert request["messages"][1]["content"] == "A much"
+
+
+def test_enrichment_stops_at_the_spend_ceiling():
+    client = FakeOpenAI()
+    governor = SpendGovernor(max_tokens=1)
+    papers = [Paper(abstract="An abstract."), Paper(abstract="Another abstract.")]
+
+    async def run() -> None:
+        enrich = _enricher(client, governor=governor)
+        await asyncio.gather(*[enrich(paper) for paper in papers])
+
+    asyncio.run(run())
+    assert not client.requests
+    assert governor.skipped == 2
+    # Left for the next run rather than failed
+    assert all(needs_enrichment(paper) for paper in papers)
+
+
+def test_enrichment_usage_is_charged_to_the_governor():
+    client = FakeOpenAI()
+    governor = SpendGovernor(max_dollars=1.0)
+    asyncio.run(_enricher(client, governor=governor)(Paper(abstract="An abstract.")))
+
+    # The fake reports 800 prompt and 60 completion tokens per call
+    assert governor.tokens == 860
+    assert governor.dollars > 0
+    assert not governor.exhausted
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+
+import pytest
+
+from _types import Paper
+from pipeline_utils import SharedSource, Stage, iter_in_thread, iter_list, run_pipeline
+
+
+def _papers(*titles: str) -> list[Paper]:
+    return [Paper(title=title) for title in titles]
+
+
+async def _collect(source) -> list[str]:
+    return [paper.title async for paper in source]
+
+
+def test_papers_flow_through_every_stage_in_batches():
+    seen: dict[str, list[list[str]]] = {"first": [], "second": []}
+
+    def stage(name: str):
+        async def handler(batch: list[Paper]) -> None:
+            seen[name].append([paper.title for paper in batch])
+
+        return handler
+
+    asyncio.run(
+        run_pipeline(
+            [iter_list(_papers("a", "b", "c")), iter_list(_papers("d", "e"))],
+            [Stage("first", stage("first"), batch_size=2), Stage("second", stage("second"), batch_size=10)],
+        )
+    )
+
+    assert sorted(title for batch in seen["first"] for title in batch) == ["a", "b", "c", "d", "e"]
+    assert all(len(batch) <= 2 for batch in seen["first"])
+    # Fewer than a batch left when the input runs out
+    assert sorted(seen["second"][0]) == ["a", "b", "c", "d", "e"]
+
+
+def test_stages_can_filter_and_failures_pass_the_batch_on():
+    written: list[str] = []
+
+    async def keep_even(batch: list[Paper]) -> list[Paper]:
+        return [paper for paper in batch if int(paper.title or 0) % 2 == 0]
+
+    async def fail(batch: list[Paper]) -> None:
+        raise RuntimeError("unavailable")
+
+    async def write(batch: list[Paper]) -> None:
+        written.extend(paper.title or "" for paper in batch)
+
+    stages = [Stage("filter", keep_even), Stage("enrich", fail, workers=2), Stage("write", write)]
+    asyncio.run(run_pipeline([iter_list(_papers(*"0123456"))], stages))
+
+    assert sorted(written) == ["0", "2", "4", "6"]
+
+
+def test_queues_bound_how_far_producers_run_ahead():
+    produced = 0
+
+    async def source():
+        nonlocal produced
+        for paper in _papers(*"abcdefghij"):
+            produced += 1
+            yield paper
+
+    async def slow(batch: list[Paper]) -> None:
+        await asyncio.sleep(1)
+
+    async def run() -> None:
+        task = asyncio.create_task(run_pipeline([source()], [Stage("slow", slow)], queue_size=2))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    # Two queued, one being handled and one waiting on the full queue
+    assert produced == 4
+
+
+def test_sources_still_run_without_stages():
+    drained: list[str] = []
+
+    async def source():
+        for paper in _papers("a", "b"):
+            drained.append(paper.title or "")
+            yield paper
+
+    asyncio.run(run_pipeline([source()], []))
+    assert drained == ["a", "b"]
+
+
+def test_shared_sources_run_once_for_every_subscriber():
+    pulled = 0
+
+    async def source():
+        nonlocal pulled
+        for paper in _papers("a", "b", "c"):
+            pulled += 1
+            await asyncio.sleep(0)
+            yield paper
+
+    async def run() -> list[list[str]]:
+        shared = SharedSource(source())
+        return list(await asyncio.gather(_collect(shared.subscribe()), _collect(shared.subscribe())))
+
+    assert asyncio.run(run()) == [["a", "b", "c"], ["a", "b", "c"]]
+    assert pulled == 3
+
+
+def test_shared_source_failures_reach_every_subscriber():
+    async def source():
+        yield Paper(title="a")
+        raise RuntimeError("search failed")
+
+    async def run() -> list:
+        shared = SharedSource(source())
+        return list(
+            await asyncio.gather(_collect(shared.subscribe()), _collect(shared.subscribe()), return_exceptions=True)
+        )
+
+    assert [str(result) for result in asyncio.run(run())] == ["search failed", "search failed"]
+
+
+def test_blocking_iterators_run_off_the_event_loop():
+    threads: set[int] = set()
+
+    def blocking():
+        for paper in _papers("a", "b"):
+            threads.add(threading.get_ident())
+            yield paper
+
+    assert asyncio.run(_collect(iter_in_thread(blocking()))) == ["a", "b"]
+    assert threading.get_ident() not in threads
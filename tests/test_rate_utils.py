@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+import httpx
+import notion_client
+
+import notion_utils
+from _types import Paper
+from notion_utils import WriteSummary, write_paper_to_notion, write_papers_to_notion
+from rate_utils import TokenBucket
+
+
+def test_acquire_spends_the_burst_then_waits_for_refill():
+    async def run() -> float:
+        bucket = TokenBucket(20, capacity=2)
+        start = time.monotonic()
+        for _ in range(4):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # Two tokens up front, then two more at 20/s
+    assert 0.08 <= asyncio.run(run()) < 0.5
+
+
+def test_throttle_halves_the_rate_and_recover_restores_it():
+    bucket = TokenBucket(8)
+    bucket.throttle(0)
+    assert bucket.rate == 4
+    bucket.throttle(0)
+    bucket.throttle(0)
+    bucket.throttle(0)
+    assert bucket.rate == bucket.min_rate == 1
+
+    for _ in range(20):
+        bucket.recover()
+    assert bucket.rate == 8
+
+
+def test_throttle_blocks_every_caller():
+    async def run() -> float:
+        bucket = TokenBucket(1000)
+        bucket.throttle(0.1)
+        start = time.monotonic()
+        await asyncio.gather(bucket.acquire(), bucket.acquire())
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.1
+
+
+class FakePages:
+    def __init__(self, failures: int = 0) -> None:
+        self.failures = failures
+        self.updated: list[str] = []
+        self.created = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def update(self, page_id: str, properties: dict) -> dict:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        if self.failures:
+            self.failures -= 1
+            response = httpx.Response(429, headers={"retry-after": "0"}, request=httpx.Request("PATCH", "http://n"))
+            raise notion_client.APIResponseError(response, "slow down", notion_client.APIErrorCode.RateLimited)
+        self.updated.append(page_id)
+        return {"id": page_id}
+
+    async def create(self, parent: dict, properties: dict) -> dict:
+        self.created += 1
+        return {"id": f"new-{self.created}"}
+
+
+class FakeNotion:
+    def __init__(self, failures: int = 0) -> None:
+        self.pages = FakePages(failures)
+
+
+def _paper(i: int) -> Paper:
+    return Paper(page_id=f"page-{i}", title=f"Paper {i}", summary="A summary.")
+
+
+def test_writes_run_concurrently_up_to_the_limit():
+    client = FakeNotion()
+    papers = [_paper(i) for i in range(12)]
+    summary = asyncio.run(
+        write_papers_to_notion(client, "db", papers, concurrency=4, limiter=TokenBucket(1000, capacity=100))
+    )
+
+    assert summary.written == 12
+    assert sorted(client.pages.updated) == sorted(p.page_id for p in papers)
+    assert client.pages.max_in_flight == 4
+
+
+def test_rate_limited_writes_throttle_the_shared_bucket_and_retry():
+    client = FakeNotion(failures=2)
+    limiter = TokenBucket(1000, capacity=100)
+    summary = WriteSummary()
+    asyncio.run(write_paper_to_notion(client, "db", _paper(0), limiter, summary))
+
+    assert summary.written == 1
+    assert summary.retries == summary.throttled == 2
+    assert limiter.rate < limiter.max_rate
+
+
+def test_write_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(notion_utils, "MAX_RETRIES", 2)
+    client = FakeNotion(failures=5)
+    summary = WriteSummary()
+    paper = _paper(0)
+    paper.summary = "Changed"
+    asyncio.run(write_paper_to_notion(client, "db", paper, TokenBucket(1000, capacity=100), summary))
+
+    assert summary.failed == 1
+    assert summary.written == 0
+
+
+def test_new_papers_are_created_and_get_a_page_id():
+    client = FakeNotion()
+    paper = Paper(title="New paper", url="https://arxiv.org/abs/2401.00001")
+    summary = WriteSummary()
+    asyncio.run(write_paper_to_notion(client, "db", paper, TokenBucket(1000, capacity=100), summary))
+
+    assert paper.page_id == "new-1"
+    assert not paper.has_changed()
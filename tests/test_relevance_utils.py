@@ -0,0 +1,96 @@
+import asyncio
+
+from _types import Paper, PaperIndex
+from fakes import FakeOpenAI, rate_limit_error
+from openai_utils import OpenAILimiter, get_paper_enricher, is_relevant_with_openai
+from relevance_utils import RelevanceModel, index_rejected, load_rejected, reject, rejection_key, save_rejected
+
+CORPUS = [
+    "Prompt injection attacks against large language model agents",
+    "Jailbreaking aligned language models with adversarial suffixes",
+    "Indirect prompt injection through retrieved web content",
+    "Data poisoning attacks on instruction tuned language models",
+    "Defending language model agents against prompt injection",
+    "Membership inference attacks on large language models",
+]
+
+
+def _paper(title: str) -> Paper:
+    return Paper(title=title, abstract=f"{title}.")
+
+
+def test_on_topic_papers_score_above_off_topic_ones():
+    model = RelevanceModel([_paper(title) for title in CORPUS])
+    on_topic, off_topic, empty = model.scores(
+        [
+            _paper("Prompt injection defenses for language model agents"),
+            _paper("Protein folding with graph neural networks"),
+            Paper(title="No abstract or summary"),
+        ]
+    ).tolist()
+
+    assert model.size == len(CORPUS)
+    assert on_topic > 0.5
+    assert off_topic < 0.1
+    assert empty == 0.0
+
+
+def test_corpus_papers_score_around_one():
+    papers = [_paper(title) for title in CORPUS]
+    scores = sorted(RelevanceModel(papers).scores(papers).tolist())
+
+    # Scaled so the median corpus paper scores 1.0
+    assert scores[len(scores) // 2 - 1] <= 1.0 <= scores[len(scores) // 2]
+
+
+def test_rejections_are_recorded_and_skipped_on_later_runs(tmp_path):
+    path = str(tmp_path / "rejected.json")
+    rejected: dict[str, dict] = {}
+    reject(rejected, Paper(title="Off topic", url="https://arxiv.org/abs/2401.00001v2"), 0.05123, "keywords")
+    reject(rejected, Paper(title="No URL: Off Topic"), 0.8, "llm")
+    reject(rejected, Paper(), 0.0, "keywords")
+    save_rejected(rejected, path)
+
+    loaded = load_rejected(path)
+    assert set(loaded) == {"2401.00001", "title:nourlofftopic"}
+    assert loaded["2401.00001"]["score"] == 0.051
+    assert loaded["title:nourlofftopic"]["reason"] == "llm"
+    assert load_rejected(str(tmp_path / "missing.json")) == {}
+
+    index = PaperIndex()
+    index_rejected(index, loaded)
+    assert index.match(arxiv_id="2401.00001v3")
+    assert index.match(title="no url - off topic")
+
+
+def test_rejection_keys_prefer_arxiv_ids():
+    assert rejection_key(Paper(title="T", url="https://arxiv.org/abs/2401.00001")) == "2401.00001"
+    assert rejection_key(Paper(title="T")) == "title:t"
+    assert rejection_key(Paper()) is None
+
+
+def test_llm_gate_only_rejects_on_a_no():
+    async def check(client: FakeOpenAI) -> bool:
+        return await is_relevant_with_openai(client, "Some abstract", "LLM security")
+
+    assert asyncio.run(check(FakeOpenAI(default="No"))) is False
+    assert asyncio.run(check(FakeOpenAI(default="Yes"))) is True
+    client = FakeOpenAI(default=rate_limit_error())
+    # Fails open - a stray paper is cheaper than a lost one
+    assert asyncio.run(check(client)) is True
+    assert client.requests[0]["max_tokens"] == 1
+
+
+def test_llm_gate_shares_the_enrichers_rate_limits():
+    limiter = OpenAILimiter(requests_per_minute=60_000, tokens_per_minute=10**9)
+    client = FakeOpenAI(rate_limit_error(), "No")
+
+    assert asyncio.run(is_relevant_with_openai(client, "Some abstract", "LLM security", limiter=limiter)) is False
+    assert len(client.requests) == 2
+    # The 429 slowed the limiter the enricher waits on as well
+    assert limiter.requests.rate < limiter.requests.max_rate
+
+    # ...and the enricher's successes recover it
+    throttled = limiter.requests.rate
+    asyncio.run(get_paper_enricher(FakeOpenAI(), limiter=limiter)(_paper("Prompt injection")))
+    assert limiter.requests.rate > throttled
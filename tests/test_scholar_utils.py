@@ -0,0 +1,219 @@
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+
+import scholar_utils
+from _types import Paper, PaperIndex
+from cache_utils import ResponseCache
+from fakes import FakeS2, s2_paper
+from metrics_utils import METRICS
+from scholar_utils import Crawler, Recommender
+
+THIS_YEAR = datetime.now().year
+
+
+@pytest.fixture
+def fake_s2(monkeypatch):
+    monkeypatch.setattr(scholar_utils, "S2_REQUESTS_PER_SECOND", 1000)
+    monkeypatch.setattr(scholar_utils, "RETRY_DELAY", 0)
+
+    def install(client: FakeS2) -> FakeS2:
+        monkeypatch.setattr(scholar_utils, "get_s2_client", lambda: client)
+        return client
+
+    return install
+
+
+def _seeds(*days: int, explored: bool | None = None) -> list[Paper]:
+    return [Paper(title=f"Seed {day}", url=f"https://arxiv.org/abs/2401.0000{day}", explored=explored) for day in days]
+
+
+def _retries() -> int:
+    return METRICS.report()["totals"].get("s2", {}).get("retries", 0)
+
+
+def test_seeds_are_recommended_for_in_batches(fake_s2, monkeypatch):
+    monkeypatch.setattr(scholar_utils, "S2_SEED_BATCH_SIZE", 2)
+    client = fake_s2(FakeS2(recommended=[s2_paper("a", "2402.00001")]))
+    seeds = _seeds(1, 2, 3, 4)
+    done = _seeds(5, explored=True)
+    recommender = Recommender(PaperIndex(seeds + done))
+    asyncio.run(recommender.explore(seeds + done))
+
+    assert [args for method, args in client.calls] == [
+        ["arXiv:2401.00001", "arXiv:2401.00002"],
+        ["arXiv:2401.00003", "arXiv:2401.00004"],
+    ]
+    assert all(paper.explored for paper in seeds)
+    # S2 answers per batch, so agreement is counted in batches
+    assert recommender.batch_hits["a"] == 2
+
+
+def test_results_are_filtered_hydrated_in_bulk_and_ranked(fake_s2, monkeypatch):
+    monkeypatch.setattr(scholar_utils, "S2_SEED_BATCH_SIZE", 1)
+    agreed = s2_paper("agreed", "2402.00001", year=THIS_YEAR)
+    cited = s2_paper("cited", "2402.00002", year=THIS_YEAR, citations=5)
+    older = s2_paper("older", "2402.00003", year=THIS_YEAR - 3)
+    too_old = s2_paper("too-old", "2402.00004", year=2010)
+    no_arxiv = s2_paper("no-arxiv")
+    known = s2_paper("known", "2401.00009v2")
+    client = fake_s2(
+        FakeS2(
+            recommend=lambda seeds: (
+                [agreed, cited, older, no_arxiv] if seeds == ["arXiv:2401.00001"] else [agreed, too_old, known]
+            ),
+            papers=[agreed, cited, older, too_old, no_arxiv, known],
+        )
+    )
+    seeds = _seeds(1, 2)
+    recommender = Recommender(PaperIndex(seeds + _seeds(9)), max_results=10)
+
+    async def run() -> list[Paper]:
+        await recommender.explore(seeds)
+        return await recommender.results()
+
+    papers = asyncio.run(run())
+
+    # One bulk lookup, for arXiv papers we don't already have
+    assert client.count("papers") == 1
+    assert sorted(client.calls[-1][1]) == ["agreed", "cited", "older", "too-old"]
+    assert [paper.url for paper in papers] == [
+        "https://arxiv.org/abs/2402.00001",
+        "https://arxiv.org/abs/2402.00002",
+        "https://arxiv.org/abs/2402.00003",
+    ]
+    assert papers[0].abstract == "Abstract of agreed."
+
+
+def test_failed_batches_leave_their_seeds_unexplored(fake_s2):
+    def fail(seeds):
+        raise RuntimeError("S2 unavailable")
+
+    fake_s2(FakeS2(recommend=fail))
+    seeds = _seeds(1, 2)
+    recommender = Recommender(PaperIndex(seeds))
+    asyncio.run(recommender.explore(seeds))
+
+    assert not any(paper.explored for paper in seeds)
+    assert not recommender.recommended
+
+
+def test_rate_limited_requests_are_retried(fake_s2):
+    client = fake_s2(FakeS2(recommended=[s2_paper("a", "2402.00001")], throttled=2))
+    seeds = _seeds(1)
+    recommender = Recommender(PaperIndex(seeds))
+    before = _retries()
+    asyncio.run(recommender.explore(seeds))
+
+    assert _retries() - before == 2
+    assert client.count("recommend") == 3
+    assert seeds[0].explored
+    assert recommender.batch_hits["a"] == 1
+
+
+def test_cached_recommendations_and_lookups_skip_s2(fake_s2, tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    recommended = [s2_paper("a", "2402.00001"), s2_paper("b", "2402.00002")]
+
+    async def run(client: FakeS2) -> list[Paper]:
+        fake_s2(client)
+        seeds = _seeds(1, 2)
+        recommender = Recommender(PaperIndex(seeds), cache=cache)
+        await recommender.explore(seeds)
+        return await recommender.results()
+
+    first = asyncio.run(run(FakeS2(recommended=recommended)))
+    client = FakeS2()
+    second = asyncio.run(run(client))
+
+    assert not client.calls
+    assert [paper.url for paper in second] == [paper.url for paper in first]
+    assert len(second) == 2
+
+
+def _crawl(crawler: Crawler, seeds: list[Paper]) -> list[Paper]:
+    async def run() -> list[Paper]:
+        await crawler.explore(seeds)
+        return await crawler.results()
+
+    return asyncio.run(run())
+
+
+def test_crawls_expand_the_best_seeds_within_the_request_budget(fake_s2, tmp_path):
+    path = str(tmp_path / "frontier.json")
+    client = fake_s2(
+        FakeS2(
+            papers=[
+                s2_paper("s2-old", "2401.00001", year=THIS_YEAR - 6),
+                s2_paper("s2-cited", "2401.00002", year=THIS_YEAR, citations=500),
+            ]
+        )
+    )
+    seeds = _seeds(1, 2, explored=False)
+    crawler = Crawler(PaperIndex(seeds), path, budget=4)
+    _crawl(crawler, seeds)
+
+    # One bulk lookup to rank the seeds, then the best seed's three edges
+    assert client.calls == [
+        ("papers", ["arXiv:2401.00001", "arXiv:2401.00002"]),
+        ("recommend", ["arXiv:2401.00002"]),
+        ("citations", "arXiv:2401.00002"),
+        ("references", "arXiv:2401.00002"),
+    ]
+    assert crawler.requests == 4
+    assert [paper.explored for paper in seeds] == [False, True]
+    assert list(json.load(open(path))["seeds"]) == ["2401.00001"]
+
+    # The waiting seed's citation count is remembered, so the next run goes straight to expanding it
+    client = fake_s2(FakeS2())
+    seeds = _seeds(1, explored=False)
+    _crawl(Crawler(PaperIndex(seeds), path, budget=3), seeds)
+
+    assert [method for method, _ in client.calls] == ["recommend", "citations", "references"]
+    assert seeds[0].explored
+
+
+def test_discovered_papers_are_ranked_and_the_rest_kept_for_later(fake_s2, tmp_path):
+    path = str(tmp_path / "frontier.json")
+    linked = s2_paper("linked", "2402.00001", year=THIS_YEAR)
+    cited = s2_paper("cited", "2402.00002", year=THIS_YEAR)
+    fake_s2(
+        FakeS2(
+            papers=[s2_paper("seed", "2401.00001")],
+            recommended=[linked],
+            citations={
+                "2401.00001": [cited, s2_paper("known", "2401.00009"), s2_paper("old", "2402.00003", year=2010)]
+            },
+            references={"2401.00001": [linked, s2_paper("no-arxiv")]},
+        )
+    )
+    seeds = _seeds(1, explored=False)
+    first = _crawl(Crawler(PaperIndex(seeds + _seeds(9)), path, max_results=1), seeds)
+
+    # Found twice, so it outranks a paper found once
+    assert [paper.url for paper in first] == ["https://arxiv.org/abs/2402.00001"]
+    assert list(json.load(open(path))["candidates"]) == ["cited"]
+
+    # Later runs can return what earlier ones discovered without any requests
+    client = fake_s2(FakeS2())
+    crawler = Crawler(PaperIndex(), path, max_results=1)
+    second = _crawl(crawler, [])
+
+    assert [paper.url for paper in second] == ["https://arxiv.org/abs/2402.00002"]
+    assert not client.calls
+    assert not json.load(open(path))["candidates"]
+
+
+def test_retries_are_paid_for_out_of_the_budget(fake_s2, tmp_path):
+    client = fake_s2(FakeS2(papers=[s2_paper("seed", "2401.00001")], throttled=10))
+    seeds = _seeds(1, explored=False)
+    crawler = Crawler(PaperIndex(seeds), str(tmp_path / "frontier.json"), budget=3)
+    before = _retries()
+    _crawl(crawler, seeds)
+
+    assert crawler.requests == 3
+    assert client.count("papers") == 3
+    assert _retries() - before == 3
+    assert not seeds[0].explored
@@ -0,0 +1,93 @@
+import pytest
+
+from _types import TRACKED_FIELDS, Paper, PaperIndex, normalize_doi, title_fingerprint
+
+
+def test_title_fingerprint_ignores_case_accents_and_punctuation():
+    assert title_fingerprint("Attacking  LLMs: A Survey") == title_fingerprint("attacking llms - a survey")
+    assert title_fingerprint("Café") == title_fingerprint("cafe")
+
+
+@pytest.mark.parametrize("doi", ["10.1000/ABC", "https://doi.org/10.1000/abc", "doi:10.1000/abc", " 10.1000/abc "])
+def test_normalize_doi(doi):
+    assert normalize_doi(doi) == "10.1000/abc"
+
+
+def test_index_matches_on_any_identifier():
+    index = PaperIndex([Paper(title="Known Paper", url="https://arxiv.org/abs/2401.00001")])
+    index.add(doi="10.1000/XYZ", title="From Semantic Scholar")
+
+    assert index.match(arxiv_id="arXiv:2401.00001v2")
+    assert index.match(doi="https://doi.org/10.1000/xyz")
+    assert index.match(title="known paper.")
+    assert index.match(title="FROM semantic scholar")
+    assert not index.match(arxiv_id="2401.00002", title="Unknown paper")
+
+
+def test_index_membership_uses_a_papers_arxiv_id_and_title():
+    index = PaperIndex([Paper(url="https://arxiv.org/abs/2401.00001")])
+    index.add(Paper(title="Title Only"))
+
+    assert Paper(title="Anything", url="https://arxiv.org/abs/2401.00001v4") in index
+    assert Paper(title="title only") in index
+    assert Paper(title="Something else", url="https://arxiv.org/abs/2401.00002") not in index
+
+
+def test_empty_titles_never_match():
+    index = PaperIndex([Paper(title="!!!")])
+    assert not index.match(title="???")
+
+
+def test_untracked_papers_always_count_as_changed():
+    paper = Paper(title="New")
+
+    assert paper.has_changed()
+    assert paper.changed_fields() == TRACKED_FIELDS
+
+
+def test_tracked_papers_record_changed_fields_and_their_originals():
+    paper = Paper(title="Old", authors=["A", "B"], explored=False, track_changes=True)
+    assert not paper.has_changed()
+
+    paper.title = "New"
+    paper.authors = ["A"]
+    paper.abstract = "Not a Notion property"
+
+    assert paper.has_changed()
+    assert paper.changed_fields() == {"title", "authors"}
+    assert paper.original_value("title") == "Old"
+    assert paper.original_value("authors") == ["A", "B"]
+    assert paper.original_value("explored") is False
+
+
+def test_changing_a_field_back_clears_it():
+    paper = Paper(title="Old", explored=False, track_changes=True)
+    paper.title = "Intermediate"
+    paper.title = "Newer"
+    assert paper.original_value("title") == "Old"
+
+    paper.title = "Old"
+    paper.explored = False
+
+    assert not paper.has_changed()
+
+
+def test_mark_saved_tracks_from_the_current_values():
+    paper = Paper(title="Old", track_changes=True)
+    paper.title = "New"
+    paper.mark_saved()
+
+    assert not paper.has_changed()
+    assert paper.original_value("title") == "New"
+
+    # Papers created here start tracking once they're written
+    created = Paper(title="Created")
+    created.mark_saved()
+    created.summary = "Summary"
+
+    assert created.changed_fields() == {"summary"}
+
+
+def test_papers_are_slotted():
+    with pytest.raises(AttributeError):
+        Paper().unknown = 1  # type: ignore[attr-defined]
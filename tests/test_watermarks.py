@@ -0,0 +1,84 @@
+import asyncio
+import types
+from datetime import datetime, timezone
+
+import arxiv_utils
+import paperstack
+from _types import Paper
+from arxiv_utils import iter_arxiv_as_paper, load_arxiv_watermark, save_arxiv_watermark
+from fakes import FakeArxiv, arxiv_result
+from pipeline_utils import iter_list
+
+
+def _search(*arxiv_ids: str):
+    return types.SimpleNamespace(papers=[Paper(url=f"https://arxiv.org/abs/{i}") for i in arxiv_ids])
+
+
+async def _collect(source) -> list[Paper]:
+    return [paper async for paper in source]
+
+
+def test_watermarks_are_kept_per_query(tmp_path):
+    path = str(tmp_path / "watermark.json")
+    assert load_arxiv_watermark("llm", path) is None
+    save_arxiv_watermark("llm", "2401.00002", path)
+    save_arxiv_watermark("vision", "2401.00009", path)
+    save_arxiv_watermark("llm", "2401.00003", path)
+
+    assert load_arxiv_watermark("llm", path) == "2401.00003"
+    assert load_arxiv_watermark("vision", path) == "2401.00009"
+
+
+def test_search_stops_at_the_last_seen_id(monkeypatch):
+    client = FakeArxiv(results=[arxiv_result(i) for i in ("2401.00003v1", "2401.00002v2", "2401.00001v1")])
+    monkeypatch.setattr(arxiv_utils, "get_arxiv_clients", lambda: (client, client))
+    papers = list(iter_arxiv_as_paper("llm", 10, last_seen_id="2401.00002"))
+
+    assert [p.arxiv_id for p in papers] == ["2401.00003"]
+    # Stopped paging rather than reading to the end
+    assert client.yielded == 2
+
+
+def test_search_stops_before_the_newest_known_paper_less_the_lookback(monkeypatch):
+    results = [
+        arxiv_result(f"2401.0000{day}", published=datetime(2024, 1, day, tzinfo=timezone.utc)) for day in (9, 6, 4, 1)
+    ]
+    client = FakeArxiv(results=results)
+    monkeypatch.setattr(arxiv_utils, "get_arxiv_clients", lambda: (client, client))
+    papers = list(iter_arxiv_as_paper("llm", 10, since=datetime(2024, 1, 8, tzinfo=timezone.utc)))
+
+    assert [p.arxiv_id for p in papers] == ["2401.00009", "2401.00006"]
+
+
+def test_watermarks_only_move_for_fully_written_searches(tmp_path):
+    path = str(tmp_path / "watermark.json")
+    save_arxiv_watermark("failed", "2401.00001", path)
+    searches = {"written": _search("2401.00005", "2401.00004"), "failed": _search("2401.00009"), "empty": _search()}
+    paperstack.save_watermarks(searches, {"failed"}, path)
+
+    assert load_arxiv_watermark("written", path) == "2401.00005"
+    assert load_arxiv_watermark("failed", path) == "2401.00001"
+    assert load_arxiv_watermark("empty", path) is None
+
+
+def test_searches_are_only_shared_by_identical_queries():
+    started: list[str] = []
+
+    def start(query: str):
+        def search():
+            started.append(query)
+            return iter_list([Paper(url="https://arxiv.org/abs/2401.00001")])
+
+        return search
+
+    async def run() -> list[list[Paper]]:
+        searches: dict = {}
+        queries = ["ti:injection", "ti:injection", "abs:injection"]
+        sources = [paperstack.shared_search(searches, query, start(query)) for query in queries]
+        return list(await asyncio.gather(*[_collect(source.subscribe()) for source in sources]))
+
+    results = asyncio.run(run())
+
+    # Overlapping but different queries each search, and each finds the paper
+    assert started == ["ti:injection", "abs:injection"]
+    assert all(len(papers) == 1 for papers in results)